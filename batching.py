@@ -0,0 +1,160 @@
+"""
+Cross-job micro-batching for Whisper decoding.
+
+`model.transcribe(audio, batch_size=16)` only batches the speech chunks of a
+single file, so a 20 second clip decodes as a batch of one. When several jobs
+run in the same worker process (threads pool), the TranscriptionBatcher pools
+the VAD chunks of all in-flight jobs and decodes them together in shared
+batches, then routes each decoded chunk back to the job it came from.
+"""
+
+import queue
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from whisperx.audio import SAMPLE_RATE
+from config import Config
+from transcription import (
+    ProgressCallback, SegmentCallback, detect_speech_chunks, decoding_language, resolve_language, chunk_text
+)
+
+
+class _BatchJob:
+    """Speech chunks of one audio file waiting to be decoded"""
+
+    def __init__(self, audio, chunks: List[Dict[str, Any]], language: str):
+        self.audio = audio
+        self.chunks = chunks
+        self.language = language
+        self.texts: List[Optional[str]] = [None] * len(chunks)
+        self.next_chunk = 0  # Index of the next chunk to hand out to a batch
+        self.completed = 0
+        self.enqueued_at = time.monotonic()
+        # Events for the job's own thread: ("chunk", index), ("done", None) or ("error", exc)
+        self.events: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+
+    @property
+    def has_pending(self) -> bool:
+        return self.next_chunk < len(self.chunks)
+
+    def complete(self, idx: int, text: str) -> None:
+        self.texts[idx] = text
+        self.completed += 1
+        self.events.put(("chunk", idx))
+        if self.completed == len(self.chunks):
+            self.events.put(("done", None))
+
+    def segment(self, idx: int) -> Dict[str, Any]:
+        chunk = self.chunks[idx]
+        return {"text": self.texts[idx], "start": round(chunk["start"], 3), "end": round(chunk["end"], 3)}
+
+    def segments(self) -> List[Dict[str, Any]]:
+        return [self.segment(idx) for idx in range(len(self.chunks))]
+
+
+class TranscriptionBatcher:
+    """Schedule speech chunks from concurrent jobs into shared decode batches.
+
+    A single scheduler thread owns decoding. It waits up to `max_wait` seconds
+    for a batch to fill, then takes chunks round-robin from the jobs sharing
+    the oldest job's language, so short clips are not stuck behind a long
+    recording. `model_lock` serializes all other use of the shared model.
+    """
+
+    def __init__(self, model, model_lock: threading.Lock,
+                 batch_size: int = Config.TRANSCRIBE_BATCH_SIZE,
+                 max_wait: float = Config.TRANSCRIBE_BATCH_MAX_WAIT):
+        self.model = model
+        self.model_lock = model_lock
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._jobs: List[_BatchJob] = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="transcription-batcher", daemon=True)
+        self._thread.start()
+
+    def transcribe(self, audio, language: Optional[str] = None,
+                   on_progress: ProgressCallback = None, on_segment: SegmentCallback = None) -> Dict[str, Any]:
+        """Transcribe audio through the shared batches; blocks the calling job until done"""
+        with self.model_lock:
+            chunks = detect_speech_chunks(self.model, audio)
+            language = resolve_language(self.model, audio, language)
+
+        job = _BatchJob(audio, chunks, language)
+        if not chunks:
+            return {"segments": [], "language": language}
+
+        with self._cond:
+            self._jobs.append(job)
+            self._cond.notify()
+
+        # Callbacks run on the job's own thread (Celery task state is per thread)
+        while True:
+            kind, value = job.events.get()
+            if kind == "chunk":
+                if on_segment:
+                    on_segment(job.segment(value))
+                if on_progress:
+                    on_progress(job.chunks[value]["end"])
+            elif kind == "done":
+                return {"segments": job.segments(), "language": language}
+            else:
+                raise value
+
+    def _pending_chunks(self) -> int:
+        return sum(len(job.chunks) - job.next_chunk for job in self._jobs)
+
+    def _take_batch(self) -> Tuple[str, List[Tuple[_BatchJob, int]]]:
+        """Take up to batch_size chunks round-robin from jobs with the oldest job's language"""
+        language = self._jobs[0].language
+        candidates = [job for job in self._jobs if job.language == language]
+        batch = []
+        while len(batch) < self.batch_size and candidates:
+            for job in list(candidates):
+                if len(batch) >= self.batch_size:
+                    break
+                batch.append((job, job.next_chunk))
+                job.next_chunk += 1
+                if not job.has_pending:
+                    candidates.remove(job)
+        # Fully dispatched jobs leave the queue; they are completed by _decode
+        self._jobs = [job for job in self._jobs if job.has_pending]
+        return language, batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+                # Give other jobs a moment to contribute chunks before decoding a partial batch
+                deadline = self._jobs[0].enqueued_at + self.max_wait
+                while self._pending_chunks() < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                language, batch = self._take_batch()
+            self._decode(language, batch)
+
+    def _decode(self, language: str, batch: List[Tuple[_BatchJob, int]]) -> None:
+        inputs = []
+        for job, idx in batch:
+            f1 = int(job.chunks[idx]["start"] * SAMPLE_RATE)
+            f2 = int(job.chunks[idx]["end"] * SAMPLE_RATE)
+            inputs.append({"inputs": job.audio[f1:f2]})
+
+        try:
+            with self.model_lock, decoding_language(self.model, language):
+                outputs = self.model(inputs, batch_size=self.batch_size, num_workers=0)
+        except Exception as e:
+            print(f"❌ Batched transcription failed: {e}")
+            failed = {id(job): job for job, _ in batch}
+            with self._cond:
+                self._jobs = [job for job in self._jobs if id(job) not in failed]
+            for job in failed.values():
+                job.events.put(("error", e))
+            return
+
+        for (job, idx), out in zip(batch, outputs):
+            job.complete(idx, chunk_text(out))
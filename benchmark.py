@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline benchmark.
+
+Runs the worker pipeline (decode, transcribe, align, summarize) on
+sample/jfk.mp3 looped to fixed lengths (1 minute, 10 minutes, 1 hour by
+default) for each combination of Whisper model size and GGUF model, and
+reports per-stage wall/CPU time, the real-time factor (processing time /
+audio duration, model loading excluded), peak memory and summarization
+tokens per second.
+
+Every case runs in a fresh process, so peak RSS and model loading are not
+skewed by earlier cases. Runs are CPU-only and offline by default: models must
+already be in the local caches (run once with --allow-download to fetch them).
+
+Results are written as JSON to benchmarks/results/ and compared against
+benchmarks/baseline.json when it exists; regressions beyond --tolerance are
+listed and make the script exit with status 1.
+
+Usage:
+  python benchmark.py                                   # configured models, 1m/10m/1h
+  python benchmark.py --quick                           # 1 minute only
+  python benchmark.py --whisper tiny,base --llm gemma3-1b,gemma3-12b
+  python benchmark.py --save-baseline                   # record the run as the new baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+BENCHMARK_DIR = "benchmarks"
+AUDIO_DIR = os.path.join(BENCHMARK_DIR, "audio")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+SAMPLE_PATH = os.path.join("sample", "jfk.mp3")
+DEFAULT_DURATIONS = [60, 600, 3600]
+
+# Metrics compared against the baseline: (name, True if higher is better)
+COMPARED_METRICS = [
+    ("realtime_factor", False),
+    ("peak_rss", False),
+    ("summary_tokens_per_second", True),
+]
+# Stage timings below this many seconds of difference are noise, whatever the ratio
+MIN_STAGE_DELTA = 0.5
+
+
+def prepare_audio(seconds: int) -> str:
+    """sample/jfk.mp3 looped to exactly `seconds` (generated once, then reused)"""
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    path = os.path.join(AUDIO_DIR, f"jfk_{seconds}s.mp3")
+    if not os.path.exists(path):
+        tmp_path = path + ".tmp.mp3"
+        subprocess.run(
+            ["ffmpeg", "-stream_loop", "-1", "-i", SAMPLE_PATH, "-t", str(seconds),
+             "-c:a", "libmp3lame", "-b:a", "64k", "-y", tmp_path],
+            check=True, capture_output=True,
+        )
+        os.replace(tmp_path, path)
+    return path
+
+
+def _llm_path(llm: str) -> str:
+    from config import Config
+    if llm in Config.AVAILABLE_LLAMA_MODELS:
+        return Config.AVAILABLE_LLAMA_MODELS[llm]["path"]
+    return llm
+
+
+class _UsageRecorder:
+    """Wraps the loaded Llama model to keep the token usage of the last completion"""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.usage: Dict[str, int] = {}
+
+    def __call__(self, *args, **kwargs):
+        response = self.llm(*args, **kwargs)
+        if isinstance(response, dict):
+            self.usage = response.get("usage") or {}
+        return response
+
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one benchmark case in this process, mirroring the stages of tasks.transcribe_and_summarize"""
+    from config import Config
+    if case["threads"]:
+        import torch
+        torch.set_num_threads(case["threads"])
+    import whisperx
+    import tasks
+    from metrics import JobTimings
+    from transcription import transcribe_with_progress, align_with_progress
+
+    llm_name = case["llm"]
+    llm_path = _llm_path(llm_name) if llm_name else None
+    timings = JobTimings()
+
+    with timings.stage("load_models"):
+        # The worker's compute type for CPU; set here so a visible GPU is never picked up
+        compute_type = "float16" if case["device"] == "cuda" else "int8"
+        threads = {"threads": case["threads"]} if case["threads"] else {}
+        model = whisperx.load_model(case["whisper"], case["device"], compute_type=compute_type, **threads)
+        tasks.whisper_model = model
+        recorder = None
+        if llm_path:
+            if not os.path.exists(llm_path):
+                raise FileNotFoundError(f"GGUF model not found: {llm_path}")
+            # Loaded with the worker's settings, only the model file changes
+            Config.LLAMA_MODEL_PATH = llm_path
+            llm = tasks.load_llama_model()
+            if llm is None:
+                raise RuntimeError(f"Could not load {llm_path}")
+            if hasattr(llm, "set_seed"):
+                llm.set_seed(0)
+            # generate_summary() picks up the already loaded model through load_llama_model()
+            recorder = tasks.llm_model = _UsageRecorder(llm)
+
+    with timings.stage("load_audio"):
+        audio = whisperx.load_audio(case["audio_path"])
+    audio_duration = len(audio) / 16000
+
+    with timings.stage("transcribe"):
+        result = transcribe_with_progress(model, audio, batch_size=Config.TRANSCRIBE_BATCH_SIZE, language="en")
+
+    with timings.stage("align"):
+        model_a, metadata = tasks.load_align_model("en", model.device)
+        result["segments"] = align_with_progress(
+            result["segments"], model_a, metadata, audio, str(model.device)
+        )["segments"]
+
+    full_text = " ".join(segment["text"] for segment in result["segments"])
+    summary_tokens = None
+    if recorder is not None:
+        with timings.stage("summarize"):
+            tasks.generate_summary(full_text, "medium")
+        summary_tokens = recorder.usage.get("completion_tokens")
+
+    breakdown = timings.as_dict(audio_duration)
+    processing = sum(entry["wall"] for name, entry in breakdown["stages"].items() if name != "load_models")
+    summarize_wall = breakdown["stages"].get("summarize", {}).get("wall")
+    return {
+        "whisper": case["whisper"],
+        "llm": llm_name,
+        "duration": case["duration"],
+        "audio_duration": round(audio_duration, 3),
+        "segments": len(result["segments"]),
+        "stages": breakdown["stages"],
+        "processing_seconds": round(processing, 3),
+        "realtime_factor": round(processing / audio_duration, 4),
+        "peak_rss": breakdown["peak_rss"],
+        "summary_tokens": summary_tokens,
+        "summary_prompt_tokens": recorder.usage.get("prompt_tokens") if recorder else None,
+        "summary_tokens_per_second": (
+            round(summary_tokens / summarize_wall, 2) if summary_tokens and summarize_wall else None
+        ),
+    }
+
+
+def _run_in_subprocess(case: Dict[str, Any], env: Dict[str, str]) -> Dict[str, Any]:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output_path = f.name
+    try:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case), "--case-output", output_path],
+            env=env,
+        )
+        if process.returncode != 0:
+            return {**case, "error": f"case exited with status {process.returncode}"}
+        with open(output_path, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        os.remove(output_path)
+
+
+def _environment(args) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    versions = {}
+    for package in ("whisperx", "faster_whisper", "ctranslate2", "torch", "llama_cpp"):
+        try:
+            from importlib.metadata import version
+            versions[package] = version(package.replace("_", "-"))
+        except Exception:
+            versions[package] = None
+    return {
+        "machine": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "device": args.device,
+        "threads": args.threads,
+        "commit": commit,
+        "packages": versions,
+    }
+
+
+def _case_key(case: Dict[str, Any]):
+    return case["whisper"], case["llm"], case["duration"]
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of `results` against `baseline` beyond `tolerance` (a fraction)"""
+    regressions = []
+    baseline_cases = {_case_key(case): case for case in baseline["cases"] if "error" not in case}
+    for case in results["cases"]:
+        old = baseline_cases.get(_case_key(case))
+        if old is None or "error" in case:
+            continue
+        label = f"whisper={case['whisper']} llm={case['llm']} {case['duration']}s"
+        for metric, higher_is_better in COMPARED_METRICS:
+            new_value, old_value = case.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{label}: {metric} {old_value} -> {new_value} ({change:+.0%})")
+        for stage, entry in case["stages"].items():
+            old_wall = old["stages"].get(stage, {}).get("wall")
+            if not old_wall:
+                continue
+            delta = entry["wall"] - old_wall
+            if delta > MIN_STAGE_DELTA and delta / old_wall > tolerance:
+                regressions.append(f"{label}: {stage} {old_wall}s -> {entry['wall']}s ({delta / old_wall:+.0%})")
+    return regressions
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    print()
+    print(f"{'whisper':<10} {'llm':<14} {'audio':>7} {'rtf':>8} {'peak MB':>8} {'tok/s':>7}  stages (s)")
+    for case in results["cases"]:
+        if "error" in case:
+            print(f"{case['whisper']:<10} {str(case['llm']):<14} {case['duration']:>6}s  ❌ {case['error']}")
+            continue
+        stages = ", ".join(f"{name} {entry['wall']}" for name, entry in case["stages"].items())
+        peak = f"{case['peak_rss'] / 1024 ** 2:.0f}" if case["peak_rss"] else "-"
+        print(f"{case['whisper']:<10} {str(case['llm']):<14} {case['duration']:>6}s {case['realtime_factor']:>8} "
+              f"{peak:>8} {case['summary_tokens_per_second'] or '-':>7}  {stages}")
+
+
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Benchmark the transcription pipeline")
+    parser.add_argument("--whisper", default=Config.WHISPER_MODEL, help="Comma-separated Whisper model sizes")
+    parser.add_argument("--llm", default=None,
+                        help="Comma-separated GGUF models (names from config.AVAILABLE_LLAMA_MODELS or paths); "
+                             "'none' skips summarization. Default: the configured model")
+    parser.add_argument("--durations", default=",".join(map(str, DEFAULT_DURATIONS)),
+                        help="Comma-separated audio lengths in seconds")
+    parser.add_argument("--quick", action="store_true", help="Only the 1 minute case")
+    parser.add_argument("--device", default="cpu", choices=["cpu", "cuda"])
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads for Whisper/torch (0: library default)")
+    parser.add_argument("--allow-download", action="store_true", help="Let model libraries fetch missing models")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown before flagging (fraction)")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--case-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        result = run_case(json.loads(args.run_case))
+        with open(args.case_output, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    if args.llm is None:
+        configured = [name for name, model in Config.AVAILABLE_LLAMA_MODELS.items()
+                      if model["path"] == Config.LLAMA_MODEL_PATH]
+        llm_names = configured[:1] or [Config.LLAMA_MODEL_PATH]
+    elif args.llm.lower() == "none":
+        llm_names = [None]
+    else:
+        llm_names = [name.strip() for name in args.llm.split(",") if name.strip()]
+    durations = [60] if args.quick else [int(value) for value in args.durations.split(",")]
+
+    env = dict(os.environ)
+    if args.device == "cpu":
+        env["CUDA_VISIBLE_DEVICES"] = ""
+    if not args.allow_download:
+        env["HF_HUB_OFFLINE"] = "1"
+        env["TRANSFORMERS_OFFLINE"] = "1"
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "environment": _environment(args),
+        "cases": [],
+    }
+    for seconds in durations:
+        audio_path = prepare_audio(seconds)
+        for whisper_size in [size.strip() for size in args.whisper.split(",") if size.strip()]:
+            for llm in llm_names:
+                case = {"whisper": whisper_size, "llm": llm, "duration": seconds, "audio_path": audio_path,
+                        "device": args.device, "threads": args.threads}
+                print(f"▶️  whisper={whisper_size} llm={llm} audio={seconds}s")
+                start = time.time()
+                results["cases"].append(_run_in_subprocess(case, env))
+                print(f"   done in {time.time() - start:.1f}s")
+
+    print_report(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📄 Results written to {output}")
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"📌 Saved as baseline: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["environment"].get("machine") != results["environment"]["machine"]:
+            print(f"⚠️  Baseline was recorded on {baseline['environment'].get('machine')} - timings may not compare")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  - {line}")
+            status = 1
+        else:
+            print(f"✅ No regressions against {args.baseline}")
+    if any("error" in case for case in results["cases"]):
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
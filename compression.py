@@ -0,0 +1,176 @@
+"""
+Negotiated response compression.
+
+CompressionMiddleware compresses JSON and text responses on the fly (brotli
+when the client accepts it and the module is installed, otherwise gzip).
+Cached export files get precompressed variants next to them instead, so a
+download is compressed once per result version rather than once per request.
+The variants are written off the request path (exports.ExportRenderer's
+process pool); until they exist downloads are compressed on the fly.
+"""
+
+import gzip
+import os
+import shutil
+import uuid
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/x-subrip")
+
+
+def is_compressible(content_type: str) -> bool:
+    # Event streams must reach the client immediately, so they are never buffered by a compressor
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("text/event-stream")
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header (None for identity)"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+    candidates = [
+        encoding for encoding in ENCODINGS
+        if weights.get(encoding, weights.get("*", 0.0)) > 0
+    ]
+    if not candidates:
+        return None
+    # Highest q-value wins; ties go to the server's preference order
+    return max(candidates, key=lambda encoding: (weights.get(encoding, weights.get("*", 0.0)), -ENCODINGS.index(encoding)))
+
+
+class _Compressor:
+    """Incremental compressor that flushes after every chunk so streamed responses stay incremental"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=Config.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(Config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Compress JSON and text responses above `minimum_size` bytes.
+
+    Responses that already carry a Content-Encoding (precompressed files),
+    partial content (Range) and non-text types such as PDF pass through unchanged.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = Config.COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        start_message: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (message["status"] in (200, 203) and is_compressible(headers.get("content-type", ""))
+                        and "content-encoding" not in headers and "content-range" not in headers):
+                    # Hold the start message until the first body chunk shows whether compression pays off
+                    start_message = message
+                    MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if encoding is None or (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                del headers["Content-Length"]
+                # Strong validators name a specific representation
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                body = compressor.compress(body, final=not more_body)
+                if not more_body:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                start_message = None
+            else:
+                body = compressor.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def compressed_variant(path: str, encoding: str) -> Optional[str]:
+    """Path of the precompressed copy of a cached file, or None if it has not been written yet"""
+    variant = path + ENCODING_SUFFIXES[encoding]
+    return variant if os.path.exists(variant) else None
+
+
+def write_compressed_variants(path: str) -> None:
+    """Write the missing precompressed copies of a cached file (slow - maximum compression)"""
+    for encoding in ENCODINGS:
+        variant = path + ENCODING_SUFFIXES[encoding]
+        if os.path.exists(variant):
+            continue
+        # Concurrent writers each write their own temp file
+        tmp_path = f"{variant}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+                if encoding == "br":
+                    compressor = brotli.Compressor(quality=Config.COMPRESSION_BROTLI_STATIC_QUALITY)
+                    while chunk := src.read(1024 * 1024):
+                        dst.write(compressor.process(chunk))
+                    dst.write(compressor.finish())
+                else:
+                    with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=9, mtime=0) as gz:
+                        shutil.copyfileobj(src, gz, 1024 * 1024)
+            os.replace(tmp_path, variant)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -7,18 +7,48 @@ load_dotenv()
 class Config:
     # API Security
     API_KEY = os.getenv("NURGAVOICE_API_KEY", "nurgavoice-demo-key-2025")  # Change default for production!
+    # Admin key for operator-only features (job profiling); admin features are off while it is unset
+    ADMIN_API_KEY = os.getenv("NURGAVOICE_ADMIN_API_KEY")
     
     # File upload settings
     MAX_FILE_SIZE = 512 * 1024 * 1024  # 512MB - reduced for demo safety
     ALLOWED_EXTENSIONS = {'.mp3', '.wav', '.mp4', '.avi', '.m4a', '.flac', '.ogg'}
     UPLOAD_DIR = "uploads"
     RESULTS_DIR = "results"
+    EXPORTS_DIR = os.path.join(RESULTS_DIR, "exports")  # Cached TXT/MD/PDF renders
+    PROFILES_DIR = os.path.join(RESULTS_DIR, "profiles")  # Profiling artifacts of profiled jobs
+    
+    # Storage backend for uploads, results and exports: "local" (the directories above) or "s3"
+    # (an S3-compatible bucket, so the API and workers can run on separate machines; the local
+    # results directory then caches what the API has read). S3 credentials come from AWS_* variables.
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+    S3_BUCKET = os.getenv("S3_BUCKET", "nurgavoice")
+    S3_PREFIX = os.getenv("S3_PREFIX", "")
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None  # e.g. http://minio:9000
+    S3_REGION = os.getenv("S3_REGION") or None
+    STORAGE_PART_SIZE = 8 * 1024 * 1024  # Multipart upload part size (S3 minimum is 5 MB)
+    STORAGE_CHUNK_SIZE = 1024 * 1024
+    # Redirect downloads to pre-signed bucket URLs instead of sending them through the API
+    STORAGE_PRESIGNED_DOWNLOADS = os.getenv("STORAGE_PRESIGNED_DOWNLOADS", "false").lower() in ("true", "1", "yes", "on")
+    STORAGE_PRESIGNED_EXPIRES = 3600  # Seconds
     
     # File cleanup settings
     DELETE_UPLOADED_FILES_AFTER_PROCESSING = True  # Set to False to keep uploaded files
     # Note: Keeping uploaded files may be useful for debugging, reprocessing, or audit purposes
     # but will consume more disk space over time
     
+    # Retention and disk quotas, enforced periodically by the janitor task (0 disables a limit)
+    JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL", "3600"))  # Seconds between runs
+    RESULT_TTL = float(os.getenv("RESULT_TTL_DAYS", "30")) * 86400  # Since the result was last read
+    EXPORT_TTL = float(os.getenv("EXPORT_TTL_DAYS", "7")) * 86400  # Cached downloads, since last read
+    UPLOAD_TTL = float(os.getenv("UPLOAD_TTL_HOURS", "24")) * 3600  # Uploads kept after processing
+    RESULTS_MAX_BYTES = int(float(os.getenv("RESULTS_MAX_GB", "0")) * 1024 ** 3)  # Results and cached exports
+    UPLOADS_MAX_BYTES = int(float(os.getenv("UPLOADS_MAX_GB", "0")) * 1024 ** 3)
+    JANITOR_ACTIVE_TASK_GRACE = 6 * 3600  # Uploads without a result younger than this may belong to a queued task
+    JANITOR_TEMP_MAX_AGE = 3600  # Unfinished *.tmp writes older than this are orphans
+    RESULT_ACCESS_RESOLUTION = 3600  # Last access of a result is recorded at most this often
+    JANITOR_STATS_KEY = "janitor:stats"
+    
     # AI Models
     WHISPER_MODEL = "base"  # options: tiny, base, small, medium, large
     
@@ -44,13 +74,116 @@ class Config:
         }
     }
     
+    # Progress reporting
+    PROGRESS_UPDATE_INTERVAL = 2.0  # Minimum seconds between fine-grained progress writes to Redis
+    ALIGN_PROGRESS_GROUP_SIZE = 20  # Segments aligned per call between progress updates
+
+    # Stage timing metrics, aggregated in Redis by workers and API processes and served on /metrics
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("true", "1", "yes", "on")
+    METRICS_KEY = "nurgavoice:metrics"
+    METRICS_RSS_SAMPLE_INTERVAL = 0.1  # Seconds between memory samples while a job stage runs
+
+    # Job profiling (cProfile, stack sampling and tracemalloc), on admin request at upload or for a
+    # random fraction of jobs. Profiling slows the job down noticeably - keep the sample rate low.
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_SAMPLE_INTERVAL = 0.01  # Seconds between stack samples
+    # Allocation tracking is the costliest part (Python-heavy code runs several times slower under it)
+    PROFILE_ALLOCATIONS = os.getenv("PROFILE_ALLOCATIONS", "true").lower() in ("true", "1", "yes", "on")
+    PROFILE_TRACEMALLOC_FRAMES = 1  # Stack depth recorded per allocation (the report groups by line)
+    PROFILE_TOP_ENTRIES = 50  # Functions and allocation sites listed in the text reports
+
     # Redis settings
     REDIS_URL = "redis://localhost:6379/0"
     
+    # Rate limits per API key (or client IP without one), shared by all API processes through Redis.
+    # Each budget is (burst capacity, tokens refilled per second).
+    RATE_LIMITS = {
+        "upload": (int(os.getenv("RATE_LIMIT_UPLOAD_BURST", "3")),
+                   float(os.getenv("RATE_LIMIT_UPLOADS_PER_MINUTE", "3")) / 60),
+        "read": (int(os.getenv("RATE_LIMIT_READ_BURST", "120")),
+                 float(os.getenv("RATE_LIMIT_READS_PER_SECOND", "2"))),
+    }
+    RATE_LIMIT_KEY_PREFIX = "nurgavoice:ratelimit:"
+    
     # Celery settings
     CELERY_BROKER_URL = REDIS_URL
     CELERY_RESULT_BACKEND = REDIS_URL
     
+    # Redis pub/sub channel prefix for task progress events
+    EVENTS_CHANNEL_PREFIX = "nurgavoice:events:"
+    # Per-task event streams kept for Server-Sent Events resume (Last-Event-ID)
+    EVENTS_STREAM_PREFIX = "nurgavoice:stream:"
+    EVENTS_STREAM_MAXLEN = 500
+    EVENTS_STREAM_TTL = 24 * 60 * 60  # Seconds
+    SSE_KEEPALIVE_INTERVAL = 15.0  # Seconds between keep-alive comments on idle event streams
+    SSE_RETRY_MS = 3000  # Reconnect delay suggested to EventSource clients
+    
+    # Status endpoint caching and long-polling
+    STATUS_CACHE_TTL = 1.0  # Seconds a status read is shared by concurrent requests
+    STATUS_CACHE_MAX_ENTRIES = 10000
+    STATUS_LONG_POLL_MAX_WAIT = 30.0  # Upper bound for /status?wait=N
+    STATUS_LONG_POLL_RECHECK = 5.0  # Re-read the backend this often while long-polling
+    STATUS_REDIS_MAX_CONNECTIONS = 20  # Async connection pool used for status reads
+    STATUS_DECODE_INLINE_MAX_BYTES = 16 * 1024  # Larger status payloads are decoded in a worker thread
+    
+    # Seconds a single WebSocket may take to accept a message before it is dropped
+    WEBSOCKET_SEND_TIMEOUT = 5.0
+    WEBSOCKET_QUEUE_SIZE = 64  # Messages waiting for one WebSocket; a client further behind is dropped
+    
+    # Export formats rendered in the background when a task finishes (empty to render on first download).
+    # Only PDF is rendered ahead; the text formats are streamed from the stored result and cached as they go.
+    EXPORT_PRERENDER_FORMATS = [fmt for fmt in os.getenv("EXPORT_PRERENDER_FORMATS", "pdf").split(",") if fmt]
+    EXPORT_STREAM_CHUNK_SIZE = 64 * 1024  # Characters per chunk of a streamed export
+    
+    # Response compression (brotli is used when installed, gzip otherwise)
+    COMPRESSION_MIN_SIZE = 1024  # Smaller responses are sent uncompressed
+    COMPRESSION_GZIP_LEVEL = 6  # On-the-fly compression of dynamic responses
+    COMPRESSION_BROTLI_QUALITY = 5
+    COMPRESSION_BROTLI_STATIC_QUALITY = 11  # Precompressed export files are written once per result version
+    
+    # Segment query API
+    RESULT_FILE_CACHE_SIZE = 32  # Memory-mapped results kept open for segment queries
+    SEGMENTS_PAGE_MAX = 1000  # Upper bound for /segments?limit=N
+    
+    # Full-text search over all stored transcripts
+    SEARCH_INDEX_PATH = os.path.join(RESULTS_DIR, "search.db")
+    SEARCH_PAGE_MAX = 100  # Upper bound for /search?limit=N
+    SEARCH_SNIPPET_TOKENS = 12  # Words of context in each hit's snippet
+    # With remote storage, workers list saved results here and every API machine indexes them from the store
+    SEARCH_RESULTS_KEY = "nurgavoice:search:results"  # Sorted set of task IDs by save time
+    SEARCH_SYNC_INTERVAL = float(os.getenv("SEARCH_SYNC_INTERVAL", "10"))  # Seconds between index syncs
+    SEARCH_SYNC_OVERLAP = 300  # Seconds re-checked on each sync, for clock skew between machines
+    # Process pool rendering downloads in the web process
+    EXPORT_RENDER_WORKERS = 2
+    EXPORT_RENDER_MAX_QUEUED = 8  # Renders waiting for a worker before new ones get 503
+    EXPORT_RENDER_TIMEOUT = 120.0  # Seconds
+    
+    # Worker pool mode: "threads" keeps a single copy of the Whisper/LLM models per worker
+    # process, shared by all concurrent tasks (run one worker process per host).
+    # "prefork" loads a separate copy of every model in each child process.
+    CELERY_WORKER_POOL = os.getenv("CELERY_WORKER_POOL", "threads")
+    CELERY_WORKER_CONCURRENCY = int(os.getenv("CELERY_WORKER_CONCURRENCY", "2"))
+    
+    # Whisper decoding batches
+    TRANSCRIBE_BATCH_SIZE = 16
+    # Pool speech chunks of concurrent jobs into shared decode batches (needs the threads pool)
+    TRANSCRIBE_CROSS_JOB_BATCHING = CELERY_WORKER_POOL == "threads"
+    TRANSCRIBE_BATCH_MAX_WAIT = 0.2  # Seconds to wait for other jobs' chunks before decoding a partial batch
+
+    # Job cost model learned from the stage timings of finished jobs (kept in Redis): ETAs at upload and
+    # during processing, queue priority and admission. Each older job's weight decays by ETA_DECAY per newer one.
+    ETA_MODEL_KEY = "nurgavoice:eta:model"
+    ETA_BACKLOG_KEY = "nurgavoice:eta:backlog"  # Predicted cost of queued and running jobs
+    ETA_DECAY = 0.98  # Fits follow roughly the last 50 jobs
+    ETA_MIN_WEIGHT = 2.5  # Decayed job count behind a fit (3 recent jobs) before it replaces coarser fits/defaults
+    ETA_BACKLOG_MAX_AGE = 24 * 3600  # Backlog entries older than this were lost by a crashed worker
+    # Jobs processed at the same time across all workers, to turn the backlog into a queue wait
+    ETA_WORKER_SLOTS = int(os.getenv("ETA_WORKER_SLOTS", str(CELERY_WORKER_CONCURRENCY)))
+    # Queue short jobs ahead of long ones (Celery priorities by predicted cost)
+    ETA_PRIORITY_SCHEDULING = os.getenv("ETA_PRIORITY_SCHEDULING", "true").lower() in ("true", "1", "yes", "on")
+    # Refuse uploads with 503 while the predicted queue wait is longer than this (0 disables)
+    ADMISSION_MAX_QUEUE_WAIT = float(os.getenv("ADMISSION_MAX_QUEUE_MINUTES", "0")) * 60
+    
     # Language support for form selection
     SUPPORTED_LANGUAGES = {
         'auto': 'Auto-detect',
@@ -0,0 +1,367 @@
+"""
+Learned job cost model: ETAs, queue priority and admission.
+
+Every successful job feeds its per-stage wall times (see metrics.JobTimings)
+into small least-squares fits of `stage seconds = a + b * audio seconds`,
+one per stage and per combination of the features that matter to it (upload
+format, Whisper model, LLM model, worker type). Upload size -> audio duration
+is fitted the same way per format, so a job can be costed before its audio
+is decoded. The fits' sufficient statistics live in a Redis hash and are
+updated in place by an atomic Lua script; older jobs' weight decays by
+ETA_DECAY per newer job, so the model follows hardware and model changes.
+
+Predictions fall back from the most specific fit to coarser ones (e.g. the
+same Whisper model on any worker) and finally to rough defaults until a fit
+has about three recent jobs behind it (ETA_MIN_WEIGHT).
+
+The same estimate is used for:
+- the ETA returned at upload (queue wait + processing) and refined by the
+  worker as the job learns its worker type and real audio duration,
+  together with time-based progress (progress.ProgressReporter)
+- the Celery priority of the job: short jobs are not stuck behind long ones
+- admission: uploads are refused with 503 while the predicted queue wait is
+  above ADMISSION_MAX_QUEUE_WAIT
+
+Queued and running jobs are tracked with their predicted cost in a Redis hash
+(the backlog) to estimate the queue wait.
+"""
+
+import json
+import os
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import redis
+from config import Config
+from metrics import JobTimings
+
+# Features each stage's time depends on, most specific fit first; "duration" maps upload size to audio seconds
+STAGE_FEATURES = {
+    "fetch": ("format",),
+    "load_models": ("whisper_model", "worker"),
+    "decode": ("format", "worker"),
+    "load_audio": ("format", "worker"),
+    "transcribe": ("whisper_model", "worker"),
+    "align": ("worker",),
+    "summarize": ("llm_model", "worker"),
+    "save": (),
+}
+TARGET_FEATURES = dict(STAGE_FEATURES, duration=("format",))
+
+# (seconds, seconds per second of audio) until a stage has been fitted - deliberately rough
+DEFAULT_STAGE_COSTS = {
+    "fetch": (0.5, 0.0),
+    "load_models": (5.0, 0.0),
+    "decode": (1.0, 0.02),
+    "load_audio": (0.5, 0.005),
+    "transcribe": (2.0, 0.25),
+    "align": (3.0, 0.1),
+    "summarize": (15.0, 0.005),
+    "save": (0.2, 0.001),
+}
+# Typical bytes per second of audio by upload format, until the format has been fitted
+DEFAULT_BYTES_PER_SECOND = {
+    ".mp3": 16000, ".m4a": 16000, ".ogg": 16000, ".wav": 176400, ".flac": 88200, ".mp4": 250000, ".avi": 250000,
+}
+VIDEO_FORMATS = {".mp4", ".avi"}  # Decoded to audio by ffmpeg first
+MIN_SUMMARY_AUDIO = 30  # Seconds - shorter recordings get no summary (see tasks.py)
+MB = 1024 * 1024  # Upload sizes are fitted in MB to keep the sums well-conditioned
+
+# Predicted processing seconds -> Celery priority (with the Redis broker 0 is served first)
+PRIORITY_STEPS = ((60, 0), (600, 3))
+LONG_JOB_PRIORITY = 6
+
+STAT_FIELDS = ("w", "x", "y", "xx", "xy")  # Decayed sums of weights, x, y, x*x and x*y
+MIN_SPREAD = 0.1  # Relative spread of x needed to fit a slope
+
+# Decay every touched fit and add one (x, y) observation to it, atomically
+RECORD_SCRIPT = """
+local decay = tonumber(ARGV[1])
+for i = 2, #ARGV, 3 do
+    local name = ARGV[i]
+    local x = tonumber(ARGV[i + 1])
+    local y = tonumber(ARGV[i + 2])
+    local fields = {name .. ':w', name .. ':x', name .. ':y', name .. ':xx', name .. ':xy'}
+    local old = redis.call('HMGET', KEYS[1], unpack(fields))
+    local new = {1, x, y, x * x, x * y}
+    for j = 1, 5 do
+        redis.call('HSET', KEYS[1], fields[j], tostring((tonumber(old[j]) or 0) * decay + new[j]))
+    end
+end
+return 1
+"""
+
+
+def job_features(file_name: str, worker: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """Features of a job; the worker type is only known once a worker has loaded its models"""
+    return {
+        "format": os.path.splitext(file_name)[1].lower(),
+        "whisper_model": Config.WHISPER_MODEL,
+        "llm_model": os.path.splitext(os.path.basename(Config.LLAMA_MODEL_PATH))[0],
+        "worker": worker,
+    }
+
+
+def worker_type(device) -> str:
+    """"cuda" or "cpu" from a torch device (or its string)"""
+    return str(device).split(":")[0]
+
+
+def _fit_names(target: str, features: Dict[str, Optional[str]]) -> List[str]:
+    """Fits for a target, most specific first, skipping those that need an unknown feature"""
+    keys = TARGET_FEATURES[target]
+    names: List[str] = []
+    for level in (keys, tuple(key for key in keys if key != "worker"), ()):
+        if any(features.get(key) is None for key in level):
+            continue
+        name = "|".join([target] + [f"{key}={features[key]}" for key in level])
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def _default(target: str, features: Dict[str, Optional[str]], x: float) -> float:
+    if target == "duration":
+        return x * MB / DEFAULT_BYTES_PER_SECOND.get(features.get("format"), 16000)
+    seconds, per_audio_second = DEFAULT_STAGE_COSTS[target]
+    return seconds + per_audio_second * x
+
+
+def _predict_fit(stats: List[float], x: float, default: Callable[[float], float]) -> float:
+    weight, sum_x, sum_y, sum_xx, sum_xy = stats
+    mean_x, mean_y = sum_x / weight, sum_y / weight
+    variance = sum_xx / weight - mean_x ** 2
+    if variance > (MIN_SPREAD * mean_x) ** 2:
+        # Least squares line; a negative slope is noise on a stage that doesn't grow with the input
+        slope = max((sum_xy / weight - mean_x * mean_y) / variance, 0.0)
+        return max(mean_y + slope * (x - mean_x), 0.0)
+    # Inputs of about the same size so far: keep the default's shape, scaled to the observed times
+    expected = default(mean_x)
+    return mean_y * default(x) / expected if expected > 0 else mean_y
+
+
+class CostModel:
+    """Stage time fits loaded from Redis, with defaults for what has not been seen often enough"""
+
+    def __init__(self, stats: Dict[str, List[float]]):
+        self.stats = stats
+
+    def predict(self, target: str, features: Dict[str, Optional[str]], x: float) -> float:
+        def default(value: float) -> float:
+            return _default(target, features, value)
+
+        for name in _fit_names(target, features):
+            stats = self.stats.get(name)
+            if stats is not None and stats[0] >= Config.ETA_MIN_WEIGHT:
+                return _predict_fit(stats, x, default)
+        return default(x)
+
+    def audio_duration(self, features: Dict[str, Optional[str]], size: int) -> float:
+        """Audio seconds expected in an upload of `size` bytes"""
+        return self.predict("duration", features, size / MB)
+
+    def stage_costs(self, features: Dict[str, Optional[str]], audio_seconds: float,
+                    summary: bool = True) -> Dict[str, float]:
+        """Predicted wall seconds of each stage the job will run, in pipeline order"""
+        costs = {}
+        for stage in STAGE_FEATURES:
+            if stage == "decode" and features.get("format") not in VIDEO_FORMATS:
+                continue
+            if stage == "summarize" and not (summary and audio_seconds >= MIN_SUMMARY_AUDIO):
+                continue
+            costs[stage] = self.predict(stage, features, audio_seconds)
+        return costs
+
+
+_redis = None
+_record_script = None
+
+
+def _get_redis():
+    global _redis, _record_script
+    if _redis is None:
+        _redis = redis.Redis.from_url(Config.REDIS_URL)
+        _record_script = _redis.register_script(RECORD_SCRIPT)
+    return _redis
+
+
+def load_cost_model() -> CostModel:
+    """The current fits (only the defaults if Redis is unavailable)"""
+    try:
+        fields = _get_redis().hgetall(Config.ETA_MODEL_KEY)
+    except Exception as e:
+        print(f"Warning: Could not load the ETA model: {e}")
+        fields = {}
+    stats: Dict[str, List[float]] = {}
+    for field, value in fields.items():
+        name, _, stat = field.decode().rpartition(":")
+        if stat in STAT_FIELDS:
+            stats.setdefault(name, [0.0] * len(STAT_FIELDS))[STAT_FIELDS.index(stat)] = float(value)
+    return CostModel(stats)
+
+
+def record_job(features: Dict[str, Optional[str]], stages: Dict[str, Dict], audio_seconds: float, size: int) -> None:
+    """Add a finished job's stage times (JobTimings.stages) to the fits (best-effort)"""
+    if not audio_seconds:
+        return
+    args: List = [Config.ETA_DECAY]
+    for stage, entry in stages.items():
+        if stage in STAGE_FEATURES:
+            for name in _fit_names(stage, features):
+                args += [name, audio_seconds, entry["wall"]]
+    for name in _fit_names("duration", features):
+        args += [name, size / MB, audio_seconds]
+    try:
+        _get_redis()
+        _record_script(keys=[Config.ETA_MODEL_KEY], args=args)
+    except Exception as e:
+        print(f"Warning: Could not update the ETA model: {e}")
+
+
+class JobEstimate:
+    """Predicted stage times of one job, counted down against its JobTimings while it runs.
+
+    Starts from the upload size (audio duration guessed per format) and is
+    refined with refine() as the job learns its worker type and real duration.
+    """
+
+    def __init__(self, model: CostModel, features: Dict[str, Optional[str]], size: int, summary: bool = True,
+                 timings: Optional[JobTimings] = None):
+        self.model = model
+        self.features = dict(features)
+        self.size = size
+        self.summary = summary
+        self.timings = timings
+        self.audio_seconds = 0.0
+        self.audio_known = False
+        self.stages: Dict[str, float] = {}
+        self.refine()
+
+    def refine(self, audio_seconds: Optional[float] = None, **features: str) -> None:
+        """Recompute the stage costs with newly known facts (audio duration, worker type)"""
+        self.features.update(features)
+        if audio_seconds is not None:
+            self.audio_seconds, self.audio_known = audio_seconds, True
+        elif not self.audio_known:
+            self.audio_seconds = self.model.audio_duration(self.features, self.size)
+        self.stages = self.model.stage_costs(self.features, self.audio_seconds, self.summary)
+
+    @property
+    def total(self) -> float:
+        return sum(self.stages.values())
+
+    def current_left(self) -> float:
+        """Predicted time left in the running stage"""
+        current = self.timings.current if self.timings is not None else None
+        if current not in self.stages:
+            return 0.0
+        # An overrunning stage is assumed to need a little longer rather than be done
+        return max(self.stages[current] - self.timings.current_elapsed(), 0.1 * self.stages[current])
+
+    def remaining(self, current_left: Optional[float] = None) -> float:
+        """Seconds until the job is done; `current_left` overrides the running stage's prediction"""
+        if self.timings is None:
+            return self.total
+        left = 0.0
+        for stage, cost in self.stages.items():
+            if stage == self.timings.current:
+                left += self.current_left() if current_left is None else current_left
+            elif stage not in self.timings.stages:
+                left += cost
+        return left
+
+    def progress(self, current_left: Optional[float] = None) -> int:
+        """Share of the job's expected time already spent, as a percentage below 100"""
+        elapsed = self.timings.elapsed()
+        total = elapsed + self.remaining(current_left)
+        return min(int(100 * elapsed / total), 99) if total > 0 else 0
+
+
+# Backlog of queued and running jobs ------------------------------------------
+
+def _backlog_entry(cost: float, started: bool) -> str:
+    return json.dumps({"cost": round(cost, 1), "at": time.time(), "started": started})
+
+
+def add_to_backlog(task_id: str, cost: float) -> None:
+    """Count an enqueued job's predicted cost in the backlog (best-effort)"""
+    try:
+        _get_redis().hset(Config.ETA_BACKLOG_KEY, task_id, _backlog_entry(cost, started=False))
+    except Exception as e:
+        print(f"Warning: Could not add task {task_id} to the backlog: {e}")
+
+
+def start_job(task_id: str, cost: float) -> None:
+    """Mark a job as running with its (refined) predicted cost (best-effort)"""
+    try:
+        _get_redis().hset(Config.ETA_BACKLOG_KEY, task_id, _backlog_entry(cost, started=True))
+    except Exception as e:
+        print(f"Warning: Could not update task {task_id} in the backlog: {e}")
+
+
+def finish_job(task_id: str) -> None:
+    """Remove a finished (or failed, or never enqueued) job from the backlog (best-effort)"""
+    try:
+        _get_redis().hdel(Config.ETA_BACKLOG_KEY, task_id)
+    except Exception as e:
+        print(f"Warning: Could not remove task {task_id} from the backlog: {e}")
+
+
+def backlog_seconds() -> float:
+    """Predicted worker time still needed by queued and running jobs"""
+    now = time.time()
+    total = 0.0
+    stale = []
+    for task_id, value in _get_redis().hgetall(Config.ETA_BACKLOG_KEY).items():
+        entry = json.loads(value)
+        age = now - entry["at"]
+        if age > Config.ETA_BACKLOG_MAX_AGE:
+            stale.append(task_id)  # Lost by a crashed worker
+        elif entry["started"]:
+            total += max(entry["cost"] - age, 0.0)
+        else:
+            total += entry["cost"]
+    if stale:
+        _get_redis().hdel(Config.ETA_BACKLOG_KEY, *stale)
+    return total
+
+
+def scheduling_priority(cost: float) -> Optional[int]:
+    """Celery priority of a job predicted to take `cost` seconds (None with priority scheduling off)"""
+    if not Config.ETA_PRIORITY_SCHEDULING:
+        return None
+    for max_cost, priority in PRIORITY_STEPS:
+        if cost <= max_cost:
+            return priority
+    return LONG_JOB_PRIORITY
+
+
+class JobPlan(NamedTuple):
+    """Cost estimate of an upload, before it is enqueued"""
+    audio_duration: float  # Guessed from the upload size
+    processing: float  # Predicted seconds of worker time
+    queue_wait: float  # Predicted seconds until a worker picks it up
+    priority: Optional[int]
+
+    @property
+    def eta(self) -> float:
+        return self.queue_wait + self.processing
+
+
+def plan_job(file_name: str, size: int, summary: bool = True) -> JobPlan:
+    """Estimate an upload's cost and queue wait (blocking - run in a worker thread)"""
+    estimate = JobEstimate(load_cost_model(), job_features(file_name), size, summary)
+    try:
+        queue_wait = backlog_seconds() / max(Config.ETA_WORKER_SLOTS, 1)
+    except Exception as e:
+        print(f"Warning: Could not read the backlog: {e}")
+        queue_wait = 0.0
+    return JobPlan(estimate.audio_seconds, estimate.total, queue_wait, scheduling_priority(estimate.total))
+
+
+if __name__ == "__main__":
+    # Print the fitted stage times, e.g. to compare worker types or models
+    model = load_cost_model()
+    print(f"{'fit':<60} {'jobs':>6} {'mean x':>10} {'mean s':>10}")
+    for name, (weight, sum_x, sum_y, _, _) in sorted(model.stats.items()):
+        print(f"{name:<60} {weight:6.1f} {sum_x / weight:10.1f} {sum_y / weight:10.2f}")
@@ -0,0 +1,194 @@
+"""
+Task progress events over Redis pub/sub.
+
+Workers publish every progress/completion message to a per-task channel.
+Each web process holds one pattern subscription covering all tasks and fans
+incoming events out to whoever is watching that task, so clients get updates
+as soon as they happen and Redis load follows real events instead of the
+number of connected clients.
+
+Every event is also appended to a short, expiring per-task Redis stream. The
+stream entry ID is the event ID, which lets Server-Sent Events clients resume
+from Last-Event-ID after a reconnect.
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import redis
+import redis.asyncio as aioredis
+from config import Config
+
+FINAL_STATES = ('SUCCESS', 'FAILURE')
+PARTIAL_STATE = 'PARTIAL'  # Newly transcribed segments; not a task state
+
+# Called with (message, event_id)
+EventCallback = Callable[[Dict[str, Any], Optional[str]], Awaitable[None]]
+
+
+def progress_message(info: dict) -> dict:
+    """Build the client-facing message for a task in PROGRESS state"""
+    message = {
+        'state': 'PROGRESS',
+        'step': info.get('step', ''),
+        'progress': info.get('progress', 0)
+    }
+    # Fine-grained transcription/alignment updates also carry position and ETA
+    for key in ('audio_position', 'audio_duration', 'eta_seconds'):
+        if info.get(key) is not None:
+            message[key] = info[key]
+    return message
+
+
+def success_message(result: Any) -> dict:
+    """Build the client-facing message for a finished task"""
+    return {'state': 'SUCCESS', 'result': result}
+
+
+def failure_message(error: Any) -> dict:
+    """Build the client-facing message for a failed task"""
+    return {'state': 'FAILURE', 'error': str(error)}
+
+
+def partial_message(segments: List[dict]) -> dict:
+    """Build the client-facing message carrying newly transcribed segments"""
+    return {'state': PARTIAL_STATE, 'segments': segments}
+
+
+def is_status_message(message: dict) -> bool:
+    """Whether a message describes the task state (as opposed to partial results)"""
+    return message.get('state') != PARTIAL_STATE
+
+
+def channel_name(task_id: str) -> str:
+    return f"{Config.EVENTS_CHANNEL_PREFIX}{task_id}"
+
+
+def stream_name(task_id: str) -> str:
+    return f"{Config.EVENTS_STREAM_PREFIX}{task_id}"
+
+
+def parse_event_id(event_id: str) -> Tuple[int, int]:
+    """Stream entry IDs ("<ms>-<seq>") as comparable tuples"""
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+# Worker side -----------------------------------------------------------------
+
+# Append to the task's stream and publish in one round-trip; the stream entry ID becomes the event ID
+PUBLISH_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'data', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('PUBLISH', KEYS[2], '{"id":"' .. id .. '","message":' .. ARGV[1] .. '}')
+return id
+"""
+
+_publisher = None
+_publish_script = None
+
+
+def publish_event(task_id: str, message: dict) -> None:
+    """Publish a task event (called from worker processes, never raises)"""
+    global _publisher, _publish_script
+    try:
+        if _publisher is None:
+            _publisher = redis.Redis.from_url(Config.REDIS_URL)
+            _publish_script = _publisher.register_script(PUBLISH_SCRIPT)
+        _publish_script(
+            keys=[stream_name(task_id), channel_name(task_id)],
+            args=[json.dumps(message, ensure_ascii=False), Config.EVENTS_STREAM_MAXLEN, Config.EVENTS_STREAM_TTL],
+        )
+    except Exception as e:
+        # Clients still get the state through /status polling
+        print(f"Warning: Could not publish event for task {task_id}: {e}")
+
+
+# Web side --------------------------------------------------------------------
+
+class EventHub:
+    """Single async Redis subscription fanning task events out to local listeners"""
+
+    def __init__(self):
+        self._listeners: Dict[str, Set[EventCallback]] = {}
+        self._listen_task = None
+        self._redis = None
+
+    def start(self) -> None:
+        if self._listen_task is None:
+            self._listen_task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            self._listen_task = None
+
+    def subscribe(self, task_id: str, callback: EventCallback) -> Callable[[], None]:
+        """Register a callback for a task's events; returns an unsubscribe function.
+
+        Callbacks run on the single listener of this process, one after the other:
+        they must hand work off (e.g. to a queue) rather than wait on I/O.
+        """
+        self._listeners.setdefault(task_id, set()).add(callback)
+
+        def unsubscribe():
+            listeners = self._listeners.get(task_id)
+            if listeners is not None:
+                listeners.discard(callback)
+                if not listeners:
+                    del self._listeners[task_id]
+
+        return unsubscribe
+
+    async def dispatch(self, task_id: str, message: dict, event_id: Optional[str] = None) -> None:
+        """Deliver an event to the local listeners of a task"""
+        for callback in list(self._listeners.get(task_id, ())):
+            try:
+                await callback(message, event_id)
+            except Exception as e:
+                print(f"Warning: Event listener for task {task_id} failed: {e}")
+
+    async def replay(self, task_id: str, after_event_id: str) -> List[Tuple[str, dict]]:
+        """Return the task's stored events newer than after_event_id, oldest first"""
+        if self._redis is None:
+            self._redis = aioredis.from_url(Config.REDIS_URL)
+        try:
+            parse_event_id(after_event_id)
+            entries = await self._redis.xrange(stream_name(task_id), min=f"({after_event_id}", max="+")
+        except Exception as e:
+            print(f"Warning: Could not replay events for task {task_id}: {e}")
+            return []
+        return [
+            (entry_id.decode() if isinstance(entry_id, bytes) else entry_id, json.loads(fields[b'data']))
+            for entry_id, fields in entries
+        ]
+
+    async def _listen(self) -> None:
+        prefix = Config.EVENTS_CHANNEL_PREFIX
+        while True:
+            client = aioredis.from_url(Config.REDIS_URL)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{prefix}*")
+                async for item in pubsub.listen():
+                    if item['type'] != 'pmessage':
+                        continue
+                    channel = item['channel'].decode() if isinstance(item['channel'], bytes) else item['channel']
+                    task_id = channel[len(prefix):]
+                    # Skip decoding events nobody in this process is watching
+                    if task_id not in self._listeners:
+                        continue
+                    event = json.loads(item['data'])
+                    await self.dispatch(task_id, event['message'], event['id'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: Event subscription lost ({e}), reconnecting...")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
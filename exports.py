@@ -0,0 +1,552 @@
+"""
+Downloadable exports of a result.
+
+Text formats (TXT, Markdown, SRT, WebVTT, JSONL) are generated segment by
+segment from the stored result and streamed to the client as they are
+produced. The first download writes the stream to the render cache as well,
+so later downloads (and Range requests) are served from the file.
+
+PDF is rendered once per result version. Renders are kept next to the result
+as `exports/<task_id>/<version>.<fmt>`, with precompressed `.gz`/`.br`
+variants of the text formats written by the render pool. The version is derived from the
+stored result file, so re-saving a result (e.g. after re-summarizing) makes
+the old renders unreachable; results_store.save_result also deletes them.
+
+Rendering is CPU-bound (a long transcript's PDF takes seconds of reportlab
+time), so the web process renders through ExportRenderer, a small bounded
+process pool, instead of on the event loop.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Callable, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from config import Config
+from results_store import load_result, open_result_stream, result_version, export_dir, fetch_from_storage, push_to_storage
+from storage import StoredObject, get_storage, storage_key
+from metrics import Stopwatch, record_render, timed_render
+from compression import write_compressed_variants
+
+EXPORT_MEDIA_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'md': 'text/markdown; charset=utf-8',
+    'srt': 'application/x-subrip; charset=utf-8',
+    'vtt': 'text/vtt; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+
+def setup_unicode_fonts():
+    """Setup Unicode fonts for PDF generation"""
+    try:
+        # Try to register DejaVu Sans font which supports Cyrillic
+        # This font is commonly available on Linux systems
+        font_paths = [
+            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+            '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
+            '/System/Library/Fonts/Arial Unicode MS.ttf',  # macOS
+            'C:/Windows/Fonts/arial.ttf',  # Windows
+        ]
+
+        for font_path in font_paths:
+            if os.path.exists(font_path):
+                pdfmetrics.registerFont(TTFont('Unicode', font_path))
+                return True
+
+        # Fallback: use built-in fonts
+        print("Warning: No Unicode font found, using built-in fonts. Cyrillic characters may not display correctly.")
+        return False
+
+    except Exception as e:
+        print(f"Warning: Could not register Unicode font: {e}")
+        return False
+
+def create_unicode_styles():
+    """Create paragraph styles with Unicode font support"""
+    styles = getSampleStyleSheet()
+
+    # Check if Unicode font is available
+    font_available = False
+    try:
+        # Test if our Unicode font was registered
+        pdfmetrics.getFont('Unicode')
+        font_available = True
+    except Exception:
+        pass
+
+    if font_available:
+        # Create custom styles with Unicode font
+        title_style = ParagraphStyle(
+            'UnicodeTitle',
+            parent=styles['Title'],
+            fontName='Unicode',
+            fontSize=18,
+            spaceAfter=12,
+            alignment=TA_CENTER
+        )
+
+        heading_style = ParagraphStyle(
+            'UnicodeHeading1',
+            parent=styles['Heading1'],
+            fontName='Unicode',
+            fontSize=14,
+            spaceAfter=6,
+            spaceBefore=12
+        )
+
+        normal_style = ParagraphStyle(
+            'UnicodeNormal',
+            parent=styles['Normal'],
+            fontName='Unicode',
+            fontSize=10,
+            spaceAfter=6
+        )
+
+        return {
+            'Title': title_style,
+            'Heading1': heading_style,
+            'Normal': normal_style
+        }
+    else:
+        # Use default styles
+        return {
+            'Title': styles['Title'],
+            'Heading1': styles['Heading1'],
+            'Normal': styles['Normal']
+        }
+
+# Setup fonts on import
+setup_unicode_fonts()
+
+
+def escape_markup(text: str) -> str:
+    """Escape characters that reportlab Paragraph markup would interpret"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _timestamp(seconds: float, separator: str) -> str:
+    """Format seconds as HH:MM:SS<separator>mmm (SRT uses ',', WebVTT '.')"""
+    millis = int(round(max(seconds, 0) * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def stream_txt(header: Dict[str, Any], segments: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """Plain text report, produced piece by piece"""
+    metadata = header['metadata']
+    summary_enabled = metadata.get('summary_enabled', True)
+    yield f"TRANSCRIPTION\n{'='*50}\n\n"
+    yield header['transcription']['text'] + "\n\n"
+
+    # Only include summary if it was enabled
+    if summary_enabled:
+        yield f"SUMMARY\n{'='*50}\n\n"
+        yield header['summary'] + "\n\n"
+
+    yield f"METADATA\n{'='*50}\n\n"
+    yield f"File: {metadata['file_name']}\n"
+    yield f"Language: {metadata['language']}\n"
+    yield f"Summary Length: {metadata['summary_length']}\n" if summary_enabled else "Summary: Disabled\n"
+    if metadata.get('duration'):
+        yield f"Duration: {metadata['duration']:.2f} seconds\n"
+
+    # Add timestamps if available
+    for index, segment in enumerate(segments):
+        if index == 0:
+            yield f"\n\nTIMESTAMPED TRANSCRIPTION\n{'='*50}\n\n"
+        yield f"[{segment.get('start', 0):.2f}s - {segment.get('end', 0):.2f}s] {segment.get('text', '')}\n"
+
+
+def stream_md(header: Dict[str, Any], segments: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """Markdown report, produced piece by piece"""
+    metadata = header['metadata']
+    summary_enabled = metadata.get('summary_enabled', True)
+    yield "# Transcription and Summary Report\n\n"
+
+    # Metadata section
+    yield "## Metadata\n\n"
+    yield f"- **File:** {metadata['file_name']}\n"
+    yield f"- **Language:** {metadata['language']}\n"
+    yield f"- **Summary Length:** {metadata['summary_length']}\n" if summary_enabled else "- **Summary:** Disabled\n"
+    if metadata.get('duration'):
+        yield f"- **Duration:** {metadata['duration']:.2f} seconds\n"
+    yield "\n---\n\n"
+
+    # Summary section (conditional)
+    if summary_enabled:
+        yield "## Summary\n\n"
+        yield header['summary'] + "\n\n---\n\n"
+
+    # Transcription section
+    yield "## Full Transcription\n\n"
+    yield header['transcription']['text'] + "\n\n"
+
+    # Timestamped transcription if available
+    for index, segment in enumerate(segments):
+        if index == 0:
+            yield "## Timestamped Transcription\n\n"
+        yield f"**[{segment.get('start', 0):.2f}s - {segment.get('end', 0):.2f}s]** {segment.get('text', '')}\n\n"
+
+
+def stream_srt(header: Dict[str, Any], segments: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """SubRip subtitles, one cue per segment"""
+    for index, segment in enumerate(segments, start=1):
+        start = _timestamp(segment.get('start', 0), ',')
+        end = _timestamp(segment.get('end', 0), ',')
+        yield f"{index}\n{start} --> {end}\n{segment.get('text', '').strip()}\n\n"
+
+
+def stream_vtt(header: Dict[str, Any], segments: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """WebVTT subtitles, one cue per segment"""
+    yield "WEBVTT\n\n"
+    for segment in segments:
+        start = _timestamp(segment.get('start', 0), '.')
+        end = _timestamp(segment.get('end', 0), '.')
+        # "-->" is not allowed inside cue text
+        text = segment.get('text', '').strip().replace('-->', '->')
+        yield f"{start} --> {end}\n{text}\n\n"
+
+
+def stream_jsonl(header: Dict[str, Any], segments: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """One JSON object per segment (with word timings when available)"""
+    for segment in segments:
+        yield json.dumps(segment, ensure_ascii=False) + "\n"
+
+
+# Formats streamed straight from the stored result on their first download
+STREAMED_EXPORTS: Dict[str, Callable[[Dict[str, Any], Iterator[Dict[str, Any]]], Iterator[str]]] = {
+    'txt': stream_txt,
+    'md': stream_md,
+    'srt': stream_srt,
+    'vtt': stream_vtt,
+    'jsonl': stream_jsonl,
+}
+
+
+def open_export_stream(task_id: str, fmt: str, cache: bool = False) -> Optional[Iterator[bytes]]:
+    """Open a streamed export as an iterator of UTF-8 chunks, or None if there is no result.
+
+    With `cache`, the chunks are also written to the render cache; the file is
+    only kept if the stream runs to completion.
+    """
+    version = result_version(task_id)
+    opened = open_result_stream(task_id) if version is not None else None
+    if opened is None:
+        return None
+    header, segments = opened
+    chunks = timed_render(fmt, _buffered(STREAMED_EXPORTS[fmt](header, segments)))
+    return _cached_stream(task_id, version, fmt, chunks) if cache else chunks
+
+
+def _cached_stream(task_id: str, version: str, fmt: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    path = export_path(task_id, version, fmt)
+    os.makedirs(export_dir(task_id), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    complete = False
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp_path, path)
+        complete = True
+        remove_stale_exports(task_id, version)
+        _publish(path)
+    finally:
+        # Client went away mid-download (or the write failed) - drop the partial file
+        if not complete and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _buffered(pieces: Iterable[str], chunk_size: int = Config.EXPORT_STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Group small pieces into chunks of about chunk_size characters"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode('utf-8')
+
+
+def render_pdf(data: Dict[str, Any]) -> bytes:
+    """Render a result as a PDF report with Unicode support"""
+    metadata = data['metadata']
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    story = []
+
+    # Get Unicode-compatible styles
+    custom_styles = create_unicode_styles()
+
+    # Title
+    story.append(Paragraph("Transcription and Summary Report", custom_styles['Title']))
+    story.append(Spacer(1, 12))
+
+    # Metadata
+    story.append(Paragraph("Metadata", custom_styles['Heading1']))
+    story.append(Paragraph(f"<b>File:</b> {metadata['file_name']}", custom_styles['Normal']))
+    story.append(Paragraph(f"<b>Language:</b> {metadata['language']}", custom_styles['Normal']))
+
+    if metadata.get('summary_enabled', True):
+        story.append(Paragraph(f"<b>Summary Length:</b> {metadata['summary_length']}", custom_styles['Normal']))
+    else:
+        story.append(Paragraph("<b>Summary:</b> Disabled", custom_styles['Normal']))
+
+    if metadata.get('duration'):
+        story.append(Paragraph(f"<b>Duration:</b> {metadata['duration']:.2f} seconds", custom_styles['Normal']))
+
+    story.append(Spacer(1, 12))
+
+    # Summary (conditional)
+    if metadata.get('summary_enabled', True):
+        story.append(Paragraph("Summary", custom_styles['Heading1']))
+        story.append(Paragraph(escape_markup(data['summary']), custom_styles['Normal']))
+        story.append(Spacer(1, 12))
+
+    # Transcription
+    story.append(Paragraph("Full Transcription", custom_styles['Heading1']))
+    story.append(Paragraph(escape_markup(data['transcription']['text']), custom_styles['Normal']))
+
+    # Add timestamped transcription if available
+    if data['transcription'].get('segments'):
+        story.append(Spacer(1, 12))
+        story.append(Paragraph("Timestamped Transcription", custom_styles['Heading1']))
+
+        for segment in data['transcription']['segments']:
+            start = segment.get('start', 0)
+            end = segment.get('end', 0)
+            text = escape_markup(segment.get('text', ''))
+            story.append(Paragraph(f"[{start:.2f}s - {end:.2f}s] {text}", custom_styles['Normal']))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+# Formats rendered whole and kept in the render cache
+RENDERERS: Dict[str, Callable[[Dict[str, Any]], bytes]] = {
+    'pdf': render_pdf,
+}
+
+
+def export_path(task_id: str, version: str, fmt: str) -> str:
+    """Path of the cached render of a result version"""
+    return os.path.join(export_dir(task_id), f"{version}.{fmt}")
+
+
+def _is_cached(path: str) -> bool:
+    # With remote storage a render made on another machine is fetched into the local cache
+    return os.path.exists(path) or (not get_storage().is_local and fetch_from_storage(path))
+
+
+def _publish(path: str) -> None:
+    """Share a finished render through remote storage (best-effort, the local copy is already usable)"""
+    try:
+        push_to_storage(path)
+    except Exception as e:
+        print(f"Warning: Could not upload export {path} to storage: {e}")
+
+
+def cached_export(task_id: str, fmt: str) -> Optional[str]:
+    """Path of the render of the current result version, if it is cached"""
+    version = result_version(task_id)
+    if version is None:
+        return None
+    path = export_path(task_id, version, fmt)
+    return path if _is_cached(path) else None
+
+
+def stored_export(task_id: str, fmt: str) -> Optional[Tuple[str, StoredObject]]:
+    """Storage key and stat of the current render if it is in remote storage but not in the local cache"""
+    version = result_version(task_id)
+    if version is None:
+        return None
+    path = export_path(task_id, version, fmt)
+    if os.path.exists(path):
+        return None
+    key = storage_key(path)
+    stored = get_storage().stat(key)
+    return (key, stored) if stored is not None else None
+
+
+def export_download_url(task_id: str, fmt: str, filename: str) -> Optional[str]:
+    """Pre-signed URL of the current render in remote storage, or None if the store does not have it"""
+    version = result_version(task_id)
+    if version is None:
+        return None
+    storage = get_storage()
+    key = storage_key(export_path(task_id, version, fmt))
+    if storage.stat(key) is None:
+        return None
+    return storage.presigned_url(key, filename)
+
+
+def get_export(task_id: str, fmt: str) -> Optional[str]:
+    """Return the path of the rendered export, rendering it if it is not cached.
+
+    Returns None if the task has no stored result.
+    """
+    version = result_version(task_id)
+    if version is None:
+        return None
+    path = export_path(task_id, version, fmt)
+    if _is_cached(path):
+        return path
+
+    if fmt in STREAMED_EXPORTS:
+        # Written chunk by chunk, so memory stays flat for long transcripts
+        chunks = open_export_stream(task_id, fmt, cache=True)
+        if chunks is None:
+            return None
+        for _ in chunks:
+            pass
+        write_compressed_variants(path)
+        return path
+
+    stopwatch = Stopwatch(cpu_clock=time.thread_time)
+    with stopwatch:
+        data = load_result(task_id)
+        if data is None:
+            return None
+        content = RENDERERS[fmt](data)
+    record_render(fmt, stopwatch)
+
+    os.makedirs(export_dir(task_id), exist_ok=True)
+    # Concurrent renders of the same export each write their own temp file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+    remove_stale_exports(task_id, version)
+    _publish(path)
+    return path
+
+
+def remove_stale_exports(task_id: str, version: str) -> None:
+    """Delete renders of older result versions"""
+    directory = export_dir(task_id)
+    for name in os.listdir(directory):
+        if not name.startswith(f"{version}.") and not name.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def prerender_exports(task_id: str, formats: Iterable[str] = Config.EXPORT_PRERENDER_FORMATS) -> None:
+    """Render exports ahead of the first download"""
+    for fmt in formats:
+        try:
+            get_export(task_id, fmt)
+        except Exception as e:
+            print(f"Warning: Could not prerender {fmt} export for task {task_id}: {e}")
+
+
+class RenderQueueFull(Exception):
+    """Too many exports are already being rendered"""
+
+
+class ExportRenderer:
+    """Render exports in a bounded process pool so the API stays responsive.
+
+    At most `max_workers` renders run at once and at most `max_queued` more
+    wait for a worker; beyond that render() raises RenderQueueFull. Concurrent
+    requests for the same export share one render. A render that takes longer
+    than `timeout` raises asyncio.TimeoutError for the caller, but keeps its
+    slot until the worker process finishes, so slow renders cannot pile up.
+    """
+
+    def __init__(self, max_workers: int = Config.EXPORT_RENDER_WORKERS,
+                 max_queued: int = Config.EXPORT_RENDER_MAX_QUEUED,
+                 timeout: float = Config.EXPORT_RENDER_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._compressing: Dict[str, asyncio.Future] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawn clean processes rather than forking the running web server
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def render(self, task_id: str, fmt: str) -> Optional[str]:
+        """Return the path of the rendered export (None if there is no result)"""
+        # The lookup stats the result (and may fetch it from remote storage) - keep it off the event loop
+        path = await asyncio.to_thread(cached_export, task_id, fmt)
+        if path is not None:
+            return path
+
+        key = (task_id, fmt)
+        future = self._inflight.get(key)
+        if future is None:
+            if len(self._inflight) + len(self._compressing) >= self.max_workers + self.max_queued:
+                raise RenderQueueFull()
+            try:
+                future = asyncio.get_running_loop().run_in_executor(self._get_executor(), get_export, task_id, fmt)
+            except BrokenProcessPool:
+                # A worker process died (e.g. out of memory) - start a fresh pool
+                self._executor = None
+                future = asyncio.get_running_loop().run_in_executor(self._get_executor(), get_export, task_id, fmt)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except BrokenProcessPool:
+            self._executor = None
+            raise
+
+    def precompress(self, path: str) -> None:
+        """Write the precompressed variants of a cached export in the background, once per file.
+
+        Best-effort: skipped while the pool is busy, a later download asks again.
+        """
+        if path in self._compressing:
+            return
+        if len(self._inflight) + len(self._compressing) >= self.max_workers + self.max_queued:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._get_executor(), write_compressed_variants, path)
+        except BrokenProcessPool:
+            self._executor = None
+            return
+        self._compressing[path] = future
+
+        def done(_):
+            self._compressing.pop(path, None)
+            if not future.cancelled() and future.exception() is not None:
+                print(f"Warning: Could not precompress export {path}: {future.exception()}")
+
+        future.add_done_callback(done)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
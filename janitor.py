@@ -0,0 +1,245 @@
+"""
+Retention and disk-quota enforcement for uploads, results and export caches.
+
+Run periodically by Celery beat (tasks.run_janitor). Each run:
+
+1. removes orphaned temp files (`*_audio.wav` conversions and `*.tmp` writes
+   left behind by crashed jobs) and export caches without a result,
+2. removes files past their time-to-live, and
+3. evicts least recently used files until each directory is within its quota.
+   For results, cached exports (cheap to re-render) go before the results
+   themselves.
+
+Last access of a result is its atime, which results_store refreshes when the
+result is read, so eviction order follows real use even on noatime mounts.
+Uploads of tasks that may still be queued or running are never touched.
+"""
+
+import os
+import shutil
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import redis
+from config import Config
+from results_store import RESULT_EXTENSION, export_dir, legacy_result_path, result_path
+import search_index
+from profiling import profile_dir
+
+# Uploads and conversions are named "<task_id>_<original name>"
+_TASK_ID_LENGTH = 36
+
+
+def _tree_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class JanitorReport:
+    """What one janitor run removed, by reason"""
+
+    def __init__(self):
+        self.removed: Dict[str, int] = {}
+        self.reclaimed: Dict[str, int] = {}
+        self.errors = 0
+
+    def remove(self, path: str, reason: str) -> int:
+        """Delete a file or directory tree and count it; returns the bytes reclaimed"""
+        size = _tree_size(path)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            print(f"Warning: Janitor could not remove {path}: {e}")
+            self.errors += 1
+            return 0
+        self.removed[reason] = self.removed.get(reason, 0) + 1
+        self.reclaimed[reason] = self.reclaimed.get(reason, 0) + size
+        return size
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "removed_files": sum(self.removed.values()),
+            "reclaimed_bytes": sum(self.reclaimed.values()),
+            "removed_by_reason": self.removed,
+            "reclaimed_bytes_by_reason": self.reclaimed,
+            "errors": self.errors,
+        }
+
+
+def _upload_task_id(name: str) -> Optional[str]:
+    return name[:_TASK_ID_LENGTH] if len(name) > _TASK_ID_LENGTH and name[_TASK_ID_LENGTH] == "_" else None
+
+
+def _upload_in_use(name: str, stat: os.stat_result, now: float) -> bool:
+    """Whether an upload may still belong to a queued or running task"""
+    task_id = _upload_task_id(name)
+    if task_id is not None and os.path.exists(result_path(task_id)):
+        return False  # Finished
+    return now - stat.st_mtime < Config.JANITOR_ACTIVE_TASK_GRACE
+
+
+def _scan(directory: str) -> List[Tuple[str, os.stat_result]]:
+    entries = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return entries
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            entries.append((path, os.stat(path)))
+        except FileNotFoundError:
+            pass
+    return entries
+
+
+def remove_task_result(task_id: str, report: JanitorReport, reason: str) -> None:
+    """Delete a task's stored result, its cached exports, its profile and its search index entry"""
+    for path in (result_path(task_id), legacy_result_path(task_id), export_dir(task_id), profile_dir(task_id)):
+        if os.path.exists(path):
+            report.remove(path, reason)
+    try:
+        search_index.remove_result(task_id)
+    except Exception as e:
+        print(f"Warning: Could not remove task {task_id} from the search index: {e}")
+
+
+def _clean_uploads(report: JanitorReport, now: float) -> None:
+    entries = [
+        (path, stat) for path, stat in _scan(Config.UPLOAD_DIR)
+        if os.path.isfile(path) and not _upload_in_use(os.path.basename(path), stat, now)
+    ]
+    kept = []
+    for path, stat in entries:
+        if path.endswith("_audio.wav"):
+            # Conversion left behind by a job that crashed before its cleanup
+            report.remove(path, "orphan")
+        elif Config.UPLOAD_TTL and now - stat.st_mtime > Config.UPLOAD_TTL:
+            report.remove(path, "ttl")
+        else:
+            kept.append((path, stat))
+
+    if Config.UPLOADS_MAX_BYTES:
+        total = sum(stat.st_size for _, stat in _scan(Config.UPLOAD_DIR))
+        for path, stat in sorted(kept, key=lambda entry: max(entry[1].st_atime, entry[1].st_mtime)):
+            if total <= Config.UPLOADS_MAX_BYTES:
+                break
+            total -= report.remove(path, "quota")
+
+
+def _clean_results(report: JanitorReport, now: float) -> None:
+    # Stored results by task, with their last access
+    results: Dict[str, os.stat_result] = {}
+    for path, stat in _scan(Config.RESULTS_DIR):
+        name = os.path.basename(path)
+        if name.endswith(".tmp"):
+            if now - stat.st_mtime > Config.JANITOR_TEMP_MAX_AGE:
+                report.remove(path, "orphan")
+        elif name.startswith("transcription_") and name.endswith((".txt", ".md", ".pdf")):
+            # Renders written by versions before the export cache
+            report.remove(path, "orphan")
+        elif name.endswith((RESULT_EXTENSION, ".json")) and os.path.isfile(path):
+            results[os.path.splitext(name)[0]] = stat
+
+    for task_id, stat in list(results.items()):
+        if Config.RESULT_TTL and now - stat.st_atime > Config.RESULT_TTL:
+            remove_task_result(task_id, report, "ttl")
+            del results[task_id]
+
+    # Export caches: drop stale temp files, caches without a result and caches past their TTL
+    exports: Dict[str, int] = {}
+    for path, stat in _scan(Config.EXPORTS_DIR):
+        task_id = os.path.basename(path)
+        if task_id not in results:
+            report.remove(path, "orphan")
+            continue
+        for file_path, file_stat in _scan(path):
+            if file_path.endswith(".tmp") and now - file_stat.st_mtime > Config.JANITOR_TEMP_MAX_AGE:
+                report.remove(file_path, "orphan")
+        if Config.EXPORT_TTL and now - results[task_id].st_atime > Config.EXPORT_TTL:
+            report.remove(path, "ttl")
+        else:
+            exports[task_id] = _tree_size(path)
+
+    # Profiles of deleted results, and of failed jobs once they are old enough to have been looked at
+    for path, stat in _scan(Config.PROFILES_DIR):
+        if os.path.basename(path) not in results and now - stat.st_mtime > Config.JANITOR_ACTIVE_TASK_GRACE:
+            report.remove(path, "orphan")
+
+    if not Config.RESULTS_MAX_BYTES:
+        return
+    total = sum(stat.st_size for stat in results.values()) + sum(exports.values())
+    least_recent_first = sorted(results, key=lambda task_id: results[task_id].st_atime)
+    # Cached exports can be rendered again, so they go first
+    for task_id in least_recent_first:
+        if total <= Config.RESULTS_MAX_BYTES:
+            return
+        if task_id in exports:
+            total -= report.remove(export_dir(task_id), "quota")
+            del exports[task_id]
+    for task_id in least_recent_first:
+        if total <= Config.RESULTS_MAX_BYTES:
+            return
+        total -= results[task_id].st_size
+        remove_task_result(task_id, report, "quota")
+
+
+def clean_storage(now: Optional[float] = None) -> Dict[str, Any]:
+    """Apply retention and quotas once and return what was reclaimed"""
+    now = time.time() if now is None else now
+    start = time.time()
+    report = JanitorReport()
+    _clean_uploads(report, now)
+    _clean_results(report, now)
+    summary = report.as_dict()
+    summary["duration"] = round(time.time() - start, 3)
+    summary["uploads_bytes"] = _tree_size(Config.UPLOAD_DIR)
+    summary["results_bytes"] = _tree_size(Config.RESULTS_DIR)
+    return summary
+
+
+def record_janitor_run(summary: Dict[str, Any]) -> None:
+    """Add a run to the janitor counters kept in Redis"""
+    client = redis.Redis.from_url(Config.REDIS_URL)
+    try:
+        pipe = client.pipeline()
+        pipe.hincrby(Config.JANITOR_STATS_KEY, "runs", 1)
+        pipe.hincrby(Config.JANITOR_STATS_KEY, "removed_files", summary["removed_files"])
+        pipe.hincrby(Config.JANITOR_STATS_KEY, "reclaimed_bytes", summary["reclaimed_bytes"])
+        for reason, size in summary["reclaimed_bytes_by_reason"].items():
+            pipe.hincrby(Config.JANITOR_STATS_KEY, f"reclaimed_bytes_{reason}", size)
+        pipe.hset(Config.JANITOR_STATS_KEY, mapping={
+            "last_run": time.time(),
+            "last_reclaimed_bytes": summary["reclaimed_bytes"],
+            "uploads_bytes": summary["uploads_bytes"],
+            "results_bytes": summary["results_bytes"],
+        })
+        pipe.execute()
+    finally:
+        client.close()
+
+
+def janitor_stats() -> Dict[str, float]:
+    """Cumulative janitor counters (empty before the first run)"""
+    client = redis.Redis.from_url(Config.REDIS_URL)
+    try:
+        return {key.decode(): float(value) for key, value in client.hgetall(Config.JANITOR_STATS_KEY).items()}
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    print(clean_storage())
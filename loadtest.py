@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+HTTP/WebSocket load generator and latency SLO check for the API tier.
+
+Drives a running API with concurrent clients of four kinds:
+
+- uploaders: POST /upload, poll /status until the job finishes, download the results
+- pollers: GET /status of known tasks at a fixed interval
+- watchers: subscribe to /ws/{task_id} of running tasks until they finish
+- downloaders: GET /download of finished tasks
+
+Run it against the stub worker (stub_worker.py), which goes through the
+motions of a job without loading any model, so the numbers are API overhead
+only. With --spawn the script starts uvicorn and the stub worker itself (a
+Redis server must be running) with rate limits raised out of the way.
+
+Reports p50/p95/p99 latency, throughput and error rates per request type and
+checks them against latency objectives; any violation exits with status 1.
+
+Usage:
+  python loadtest.py --spawn --duration 60 --uploaders 10 --pollers 200 --watchers 200 --downloaders 20
+  python loadtest.py --url http://localhost:8000 --slo status:p99:100 --slo download:p95:500
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import aiohttp
+from config import Config
+
+FINAL_STATES = ("SUCCESS", "FAILURE")
+DOWNLOAD_FORMATS = ("txt", "srt", "jsonl", "pdf")
+
+# Latency objectives used when no --slo is given: request type -> (percentile, milliseconds)
+DEFAULT_SLOS = {
+    "status": ("p99", 250),
+    "upload": ("p99", 2000),
+    "download": ("p99", 2000),
+    "ws_connect": ("p99", 500),
+}
+MAX_ERROR_RATE = 0.01
+
+# Rate limits for --spawn: high enough to never trigger, still checked (and timed) on every request
+UNLIMITED_RATE_ENV = {
+    "RATE_LIMIT_UPLOAD_BURST": "1000000",
+    "RATE_LIMIT_UPLOADS_PER_MINUTE": "1000000000",
+    "RATE_LIMIT_READ_BURST": "1000000",
+    "RATE_LIMIT_READS_PER_SECOND": "1000000000",
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+class LatencyRecorder:
+    """Latencies, status codes and errors per request type"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.no_response: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[int, int]] = {}
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    def record(self, name: str, seconds: float, status: Optional[int] = None, ok: bool = True) -> None:
+        self.latencies.setdefault(name, []).append(seconds)
+        if status is not None:
+            counts = self.statuses.setdefault(name, {})
+            counts[status] = counts.get(status, 0) + 1
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def error(self, name: str) -> None:
+        """A request that got no response at all (connection error, timeout)"""
+        self.errors[name] = self.errors.get(name, 0) + 1
+        self.no_response[name] = self.no_response.get(name, 0) + 1
+        self.latencies.setdefault(name, [])
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        report = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            errors = self.errors.get(name, 0)
+            # Requests that got no response have no latency sample
+            total = len(values) + self.no_response.get(name, 0)
+            report[name] = {
+                "count": total,
+                "errors": errors,
+                "error_rate": round(errors / total, 4) if total else 0.0,
+                "throughput": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": _ms(percentile(values, 0.50)),
+                "p95_ms": _ms(percentile(values, 0.95)),
+                "p99_ms": _ms(percentile(values, 0.99)),
+                "max_ms": _ms(values[-1] if values else None),
+                "statuses": {str(status): count for status, count in sorted(self.statuses.get(name, {}).items())},
+            }
+        return report
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class LoadTest:
+    def __init__(self, session: aiohttp.ClientSession, args, sample: bytes):
+        self.session = session
+        self.args = args
+        self.sample = sample
+        self.headers = {"X-API-Key": args.api_key}
+        self.recorder = LatencyRecorder()
+        self.deadline = time.monotonic() + args.duration
+        self.running: List[str] = []
+        self.finished: List[str] = []
+
+    def active(self) -> bool:
+        return time.monotonic() < self.deadline
+
+    async def request(self, name: str, method: str, path: str, **kwargs) -> Optional[Tuple[int, bytes]]:
+        """Send a request and time it until the whole body is read; returns (status, body)"""
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, path, headers=self.headers, **kwargs) as response:
+                body = await response.read()
+                self.recorder.record(name, time.perf_counter() - start, response.status, response.status == 200)
+                return response.status, body
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.recorder.error(name)
+            return None
+
+    async def uploader(self) -> None:
+        while self.active():
+            form = aiohttp.FormData()
+            form.add_field("file", self.sample, filename=os.path.basename(self.args.file), content_type="audio/mpeg")
+            form.add_field("enable_summary", "true")
+            job_start = time.perf_counter()
+            response = await self.request("upload", "POST", "/upload", data=form)
+            if response is None or response[0] != 200:
+                await asyncio.sleep(1)
+                continue
+            task_id = json.loads(response[1])["task_id"]
+            self.running.append(task_id)
+            state = await self.follow(task_id)
+            self.running.remove(task_id)
+            if state is not None:
+                # Upload to completion as seen by a polling client
+                self.recorder.record("job", time.perf_counter() - job_start, ok=state == "SUCCESS")
+            if state == "SUCCESS":
+                self.finished.append(task_id)
+                for fmt in self.args.formats:
+                    await self.request("download", "GET", f"/download/{task_id}/{fmt}")
+
+    async def follow(self, task_id: str) -> Optional[str]:
+        """Poll a task until it finishes (or the test ends)"""
+        while self.active():
+            response = await self.request("status", "GET", f"/status/{task_id}")
+            if response is not None and response[0] == 200:
+                state = json.loads(response[1]).get("state")
+                if state in FINAL_STATES:
+                    return state
+            await asyncio.sleep(self.args.poll_interval)
+        return None
+
+    async def poller(self) -> None:
+        # Spread the pollers over the interval instead of firing them in lockstep
+        await asyncio.sleep(random.uniform(0, self.args.poll_interval))
+        while self.active():
+            task_ids = self.running or self.finished
+            if task_ids:
+                await self.request("status", "GET", f"/status/{random.choice(task_ids)}")
+            await asyncio.sleep(self.args.poll_interval)
+
+    async def watcher(self) -> None:
+        while self.active():
+            if not self.running:
+                await asyncio.sleep(0.2)
+                continue
+            task_id = random.choice(self.running)
+            start = time.perf_counter()
+            try:
+                async with self.session.ws_connect(f"/ws/{task_id}", params={"api_key": self.args.api_key}) as ws:
+                    first = True
+                    while self.active():
+                        try:
+                            message = await ws.receive(timeout=max(0.1, self.deadline - time.monotonic()))
+                        except asyncio.TimeoutError:
+                            break
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        if first:
+                            # Connection set up and current state delivered
+                            self.recorder.record("ws_connect", time.perf_counter() - start, 101)
+                            first = False
+                        if json.loads(message.data).get("state") in FINAL_STATES:
+                            self.recorder.record("ws_watch", time.perf_counter() - start)
+                            break
+                    if first:
+                        self.recorder.error("ws_connect")
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.recorder.error("ws_connect")
+                await asyncio.sleep(1)
+
+    async def downloader(self) -> None:
+        while self.active():
+            if not self.finished:
+                await asyncio.sleep(0.2)
+                continue
+            task_id = random.choice(self.finished)
+            fmt = random.choice(self.args.formats)
+            await self.request("download", "GET", f"/download/{task_id}/{fmt}")
+            if self.args.download_interval:
+                await asyncio.sleep(self.args.download_interval)
+
+    async def run(self) -> Dict[str, Dict[str, Any]]:
+        clients = (
+            [self.uploader() for _ in range(self.args.uploaders)]
+            + [self.poller() for _ in range(self.args.pollers)]
+            + [self.watcher() for _ in range(self.args.watchers)]
+            + [self.downloader() for _ in range(self.args.downloaders)]
+        )
+        await asyncio.gather(*clients)
+        self.recorder.finished = time.monotonic()
+        return self.recorder.summary()
+
+
+def parse_slos(specs: List[str]) -> Dict[str, tuple]:
+    """"status:p99:250" -> {"status": ("p99", 250.0)}"""
+    slos = {}
+    for spec in specs:
+        name, quantile, limit = spec.split(":")
+        if quantile not in ("p50", "p95", "p99"):
+            raise ValueError(f"Unknown percentile in SLO {spec!r} (use p50, p95 or p99)")
+        slos[name] = (quantile, float(limit))
+    return slos
+
+
+def check_slos(report: Dict[str, Dict[str, Any]], slos: Dict[str, tuple],
+               max_error_rate: float = MAX_ERROR_RATE) -> List[str]:
+    """Violated objectives, as messages"""
+    violations = []
+    for name, (quantile, limit) in slos.items():
+        value = report.get(name, {}).get(f"{quantile}_ms")
+        if value is not None and value > limit:
+            violations.append(f"{name} {quantile} {value}ms > {limit:g}ms")
+    for name, stats in report.items():
+        if stats["error_rate"] > max_error_rate:
+            violations.append(f"{name} error rate {stats['error_rate']:.2%} > {max_error_rate:.2%}")
+    return violations
+
+
+def print_report(report: Dict[str, Dict[str, Any]]) -> None:
+    print(f"\n{'request':<12} {'count':>7} {'req/s':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, stats in report.items():
+        print(f"{name:<12} {stats['count']:>7} {stats['throughput']:>8} {stats['errors']:>7} "
+              f"{stats['p50_ms'] or '-':>8} {stats['p95_ms'] or '-':>8} {stats['p99_ms'] or '-':>8} "
+              f"{stats['max_ms'] or '-':>8}")
+    limited = sum(int(stats["statuses"].get("429", 0)) for stats in report.values())
+    if limited:
+        print(f"⚠️  {limited} requests were rate limited - raise the RATE_LIMIT_* settings of the API under test")
+
+
+def spawn_services(args) -> List[subprocess.Popen]:
+    """Start uvicorn and the stub worker with rate limits out of the way"""
+    env = {**os.environ, **UNLIMITED_RATE_ENV, "STUB_JOB_SECONDS": str(args.job_seconds)}
+    port = args.url.rsplit(":", 1)[-1].strip("/")
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", port, "--workers", str(args.api_workers),
+         "--log-level", "warning"],
+        env=env,
+    )
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "celery", "-A", "stub_worker", "worker", "--pool", "threads",
+         "-c", str(args.worker_concurrency), "--loglevel", "warning"],
+        env=env,
+    )
+    return [api, worker]
+
+
+async def wait_until_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{url}/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"API at {url} did not come up within {timeout:.0f}s")
+            await asyncio.sleep(0.5)
+
+
+async def main_async(args) -> Dict[str, Dict[str, Any]]:
+    with open(args.file, "rb") as f:
+        sample = f.read()
+    await wait_until_up(args.url)
+    # No client-side connection cap, so queueing shows up as server latency
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    async with aiohttp.ClientSession(base_url=args.url, connector=connector, timeout=timeout) as session:
+        return await LoadTest(session, args, sample).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API against a stub worker")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", default=Config.API_KEY)
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to generate load")
+    parser.add_argument("--uploaders", type=int, default=5)
+    parser.add_argument("--pollers", type=int, default=50)
+    parser.add_argument("--watchers", type=int, default=50)
+    parser.add_argument("--downloaders", type=int, default=5)
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between status polls per client")
+    parser.add_argument("--download-interval", type=float, default=0.0, help="Seconds between downloads per client")
+    parser.add_argument("--formats", default=",".join(DOWNLOAD_FORMATS), help="Download formats to request")
+    parser.add_argument("--file", default=os.path.join("sample", "jfk.mp3"), help="File to upload")
+    parser.add_argument("--request-timeout", type=float, default=30)
+    parser.add_argument("--slo", action="append", default=[],
+                        help="Latency objective request:percentile:ms, e.g. status:p99:250 (repeatable)")
+    parser.add_argument("--max-error-rate", type=float, default=MAX_ERROR_RATE)
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--spawn", action="store_true", help="Start uvicorn and the stub worker for the test")
+    parser.add_argument("--api-workers", type=int, default=1, help="uvicorn workers with --spawn")
+    parser.add_argument("--worker-concurrency", type=int, default=32, help="Stub worker threads with --spawn")
+    parser.add_argument("--job-seconds", type=float, default=5, help="Simulated job length with --spawn")
+    args = parser.parse_args()
+    args.url = args.url.rstrip("/")
+    args.formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    slos = parse_slos(args.slo) if args.slo else DEFAULT_SLOS
+
+    processes = spawn_services(args) if args.spawn else []
+    try:
+        report = asyncio.run(main_async(args))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    print_report(report)
+    violations = check_slos(report, slos, args.max_error_rate)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "report": report, "violations": violations}, f, indent=2)
+    if violations:
+        print(f"\n❌ {len(violations)} objective(s) missed:")
+        for violation in violations:
+            print(f"  - {violation}")
+        return 1
+    print("\n✅ All latency objectives met")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
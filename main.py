@@ -1,118 +1,39 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket, WebSocketDisconnect, Request
-from fastapi.responses import HTMLResponse, FileResponse, Response
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 import os
+import math
 import uuid
 import json
-import aiofiles
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
-from tasks import celery_app, transcribe_and_summarize
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from task_queue import celery_app, enqueue_transcription
 from config import Config
+from search_index import search, sync_from_storage
+from storage import StoredObject, get_storage, storage_key
+from compression import CompressionMiddleware, compressed_variant, negotiate_encoding, is_compressible
+from results_store import result_stat, stat_version, iter_result_json, query_segments
+from exports import (
+    EXPORT_MEDIA_TYPES, STREAMED_EXPORTS, ExportRenderer, RenderQueueFull, cached_export, export_download_url,
+    open_export_stream, stored_export,
+)
+from events import EventHub, FINAL_STATES, is_status_message, parse_event_id
+from status_cache import StatusCache
+from task_state import TaskStateReader, state_message
 import asyncio
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT, TA_CENTER
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from io import BytesIO
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from rate_limit import RateLimiter, rate_limit_bucket, client_identity
+from metrics import render_metrics
+from profiling import PROFILE_ARTIFACTS, find_profile
+from eta import plan_job, add_to_backlog, finish_job
 
 app = FastAPI(title="Audio/Video Transcription & Summarization", version="1.0.0")
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-
-def setup_unicode_fonts():
-    """Setup Unicode fonts for PDF generation"""
-    try:
-        # Try to register DejaVu Sans font which supports Cyrillic
-        # This font is commonly available on Linux systems
-        font_paths = [
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-            '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
-            '/System/Library/Fonts/Arial Unicode MS.ttf',  # macOS
-            'C:/Windows/Fonts/arial.ttf',  # Windows
-        ]
-        
-        for font_path in font_paths:
-            if os.path.exists(font_path):
-                pdfmetrics.registerFont(TTFont('Unicode', font_path))
-                return True
-                
-        # Fallback: use built-in fonts
-        print("Warning: No Unicode font found, using built-in fonts. Cyrillic characters may not display correctly.")
-        return False
-        
-    except Exception as e:
-        print(f"Warning: Could not register Unicode font: {e}")
-        return False
-
-def create_unicode_styles():
-    """Create paragraph styles with Unicode font support"""
-    styles = getSampleStyleSheet()
-    
-    # Check if Unicode font is available
-    font_available = False
-    try:
-        # Test if our Unicode font was registered
-        from reportlab.pdfbase.pdfmetrics import getFont
-        getFont('Unicode')
-        font_available = True
-    except Exception:
-        pass
-    
-    if font_available:
-        # Create custom styles with Unicode font
-        from reportlab.lib.styles import ParagraphStyle
-        from reportlab.lib.enums import TA_CENTER
-        
-        title_style = ParagraphStyle(
-            'UnicodeTitle',
-            parent=styles['Title'],
-            fontName='Unicode',
-            fontSize=18,
-            spaceAfter=12,
-            alignment=TA_CENTER
-        )
-        
-        heading_style = ParagraphStyle(
-            'UnicodeHeading1',
-            parent=styles['Heading1'],
-            fontName='Unicode',
-            fontSize=14,
-            spaceAfter=6,
-            spaceBefore=12
-        )
-        
-        normal_style = ParagraphStyle(
-            'UnicodeNormal',
-            parent=styles['Normal'],
-            fontName='Unicode',
-            fontSize=10,
-            spaceAfter=6
-        )
-        
-        return {
-            'Title': title_style,
-            'Heading1': heading_style,
-            'Normal': normal_style
-        }
-    else:
-        # Use default styles
-        return {
-            'Title': styles['Title'],
-            'Heading1': styles['Heading1'],
-            'Normal': styles['Normal']
-        }
-
-# Setup fonts on startup
-setup_unicode_fonts()
+# Token-bucket rate limits shared by all API processes through Redis
+rate_limiter = RateLimiter()
 
 # Add trusted host middleware for security
 app.add_middleware(
@@ -133,6 +54,16 @@ app.add_middleware(
     allow_headers=["Content-Type"],
 )
 
+# Compress JSON and text responses for clients that accept it
+app.add_middleware(CompressionMiddleware)
+
+def request_api_key(request: Request) -> Optional[str]:
+    return request.headers.get("X-API-Key") or request.query_params.get("api_key")
+
+def is_admin(request: Request) -> bool:
+    """Whether the request carries the admin API key (never true while no admin key is configured)"""
+    return bool(Config.ADMIN_API_KEY) and request_api_key(request) == Config.ADMIN_API_KEY
+
 # Add middleware to handle ngrok-specific headers and security
 @app.middleware("http")
 async def security_middleware(request: Request, call_next):
@@ -144,14 +75,27 @@ async def security_middleware(request: Request, call_next):
     
     # Authentication for API endpoints (skip main page and static files)
     if not (request.url.path.startswith("/static") or request.url.path in ["/", "/health"]):
-        # Check API key for protected endpoints
-        if request.url.path.startswith(("/upload", "/status", "/download", "/ws")):
-            api_key = request.headers.get("X-API-Key") or request.query_params.get("api_key")
-            if api_key != Config.API_KEY:
+        # Admin-only endpoints
+        if request.url.path.startswith("/profile"):
+            if not is_admin(request):
+                return Response("Forbidden - Admin API Key required", status_code=403)
+        # Check API key for protected endpoints (the admin key works everywhere)
+        elif request.url.path.startswith(("/upload", "/status", "/result", "/download", "/ws", "/events", "/segments", "/search", "/metrics")):
+            if request_api_key(request) != Config.API_KEY and not is_admin(request):
                 return Response("Unauthorized - Invalid API Key", status_code=401)
     
+    rate_limit = None
+    bucket = rate_limit_bucket(request)
+    if bucket is not None:
+        rate_limit = await rate_limiter.check(bucket, client_identity(request))
+        if not rate_limit.allowed:
+            return Response("Rate limit exceeded - try again later", status_code=429, headers=rate_limit.headers())
+    
     response = await call_next(request)
     
+    if rate_limit is not None:
+        response.headers.update(rate_limit.headers())
+    
     # Add security headers
     response.headers["X-Content-Type-Options"] = "nosniff"
     response.headers["X-Frame-Options"] = "DENY"
@@ -167,25 +111,154 @@ async def security_middleware(request: Request, call_next):
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+# Single Redis subscription for task events, fanned out to connected clients
+event_hub = EventHub()
+
+@app.on_event("startup")
+async def start_event_hub():
+    event_hub.start()
+
+async def sync_search_index():
+    """Index results saved by workers on other machines (remote storage)"""
+    while True:
+        try:
+            await asyncio.to_thread(sync_from_storage)
+        except Exception as e:
+            print(f"Warning: Could not sync the search index: {e}")
+        await asyncio.sleep(Config.SEARCH_SYNC_INTERVAL)
+
+search_sync_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_search_sync():
+    global search_sync_task
+    if not get_storage().is_local:
+        search_sync_task = asyncio.create_task(sync_search_index())
+
+@app.on_event("shutdown")
+async def close_redis_clients():
+    await event_hub.stop()
+    if search_sync_task is not None:
+        search_sync_task.cancel()
+    await task_state_reader.close()
+    await rate_limiter.close()
+    export_renderer.shutdown()
+
 # WebSocket connection manager
 class ConnectionManager:
+    """Registry of WebSockets watching each task.
+
+    Any number of sockets can watch the same task. A task being watched holds a
+    single event subscription and each message is serialized once. Every socket
+    has a bounded outgoing queue drained by its own sender task, so the event
+    listener never waits on socket I/O: a socket that fails, stalls or falls
+    too far behind is dropped without holding up the others. Viewers joining a
+    task that is already being watched get the last known state instead of
+    another status fetch.
+    """
+
     def __init__(self):
-        self.active_connections: dict = {}
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self._unsubscribers: Dict[str, Callable[[], None]] = {}
+        self._last_messages: Dict[str, dict] = {}
+        self._outboxes: Dict[WebSocket, asyncio.Queue] = {}
+        self._senders: Dict[WebSocket, asyncio.Task] = {}
+        self._closing: Set[asyncio.Task] = set()
 
     async def connect(self, websocket: WebSocket, task_id: str):
         await websocket.accept()
-        self.active_connections[task_id] = websocket
+        if task_id not in self.active_connections:
+            self.active_connections[task_id] = set()
+            # Subscribe before reading the current state so no event can slip in between
+            self._unsubscribers[task_id] = event_hub.subscribe(
+                task_id, lambda message, event_id: self.broadcast(task_id, message)
+            )
+        self.active_connections[task_id].add(websocket)
+        outbox = asyncio.Queue(maxsize=Config.WEBSOCKET_QUEUE_SIZE)
+        self._outboxes[websocket] = outbox
+        self._senders[websocket] = asyncio.create_task(self._send_loop(websocket, task_id, outbox))
 
-    def disconnect(self, task_id: str):
-        if task_id in self.active_connections:
+    def disconnect(self, websocket: WebSocket, task_id: str):
+        self._outboxes.pop(websocket, None)
+        sender = self._senders.pop(websocket, None)
+        if sender is not None and sender is not asyncio.current_task():
+            sender.cancel()
+        sockets = self.active_connections.get(task_id)
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
             del self.active_connections[task_id]
+            self._unsubscribers.pop(task_id)()
+            self._last_messages.pop(task_id, None)
 
-    async def send_update(self, task_id: str, message: dict):
+    def is_connected(self, websocket: WebSocket, task_id: str) -> bool:
+        return websocket in self.active_connections.get(task_id, ())
+
+    async def current_state(self, task_id: str) -> dict:
+        """Last known state of a watched task; concurrent viewers share one status fetch"""
+        if task_id in self._last_messages:
+            return self._last_messages[task_id]
+        message = (await status_cache.get(task_id)).message
         if task_id in self.active_connections:
+            self._last_messages.setdefault(task_id, message)
+        return message
+
+    async def send_current_state(self, websocket: WebSocket, task_id: str):
+        """Send the current state to a newly connected socket"""
+        message = await self.current_state(task_id)
+        self._deliver(task_id, [websocket], message)
+
+    async def broadcast(self, task_id: str, message: dict):
+        """Queue a message for every socket watching the task (never waits on the sockets)"""
+        if task_id not in self.active_connections:
+            return
+        # Partial results are passed through but are not the task's state
+        if is_status_message(message):
+            self._last_messages[task_id] = message
+            status_cache.put(task_id, message)
+        self._deliver(task_id, list(self.active_connections[task_id]), message)
+
+    def _deliver(self, task_id: str, sockets: List[WebSocket], message: dict):
+        # Serialize once for all viewers
+        text = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        final = message.get('state') in FINAL_STATES
+        for websocket in sockets:
+            outbox = self._outboxes.get(websocket)
+            if outbox is None:
+                continue
             try:
-                await self.active_connections[task_id].send_json(message)
-            except Exception:
-                self.disconnect(task_id)
+                outbox.put_nowait((text, final))
+            except asyncio.QueueFull:
+                # Too far behind to catch up - drop it rather than buffer without bound
+                print(f"Warning: Dropping a WebSocket of task {task_id} that cannot keep up")
+                self.disconnect(websocket, task_id)
+                self._close_later(websocket)
+
+    async def _send_loop(self, websocket: WebSocket, task_id: str, outbox: asyncio.Queue):
+        """Send a socket's queued messages in order until it fails, stalls or gets a final state"""
+        try:
+            while True:
+                text, final = await outbox.get()
+                await asyncio.wait_for(websocket.send_text(text), Config.WEBSOCKET_SEND_TIMEOUT)
+                if final:
+                    break
+        except Exception:
+            pass
+        self.disconnect(websocket, task_id)
+        # Nothing more will happen after a final state, and a failed socket is of no further use
+        await self._close(websocket)
+
+    def _close_later(self, websocket: WebSocket):
+        task = asyncio.create_task(self._close(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(), Config.WEBSOCKET_SEND_TIMEOUT)
+        except Exception:
+            pass
 
 manager = ConnectionManager()
 
@@ -207,6 +280,23 @@ def validate_file(file: UploadFile) -> None:
                 detail=f"Unsupported file format. Allowed: {', '.join(Config.ALLOWED_EXTENSIONS)}"
             )
 
+def store_upload(file: UploadFile, key: str) -> None:
+    """Copy an upload into storage chunk by chunk (blocking - run in a worker thread)"""
+    with get_storage().open_write(key) as out:
+        while chunk := file.file.read(Config.STORAGE_CHUNK_SIZE):
+            out.write(chunk)
+
+def task_status_message(task_id: str) -> dict:
+    """Read a task's current state via AsyncResult (blocking - run in a worker thread)"""
+    task = celery_app.AsyncResult(task_id)
+    return state_message(task.state, task.info)
+
+# Async status reads from the result backend, with the AsyncResult path as fallback
+task_state_reader = TaskStateReader(celery_app, task_status_message)
+
+# Short-TTL status cache shared by pollers, long-pollers and WebSocket viewers
+status_cache = StatusCache(task_state_reader.read, event_hub)
+
 @app.get("/", response_class=HTMLResponse)
 async def main_page(request: Request):
     """Main web interface"""
@@ -241,47 +331,73 @@ async def main_page(request: Request):
     })
 
 @app.post("/upload")
-@limiter.limit("3/minute")  # Rate limit: 3 uploads per minute per IP
 async def upload_file(
     request: Request,
     file: UploadFile = File(...),
     language: str = Form("auto"),
     summary_length: str = Form("medium"),
-    enable_summary: str = Form("true")
+    enable_summary: str = Form("true"),
+    profile: str = Form("false")
 ):
     """Upload file and start transcription task"""
     validate_file(file)
     
     # Convert string to boolean
     enable_summary_bool = enable_summary.lower() in ('true', '1', 'yes', 'on')
+    profile_bool = profile.lower() in ('true', '1', 'yes', 'on')
+    if profile_bool and not is_admin(request):
+        raise HTTPException(status_code=403, detail="Profiling requires the admin API key")
+    
+    # Predicted cost from earlier jobs: the ETA, the queue priority and admission
+    plan = await asyncio.to_thread(plan_job, file.filename or "", file.size or 0, enable_summary_bool)
+    if Config.ADMISSION_MAX_QUEUE_WAIT and plan.queue_wait > Config.ADMISSION_MAX_QUEUE_WAIT:
+        retry_after = max(1, math.ceil(plan.queue_wait - Config.ADMISSION_MAX_QUEUE_WAIT))
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server is busy (estimated queue wait {plan.queue_wait / 60:.0f} minutes), try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
     
     # Generate unique task ID
     task_id = str(uuid.uuid4())
     
-    # Save uploaded file
-    file_path = os.path.join(Config.UPLOAD_DIR, f"{task_id}_{file.filename}")
+    # Save uploaded file to storage (a local path with local storage, an object key otherwise)
+    # Only the base name of the client's file name - never its directories (or "..")
+    file_name = Path((file.filename or "").replace("\\", "/")).name or "upload"
+    file_key = storage_key(os.path.join(Config.UPLOAD_DIR, f"{task_id}_{file_name}"))
+    stored = False
     
     try:
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        # Streamed in chunks, so the upload is never held in memory
+        await asyncio.to_thread(store_upload, file, file_key)
+        stored = True
         
-        # Start transcription task
-        task = transcribe_and_summarize.delay(file_path, language, summary_length, enable_summary_bool)
+        # Start transcription task (by name - the web process never imports the worker code).
+        # The upload file name carries the same ID, so the janitor can match files to tasks.
+        await asyncio.to_thread(add_to_backlog, task_id, plan.processing)
+        task = enqueue_transcription(file_key, language, summary_length, enable_summary_bool, task_id=task_id,
+                                     profile=profile_bool, priority=plan.priority)
         
         return {
             "task_id": task.id,
             "message": "File uploaded successfully. Transcription started.",
-            "filename": file.filename
+            "filename": file.filename,
+            "eta_seconds": round(plan.eta),
+            "estimate": {
+                "audio_duration": round(plan.audio_duration, 1),
+                "queue_seconds": round(plan.queue_wait),
+                "processing_seconds": round(plan.processing),
+            },
         }
     
     except Exception as e:
+        await asyncio.to_thread(finish_job, task_id)
         # Cleanup uploaded file on error
-        if os.path.exists(file_path):
+        if stored:
             try:
-                os.remove(file_path)
+                await asyncio.to_thread(get_storage().delete, file_key)
             except Exception as cleanup_error:
-                print(f"Warning: Could not delete uploaded file {file_path} after upload error: {cleanup_error}")
+                print(f"Warning: Could not delete uploaded file {file_key} after upload error: {cleanup_error}")
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
 
 @app.get("/upload")
@@ -294,7 +410,8 @@ async def upload_info():
             "file": "Audio/video file to transcribe",
             "language": "Language code (optional, default: 'auto')",
             "summary_length": "Summary length (optional, default: 'medium')",
-            "enable_summary": "Enable AI summarization (optional, default: true)"
+            "enable_summary": "Enable AI summarization (optional, default: true)",
+            "profile": "Profile the job (optional, admin API key only, default: false)"
         },
         "supported_formats": list(Config.ALLOWED_EXTENSIONS),
         "max_file_size_mb": Config.MAX_FILE_SIZE // (1024*1024),
@@ -302,240 +419,357 @@ async def upload_info():
     }
 
 @app.get("/status/{task_id}")
-async def get_task_status(task_id: str):
-    """Get transcription task status"""
-    task = celery_app.AsyncResult(task_id)
+async def get_task_status(request: Request, task_id: str, wait: float = 0):
+    """Get transcription task status.
+
+    Responses carry an ETag; a request whose If-None-Match matches gets 304 Not Modified.
+    With `wait` > 0 (long-poll) and a matching If-None-Match, the request is held for up to
+    `wait` seconds until the state or progress changes.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    status = await status_cache.get(task_id)
     
-    if task.state == 'PENDING':
-        response = {
-            'state': task.state,
-            'status': 'Task is waiting to be processed'
-        }
-    elif task.state == 'PROGRESS':
-        response = {
-            'state': task.state,
-            'step': task.info.get('step', ''),
-            'progress': task.info.get('progress', 0)
-        }
-    elif task.state == 'SUCCESS':
-        response = {
-            'state': task.state,
-            'result': task.result
-        }
-    else:  # FAILURE
-        response = {
-            'state': task.state,
-            'error': str(task.info)
-        }
+    # Weak comparison: compressed responses carry the ETag as W/"..."
+    matches = bool(if_none_match) and _etag_matches(if_none_match, status.etag)
+    if wait > 0 and matches and not status.is_final:
+        status = await status_cache.wait_for_change(
+            task_id, status.etag, min(wait, Config.STATUS_LONG_POLL_MAX_WAIT)
+        )
     
-    return response
+    headers = {"ETag": status.etag, "Cache-Control": "no-cache"}
+    if if_none_match and _etag_matches(if_none_match, status.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=status.body, media_type="application/json", headers=headers)
+
+@app.get("/result/{task_id}")
+async def get_task_result(task_id: str):
+    """Get the full transcription result (text, segments, word timings) from the results store"""
+    chunks = await asyncio.to_thread(iter_result_json, task_id)
+    if chunks is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    
+    # Decoded from the binary result file while it is sent, instead of round-tripping it through Redis
+    return StreamingResponse(chunks, media_type='application/json')
+
+@app.get("/segments/{task_id}")
+async def get_segments(
+    task_id: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    offset: int = 0,
+    limit: int = 100,
+    words: bool = False
+):
+    """Get the segments overlapping [start, end] seconds (or all segments), a page at a time.
+
+    Served from the memory-mapped result file, so only the requested segments
+    are read. Word timings are included only with `words=true`.
+    """
+    if offset < 0 or not 1 <= limit <= Config.SEGMENTS_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and limit between 1 and {Config.SEGMENTS_PAGE_MAX}")
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    
+    page = await asyncio.to_thread(query_segments, task_id, start, end, offset, limit, words)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return page
+
+@app.get("/search")
+async def search_transcripts(q: str, offset: int = 0, limit: int = 20, task_id: Optional[str] = None):
+    """Search all stored transcripts (or one, with `task_id`), best matches first.
+
+    Each hit is a segment with its task ID, time offsets and a highlighted snippet.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    if offset < 0 or not 1 <= limit <= Config.SEARCH_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and limit between 1 and {Config.SEARCH_PAGE_MAX}")
+    
+    return await asyncio.to_thread(search, q, limit, offset, task_id)
 
 @app.websocket("/ws/{task_id}")
 async def websocket_endpoint(websocket: WebSocket, task_id: str):
-    """WebSocket for real-time updates"""
+    """WebSocket for real-time updates pushed from the worker via Redis pub/sub"""
     await manager.connect(websocket, task_id)
     try:
-        while True:
-            # Check task status
-            task = celery_app.AsyncResult(task_id)
+        # Send the current state once; later updates arrive as events
+        await manager.send_current_state(websocket, task_id)
+        
+        # Keep the connection open until the client leaves or the task finishes
+        while manager.is_connected(websocket, task_id):
+            await websocket.receive_text()
+    
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        manager.disconnect(websocket, task_id)
+
+def sse_event(message: dict, event_id: str = None) -> str:
+    """Format a message as a Server-Sent Events frame"""
+    data = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+    if event_id:
+        return f"id: {event_id}\ndata: {data}\n\n"
+    return f"data: {data}\n\n"
+
+@app.get("/events/{task_id}")
+async def task_events(request: Request, task_id: str, last_event_id: str = None):
+    """Server-Sent Events stream of task progress, partial results and completion.
+
+    Fed by the same pushed events as the WebSocket. Every event carries an ID; a
+    reconnecting client that sends Last-Event-ID gets the events it missed.
+    """
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def on_event(message: dict, event_id: str = None):
+        queue.put_nowait((event_id, message))
+    
+    # Subscribe before reading the backlog so no event can slip in between
+    unsubscribe = event_hub.subscribe(task_id, on_event)
+    
+    async def stream():
+        last_seen = None
+        try:
+            yield f"retry: {Config.SSE_RETRY_MS}\n\n"
             
-            if task.state == 'PROGRESS':
-                await manager.send_update(task_id, {
-                    'state': task.state,
-                    'step': task.info.get('step', ''),
-                    'progress': task.info.get('progress', 0)
-                })
-            elif task.state in ['SUCCESS', 'FAILURE']:
-                if task.state == 'SUCCESS':
-                    await manager.send_update(task_id, {
-                        'state': task.state,
-                        'result': task.result
-                    })
-                else:
-                    await manager.send_update(task_id, {
-                        'state': task.state,
-                        'error': str(task.info)
-                    })
-                break
+            backlog = await event_hub.replay(task_id, last_event_id) if last_event_id else []
+            if backlog:
+                for event_id, message in backlog:
+                    last_seen = parse_event_id(event_id)
+                    yield sse_event(message, event_id)
+                    if message.get('state') in FINAL_STATES:
+                        return
+            else:
+                # Fresh connection (or nothing to replay): start from the current state
+                status = await status_cache.get(task_id)
+                yield sse_event(status.message)
+                if status.is_final:
+                    return
             
-            await asyncio.sleep(1)
+            while True:
+                try:
+                    event_id, message = await asyncio.wait_for(queue.get(), Config.SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                if event_id:
+                    # Skip live events already sent as part of the replayed backlog
+                    if last_seen is not None and parse_event_id(event_id) <= last_seen:
+                        continue
+                    last_seen = parse_event_id(event_id)
+                if is_status_message(message):
+                    status_cache.put(task_id, message)
+                yield sse_event(message, event_id)
+                if message.get('state') in FINAL_STATES:
+                    return
+        finally:
+            unsubscribe()
     
-    except WebSocketDisconnect:
-        manager.disconnect(task_id)
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Bounded process pool for rendering downloads
+export_renderer = ExportRenderer()
+
+def _etag_matches(if_none_match: str, *etags: str) -> bool:
+    # Weak comparison - compressed responses carry W/ validators
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or any(etag in tags for etag in etags)
+
+def _not_modified_since(if_modified_since: str, modified: int) -> bool:
+    try:
+        return modified <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+def _byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """[start, end) of a single "bytes=" range; None if the header is not one we serve as a range.
+
+    Raises HTTPException 416 if the range lies outside the object.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Multiple ranges are answered with the whole object
+        return None
+    first, sep, last = spec.strip().partition("-")
+    try:
+        if not sep or not (first or last):
+            return None
+        if not first:
+            start, end = max(size - int(last), 0), size
+        else:
+            start, end = int(first), size if not last else min(int(last) + 1, size)
+            if last and int(last) < start:
+                return None
+    except ValueError:
+        return None
+    if start >= size or start >= end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def stored_response(key: str, stored: StoredObject, range_header: Optional[str], media_type: str, headers: Dict[str, str]):
+    """Stream an object straight from remote storage, honouring a single byte range"""
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    byte_range = _byte_range(range_header, stored.size) if range_header else None
+    if byte_range is None:
+        start, end, status_code = 0, stored.size, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{stored.size}"
+    headers["Content-Length"] = str(end - start)
+    # Storage reads block - StreamingResponse iterates them in the thread pool
+    return StreamingResponse(get_storage().iter_range(key, start, end), status_code=status_code,
+                             media_type=media_type, headers=headers)
+
+async def render_export(task_id: str, format: str) -> str:
+    """Path of the rendered export, rendering it if needed"""
+    # Rendering is CPU-bound - keep it off the event loop in the render process pool
+    try:
+        file_path = await export_renderer.render(task_id, format)
+    except RenderQueueFull:
+        raise HTTPException(status_code=503, detail="Too many exports are being rendered, try again shortly",
+                            headers={"Retry-After": "10"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Export is taking too long to render, try again later")
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return file_path
 
 @app.get("/download/{task_id}/{format}")
-async def download_result(task_id: str, format: str):
-    """Download transcription results"""
-    if format not in ['txt', 'pdf', 'md']:
-        raise HTTPException(status_code=400, detail="Format must be 'txt', 'pdf', or 'md'")
+async def download_result(request: Request, task_id: str, format: str):
+    """Download transcription results.
+
+    Text formats (txt, md, srt, vtt, jsonl) are streamed as they are generated
+    on the first download and served from the render cache afterwards. PDF is
+    rendered once per result version and cached. Cached files support Range
+    requests and are sent compressed when the client accepts gzip/brotli -
+    precompressed once the render pool has written the variants.
+    With remote storage, renders made on another machine are streamed from
+    the store, Range requests included.
+    All responses can be revalidated with ETag/Last-Modified.
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400, detail=f"Format must be one of: {', '.join(repr(fmt) for fmt in EXPORT_MEDIA_TYPES)}"
+        )
     
-    result_file = os.path.join(Config.RESULTS_DIR, f"{task_id}.json")
-    if not os.path.exists(result_file):
+    stat = await asyncio.to_thread(result_stat, task_id)
+    if stat is None:
         raise HTTPException(status_code=404, detail="Result not found")
     
-    with open(result_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    # Renders change only when the result does, so validators come from the result file
+    version = stat_version(stat)
+    modified = int(stat.st_mtime)
+    base_etag = f'"{version}-{format}"'
+    # Range requests are served from the identity file; otherwise text is sent compressed if accepted
+    range_requested = "range" in request.headers
+    encoding = None
+    if not range_requested and is_compressible(EXPORT_MEDIA_TYPES[format]):
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    etag = f'"{version}-{format}-{encoding}"' if encoding else base_etag
+    headers = {"ETag": etag, "Last-Modified": formatdate(modified, usegmt=True), "Cache-Control": "no-cache"}
+    if encoding:
+        headers["Vary"] = "Accept-Encoding"
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        # Any encoding of this version is the same content
+        not_modified = _etag_matches(if_none_match, base_etag, etag)
+    else:
+        not_modified = if_modified_since is not None and _not_modified_since(if_modified_since, modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
     
-    if format == 'txt':
-        # Create TXT file
-        content = f"TRANSCRIPTION\n{'='*50}\n\n"
-        content += data['transcription']['text'] + "\n\n"
-        
-        # Only include summary if it was enabled
-        if data['metadata'].get('summary_enabled', True):
-            content += f"SUMMARY\n{'='*50}\n\n"
-            content += data['summary'] + "\n\n"
-        
-        content += f"METADATA\n{'='*50}\n\n"
-        content += f"File: {data['metadata']['file_name']}\n"
-        content += f"Language: {data['metadata']['language']}\n"
-        
-        if data['metadata'].get('summary_enabled', True):
-            content += f"Summary Length: {data['metadata']['summary_length']}\n"
-        else:
-            content += "Summary: Disabled\n"
-        
-        if data['metadata'].get('duration'):
-            content += f"Duration: {data['metadata']['duration']:.2f} seconds\n"
-        
-        # Add timestamps if available
-        if data['transcription'].get('segments'):
-            content += f"\n\nTIMESTAMPED TRANSCRIPTION\n{'='*50}\n\n"
-            for segment in data['transcription']['segments']:
-                start = segment.get('start', 0)
-                end = segment.get('end', 0)
-                text = segment.get('text', '')
-                content += f"[{start:.2f}s - {end:.2f}s] {text}\n"
-        
-        filename = f"transcription_{task_id}.txt"
-        file_path = os.path.join(Config.RESULTS_DIR, filename)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        return FileResponse(
-            file_path, 
-            filename=filename,
-            media_type='text/plain'
-        )
+    filename = f"transcription_{task_id}.{format}"
+    if Config.STORAGE_PRESIGNED_DOWNLOADS and not get_storage().is_local:
+        # The client fetches the file straight from the bucket, which also serves Range requests
+        url = await asyncio.to_thread(export_download_url, task_id, format, filename)
+        if url is None:
+            await render_export(task_id, format)
+            url = await asyncio.to_thread(export_download_url, task_id, format, filename)
+        if url is not None:
+            return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-cache"})
     
-    elif format == 'md':
-        # Create Markdown file
-        content = "# Transcription and Summary Report\n\n"
-        
-        # Metadata section
-        content += "## Metadata\n\n"
-        content += f"- **File:** {data['metadata']['file_name']}\n"
-        content += f"- **Language:** {data['metadata']['language']}\n"
-        
-        if data['metadata'].get('summary_enabled', True):
-            content += f"- **Summary Length:** {data['metadata']['summary_length']}\n"
-        else:
-            content += "- **Summary:** Disabled\n"
-        
-        if data['metadata'].get('duration'):
-            content += f"- **Duration:** {data['metadata']['duration']:.2f} seconds\n"
-        
-        content += "\n---\n\n"
-        
-        # Summary section (conditional)
-        if data['metadata'].get('summary_enabled', True):
-            content += "## Summary\n\n"
-            content += data['summary'] + "\n\n---\n\n"
-        
-        # Transcription section
-        content += "## Full Transcription\n\n"
-        content += data['transcription']['text'] + "\n\n"
-        
-        # Timestamped transcription if available
-        if data['transcription'].get('segments'):
-            content += "## Timestamped Transcription\n\n"
-            for segment in data['transcription']['segments']:
-                start = segment.get('start', 0)
-                end = segment.get('end', 0)
-                text = segment.get('text', '')
-                content += f"**[{start:.2f}s - {end:.2f}s]** {text}\n\n"
-        
-        filename = f"transcription_{task_id}.md"
-        file_path = os.path.join(Config.RESULTS_DIR, filename)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        return FileResponse(
-            file_path, 
-            filename=filename,
-            media_type='text/markdown'
-        )
+    if not get_storage().is_local:
+        # A render made on another machine is streamed from the store rather than fetched first
+        stored = await asyncio.to_thread(stored_export, task_id, format)
+        if stored is not None:
+            headers["ETag"] = base_etag
+            headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+            headers.pop("Vary", None)
+            range_header = request.headers.get("range")
+            if_range = request.headers.get("if-range")
+            if if_range is not None and if_range.strip() not in (base_etag, headers["Last-Modified"]):
+                range_header = None
+            return stored_response(*stored, range_header, EXPORT_MEDIA_TYPES[format], headers)
     
-    elif format == 'pdf':
-        # Create PDF file with Unicode support
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        story = []
-        
-        # Get Unicode-compatible styles
-        custom_styles = create_unicode_styles()
-        
-        # Title
-        story.append(Paragraph("Transcription and Summary Report", custom_styles['Title']))
-        story.append(Spacer(1, 12))
-        
-        # Metadata
-        story.append(Paragraph("Metadata", custom_styles['Heading1']))
-        story.append(Paragraph(f"<b>File:</b> {data['metadata']['file_name']}", custom_styles['Normal']))
-        story.append(Paragraph(f"<b>Language:</b> {data['metadata']['language']}", custom_styles['Normal']))
-        
-        if data['metadata'].get('summary_enabled', True):
-            story.append(Paragraph(f"<b>Summary Length:</b> {data['metadata']['summary_length']}", custom_styles['Normal']))
+    file_path = None
+    if format in STREAMED_EXPORTS:
+        file_path = await asyncio.to_thread(cached_export, task_id, format)
+        if file_path is None and not range_requested:
+            # First download: stream while generating, filling the render cache on the way.
+            # CompressionMiddleware compresses the stream if the client accepts it.
+            chunks = await asyncio.to_thread(open_export_stream, task_id, format, True)
+            if chunks is None:
+                raise HTTPException(status_code=404, detail="Result not found")
+            headers["ETag"] = base_etag
+            headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+            return StreamingResponse(chunks, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+    
+    if file_path is None:
+        file_path = await render_export(task_id, format)
+    
+    if encoding:
+        variant = await asyncio.to_thread(compressed_variant, file_path, encoding)
+        if variant is not None:
+            file_path = variant
+            headers["Content-Encoding"] = encoding
         else:
-            story.append(Paragraph("<b>Summary:</b> Disabled", custom_styles['Normal']))
-        
-        if data['metadata'].get('duration'):
-            story.append(Paragraph(f"<b>Duration:</b> {data['metadata']['duration']:.2f} seconds", custom_styles['Normal']))
-        
-        story.append(Spacer(1, 12))
-        
-        # Summary (conditional)
-        if data['metadata'].get('summary_enabled', True):
-            story.append(Paragraph("Summary", custom_styles['Heading1']))
-            # Escape HTML characters and handle Unicode text properly
-            summary_text = data['summary'].replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            story.append(Paragraph(summary_text, custom_styles['Normal']))
-            story.append(Spacer(1, 12))
-        
-        # Transcription
-        story.append(Paragraph("Full Transcription", custom_styles['Heading1']))
-        # Escape HTML characters and handle Unicode text properly
-        transcription_text = data['transcription']['text'].replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        story.append(Paragraph(transcription_text, custom_styles['Normal']))
-        
-        # Add timestamped transcription if available
-        if data['transcription'].get('segments'):
-            story.append(Spacer(1, 12))
-            story.append(Paragraph("Timestamped Transcription", custom_styles['Heading1']))
-            
-            for segment in data['transcription']['segments']:
-                start = segment.get('start', 0)
-                end = segment.get('end', 0)
-                text = segment.get('text', '').replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                timestamp_text = f"[{start:.2f}s - {end:.2f}s] {text}"
-                story.append(Paragraph(timestamp_text, custom_styles['Normal']))
-        
-        doc.build(story)
-        buffer.seek(0)
-        
-        filename = f"transcription_{task_id}.pdf"
-        file_path = os.path.join(Config.RESULTS_DIR, filename)
-        
-        with open(file_path, 'wb') as f:
-            f.write(buffer.getvalue())
-        
-        return FileResponse(
-            file_path, 
-            filename=filename,
-            media_type='application/pdf'
+            # Precompressing at maximum level is slow - do it once in the render pool, and compress
+            # this response on the fly in CompressionMiddleware meanwhile
+            export_renderer.precompress(file_path)
+            headers["ETag"] = base_etag
+            del headers["Vary"]
+    
+    return FileResponse(
+        file_path,
+        filename=filename,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+@app.get("/profile/{task_id}/{artifact}")
+async def download_profile(task_id: str, artifact: str):
+    """Download a profiling artifact of a profiled job (admin only)"""
+    if artifact not in PROFILE_ARTIFACTS:
+        raise HTTPException(
+            status_code=400, detail=f"Artifact must be one of: {', '.join(repr(name) for name in PROFILE_ARTIFACTS)}"
         )
+    path = await asyncio.to_thread(find_profile, task_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    file_name, media_type = PROFILE_ARTIFACTS[artifact]
+    return FileResponse(path, filename=f"{task_id}_{file_name}", media_type=media_type)
+
+@app.get("/metrics")
+async def metrics():
+    """Stage timing and resource histograms of workers and renders, in the Prometheus text format"""
+    try:
+        body = await asyncio.to_thread(render_metrics)
+    except Exception as e:
+        print(f"Warning: Could not read metrics: {e}")
+        raise HTTPException(status_code=503, detail="Metrics are temporarily unavailable")
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/health")
 async def health_check():
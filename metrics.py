@@ -0,0 +1,352 @@
+"""
+Job and render timing metrics.
+
+Each transcription job measures its pipeline stages (queue wait, model
+loading, decode, audio loading, transcription, alignment, summary, save):
+wall time, CPU time and the peak resident memory (RSS) reached during the
+stage. The breakdown is stored in the job's `metadata["timings"]`, together
+with the real-time factor (processing time / audio duration).
+
+Workers and API processes are separate, so observations are aggregated as
+Prometheus-style histograms in a Redis hash (one field per sample, HINCRBY /
+HINCRBYFLOAT) and rendered in the Prometheus text format by the API's
+/metrics endpoint. Recording is best-effort - a Redis outage never fails a
+job or a download.
+
+CPU time is process-wide (including child processes such as ffmpeg), so it is
+only reported for stages that ran while no other stage of this process did;
+with several concurrent jobs in one worker, overlapping stages get no CPU
+time. Memory is sampled while stages run (METRICS_RSS_SAMPLE_INTERVAL), so a stage's
+peak is its own rather than the process' lifetime high-water mark, but it
+still includes whatever concurrent jobs hold at the time.
+"""
+
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import redis
+from config import Config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+RSS_BUCKETS = tuple(2 ** power * 1024 ** 2 for power in range(8, 16))  # 256MB .. 32GB
+REALTIME_FACTOR_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+# name: (type, help, buckets)
+METRICS: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {
+    "nurgavoice_stage_duration_seconds": (
+        "histogram", "Wall time of transcription pipeline stages", DURATION_BUCKETS),
+    "nurgavoice_stage_cpu_seconds": (
+        "histogram", "CPU time of transcription pipeline stages", DURATION_BUCKETS),
+    "nurgavoice_job_duration_seconds": (
+        "histogram", "Wall time of transcription jobs from start to finish, excluding queue wait", DURATION_BUCKETS),
+    "nurgavoice_job_peak_rss_bytes": (
+        "histogram", "Peak resident memory of the worker process sampled during a job", RSS_BUCKETS),
+    "nurgavoice_job_realtime_factor": (
+        "histogram", "Job processing time divided by audio duration", REALTIME_FACTOR_BUCKETS),
+    "nurgavoice_audio_seconds_total": (
+        "counter", "Audio processed by finished jobs", ()),
+    "nurgavoice_export_render_seconds": (
+        "histogram", "Time spent rendering downloads", DURATION_BUCKETS),
+    "nurgavoice_export_render_cpu_seconds": (
+        "histogram", "CPU time spent rendering downloads", DURATION_BUCKETS),
+}
+
+
+def cpu_time() -> float:
+    """CPU time of this process and its finished children (e.g. ffmpeg)"""
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> Optional[int]:
+    """Resident memory of this process right now, in bytes (None if it cannot be read)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+def _max(*values: Optional[int]) -> Optional[int]:
+    present = [value for value in values if value is not None]
+    return max(present) if present else None
+
+
+class _ActiveStage:
+    def __init__(self, rss: Optional[int]):
+        self.peak_rss = rss
+        self.shared = False  # Another stage of this process ran at the same time
+
+
+class StageMonitor:
+    """Stages running in this process.
+
+    Samples resident memory while any stage runs, and notes which stages
+    overlap - their process-wide CPU time is not their own.
+    """
+
+    def __init__(self, interval: float = Config.METRICS_RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._active: List[_ActiveStage] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self) -> _ActiveStage:
+        stage = _ActiveStage(current_rss())
+        with self._lock:
+            if self._active:
+                stage.shared = True
+                for other in self._active:
+                    other.shared = True
+            self._active.append(stage)
+            # Also after a fork, which leaves the sampler thread behind
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+        return stage
+
+    def end(self, stage: _ActiveStage) -> None:
+        rss = current_rss()
+        with self._lock:
+            self._active.remove(stage)
+            stage.peak_rss = _max(stage.peak_rss, rss)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wakeup.wait()
+            rss = current_rss()
+            with self._lock:
+                for stage in self._active:
+                    stage.peak_rss = _max(stage.peak_rss, rss)
+            time.sleep(self.interval)
+
+
+stage_monitor = StageMonitor()
+
+
+class Stopwatch:
+    """Wall and CPU time accumulated over one or more `with` blocks"""
+
+    def __init__(self, cpu_clock=cpu_time):
+        self.cpu_clock = cpu_clock
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def __enter__(self) -> "Stopwatch":
+        self._wall_start = time.perf_counter()
+        self._cpu_start = self.cpu_clock()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.wall += time.perf_counter() - self._wall_start
+        self.cpu += self.cpu_clock() - self._cpu_start
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+class MetricsBatch:
+    """Observations collected locally and written to Redis in one pipeline"""
+
+    def __init__(self):
+        self.increments: Dict[str, int] = {}
+        self.float_increments: Dict[str, float] = {}
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Add an observation to a histogram"""
+        label_str = _labels(labels)
+        prefix = f"{label_str}," if label_str else ""
+        for bound in METRICS[name][2]:
+            if value <= bound:
+                field = f'{name}_bucket{{{prefix}le="{bound:g}"}}'
+                self.increments[field] = self.increments.get(field, 0) + 1
+        for field in (f'{name}_bucket{{{prefix}le="+Inf"}}', f"{name}_count{{{label_str}}}"):
+            self.increments[field] = self.increments.get(field, 0) + 1
+        self.inc(f"{name}_sum", value, **labels)
+
+    def inc(self, name: str, value: float, **labels: str) -> None:
+        """Add to a counter (or a histogram's sum)"""
+        field = f"{name}{{{_labels(labels)}}}"
+        self.float_increments[field] = self.float_increments.get(field, 0.0) + value
+
+    def record(self) -> None:
+        if not Config.METRICS_ENABLED or not (self.increments or self.float_increments):
+            return
+        try:
+            pipe = _get_redis().pipeline(transaction=False)
+            for field, amount in self.increments.items():
+                pipe.hincrby(Config.METRICS_KEY, field, amount)
+            for field, amount in self.float_increments.items():
+                pipe.hincrbyfloat(Config.METRICS_KEY, field, amount)
+            pipe.execute()
+        except Exception as e:
+            print(f"Warning: Could not record metrics: {e}")
+
+
+class JobTimings:
+    """Per-stage timings of one transcription job"""
+
+    def __init__(self, enqueued_at: Optional[float] = None):
+        self.started_at = time.time()
+        self._wall_start = time.perf_counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.current: Optional[str] = None  # Stage running now
+        self._current_start = 0.0
+        if enqueued_at is not None:
+            self.stages["queue_wait"] = {"wall": round(max(0.0, self.started_at - enqueued_at), 3)}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a pipeline stage; a stage that runs more than once accumulates"""
+        stopwatch = Stopwatch()
+        self.current, self._current_start = name, time.perf_counter()
+        active = stage_monitor.begin()
+        try:
+            with stopwatch:
+                yield
+        finally:
+            stage_monitor.end(active)
+            self.current = None
+            entry = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0, "peak_rss": None})
+            entry["wall"] = round(entry["wall"] + stopwatch.wall, 3)
+            # Process CPU time of a stage that overlapped another job's would count that job's work too
+            exclusive = not active.shared and entry["cpu"] is not None
+            entry["cpu"] = round(entry["cpu"] + stopwatch.cpu, 3) if exclusive else None
+            entry["peak_rss"] = _max(entry["peak_rss"], active.peak_rss)
+
+    def elapsed(self) -> float:
+        """Wall time since the job started"""
+        return time.perf_counter() - self._wall_start
+
+    def current_elapsed(self) -> float:
+        """Wall time spent in the running stage so far"""
+        return time.perf_counter() - self._current_start if self.current is not None else 0.0
+
+    def as_dict(self, audio_duration: Optional[float] = None) -> Dict[str, Any]:
+        """Breakdown for the job's metadata"""
+        total = self.elapsed()
+        measured = [entry for entry in self.stages.values() if "cpu" in entry]
+        cpu = [entry["cpu"] for entry in measured]
+        return {
+            "stages": {name: dict(entry) for name, entry in self.stages.items()},
+            "total": round(total, 3),
+            "cpu": round(sum(cpu), 3) if cpu and None not in cpu else None,
+            "peak_rss": _max(*(entry["peak_rss"] for entry in measured)),
+            "realtime_factor": round(total / audio_duration, 4) if audio_duration else None,
+        }
+
+    def record(self, status: str, audio_duration: Optional[float] = None) -> None:
+        """Add this job to the shared histograms"""
+        timings = self.as_dict(audio_duration)
+        batch = MetricsBatch()
+        for stage, entry in self.stages.items():
+            batch.observe("nurgavoice_stage_duration_seconds", entry["wall"], stage=stage)
+            if entry.get("cpu") is not None:
+                batch.observe("nurgavoice_stage_cpu_seconds", entry["cpu"], stage=stage)
+        batch.observe("nurgavoice_job_duration_seconds", timings["total"], status=status)
+        if timings["peak_rss"] is not None:
+            batch.observe("nurgavoice_job_peak_rss_bytes", timings["peak_rss"])
+        if status == "success" and timings["realtime_factor"] is not None:
+            batch.observe("nurgavoice_job_realtime_factor", timings["realtime_factor"])
+            batch.inc("nurgavoice_audio_seconds_total", audio_duration)
+        batch.record()
+
+
+def record_render(fmt: str, stopwatch: Stopwatch) -> None:
+    """Add one export render to the shared histograms"""
+    batch = MetricsBatch()
+    batch.observe("nurgavoice_export_render_seconds", stopwatch.wall, format=fmt)
+    batch.observe("nurgavoice_export_render_cpu_seconds", stopwatch.cpu, format=fmt)
+    batch.record()
+
+
+def timed_render(fmt: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Pass a streamed render through, recording the time spent producing it.
+
+    Only time inside the renderer counts, not time waiting for the client to
+    read; renders abandoned by the client are not recorded.
+    """
+    # Per-thread clock: streamed chunks are produced in a threadpool of the busy API process
+    stopwatch = Stopwatch(cpu_clock=time.thread_time)
+    while True:
+        with stopwatch:
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        yield chunk
+    record_render(fmt, stopwatch)
+
+
+_redis = None
+
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(Config.REDIS_URL)
+    return _redis
+
+
+_SAMPLE_SUFFIXES = ("_bucket", "_count", "_sum")
+_LE = re.compile(r'le="([^"]+)"')
+
+
+def _family(field: str) -> str:
+    name = field.split("{", 1)[0]
+    for suffix in _SAMPLE_SUFFIXES:
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def _sort_key(field: str):
+    # Buckets of a series in ascending order, +Inf last
+    match = _LE.search(field)
+    bound = float("inf") if match is None or match.group(1) == "+Inf" else float(match.group(1))
+    return _family(field), _LE.sub("", field), bound
+
+
+def render_metrics() -> str:
+    """All recorded metrics in the Prometheus text exposition format"""
+    samples = {
+        key.decode(): float(value) for key, value in _get_redis().hgetall(Config.METRICS_KEY).items()
+    }
+    lines: List[str] = []
+    family = None
+    for field in sorted(samples, key=_sort_key):
+        if _family(field) != family:
+            family = _family(field)
+            if family in METRICS:
+                lines.append(f"# HELP {family} {METRICS[family][1]}")
+                lines.append(f"# TYPE {family} {METRICS[family][0]}")
+        value = samples[field]
+        lines.append(f"{field.replace('{}', '')} {int(value) if value.is_integer() else value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,225 @@
+"""
+Opt-in profiling of transcription jobs.
+
+A job is profiled when an admin asks for it at upload (`profile=true`) or
+when it is picked by the PROFILE_SAMPLE_RATE sampling. The job's thread then
+runs under three tools:
+
+- cProfile: deterministic call statistics (`pstats` file and a text report)
+- a stack sampler: the thread's stack every PROFILE_SAMPLE_INTERVAL seconds,
+  written as collapsed stacks ("frame;frame;frame count" lines) ready for
+  flamegraph.pl or speedscope
+- tracemalloc: the lines that allocated the most Python memory (unless
+  PROFILE_ALLOCATIONS is off - it is by far the most expensive of the three)
+
+Artifacts are written to results/profiles/<task_id>/ (and to remote storage
+when it is configured) and are downloadable from /profile/{task_id}/{artifact}.
+
+cProfile and the sampler only see the job's own thread. tracemalloc is
+process-wide, so allocations of other jobs running in the same worker at the
+same time are included. Only one job per process runs under cProfile at a
+time (from Python 3.12 a second active profiler is an error); profiled jobs
+running alongside it get the sampler and tracemalloc only. Profiling never
+fails a job: if the profilers cannot start, the job runs unprofiled.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from results_store import fetch_from_storage, push_to_storage
+from storage import get_storage
+
+# Artifact name -> (file name, media type); "allocations" only with PROFILE_ALLOCATIONS
+PROFILE_ARTIFACTS: Dict[str, Tuple[str, str]] = {
+    "pstats": ("profile.pstats", "application/octet-stream"),
+    "stats": ("profile.txt", "text/plain; charset=utf-8"),
+    "collapsed": ("stacks.collapsed", "text/plain; charset=utf-8"),
+    "allocations": ("allocations.txt", "text/plain; charset=utf-8"),
+}
+
+
+def profile_dir(task_id: str) -> str:
+    """Directory holding the profiling artifacts of a task"""
+    return os.path.join(Config.PROFILES_DIR, task_id)
+
+
+def profile_path(task_id: str, artifact: str) -> str:
+    return os.path.join(profile_dir(task_id), PROFILE_ARTIFACTS[artifact][0])
+
+
+def should_profile(requested: bool = False) -> bool:
+    """Whether to profile a job: asked for explicitly, or picked by sampling"""
+    return requested or (Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE)
+
+
+def find_profile(task_id: str, artifact: str) -> Optional[str]:
+    """Local path of a profiling artifact (fetched from remote storage if needed), or None"""
+    path = profile_path(task_id, artifact)
+    if os.path.exists(path):
+        return path
+    if not get_storage().is_local and fetch_from_storage(path):
+        return path
+    return None
+
+
+def _frame_label(code) -> str:
+    # Last two path components keep labels short but tell apart the many __init__.py files
+    parts = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Collect the stack of one thread at a fixed interval, as collapsed-stack counts"""
+
+    def __init__(self, thread_id: int, interval: float = Config.PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.ident is not None:  # Started
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+# tracemalloc is process-wide: keep it running while any profiled job needs it
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started = False  # By us, rather than e.g. PYTHONTRACEMALLOC
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(Config.PROFILE_TRACEMALLOC_FRAMES)
+            _tracemalloc_started = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> Tuple[tracemalloc.Snapshot, int]:
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_started:
+            tracemalloc.stop()
+            _tracemalloc_started = False
+    return snapshot, peak
+
+
+# Held by the job running under cProfile
+_cprofile_lock = threading.Lock()
+
+
+class JobProfiler:
+    """Profile the calling thread between start() and stop(), then save the artifacts"""
+
+    def __init__(self, task_id: str, allocations: bool = Config.PROFILE_ALLOCATIONS):
+        self.task_id = task_id
+        self.allocations = allocations
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler = StackSampler(threading.get_ident())
+        self._tracing = False
+        self._started = False
+
+    def start(self) -> None:
+        if self.allocations:
+            _start_tracemalloc()
+            self._tracing = True
+        self._sampler.start()
+        if _cprofile_lock.acquire(blocking=False):
+            try:
+                profiler = cProfile.Profile()
+                profiler.enable()
+            except Exception as e:
+                # E.g. a debugger or coverage tool holds the profiling hook
+                _cprofile_lock.release()
+                print(f"Warning: cProfile unavailable for task {self.task_id} ({e}), sampling stacks only")
+            else:
+                self._profiler = profiler
+        else:
+            print(f"Warning: Another job is under cProfile, sampling stacks of task {self.task_id} only")
+        self._started = True
+
+    def stop(self) -> List[str]:
+        """Stop profiling and write the artifacts; returns the names of those saved.
+
+        Safe after a start() that failed part way: undoes what was started and saves nothing.
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+            _cprofile_lock.release()
+        self._sampler.stop()
+        snapshot, peak = _stop_tracemalloc() if self._tracing else (None, 0)
+        self._tracing = False
+        if not self._started:
+            return []
+        try:
+            return self._save(snapshot, peak)
+        except Exception as e:
+            print(f"Warning: Could not save profile of task {self.task_id}: {e}")
+            return []
+
+    def _save(self, snapshot: Optional[tracemalloc.Snapshot], peak: int) -> List[str]:
+        os.makedirs(profile_dir(self.task_id), exist_ok=True)
+        saved = []
+        if self._profiler is not None:
+            self._profiler.dump_stats(profile_path(self.task_id, "pstats"))
+            report = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=report)
+            report.write(f"Profile of task {self.task_id}\n\n")
+            stats.sort_stats("cumulative").print_stats(Config.PROFILE_TOP_ENTRIES)
+            stats.sort_stats("tottime").print_stats(Config.PROFILE_TOP_ENTRIES)
+            self._write("stats", report.getvalue())
+            saved += ["pstats", "stats"]
+
+        self._write("collapsed", self._sampler.collapsed())
+        saved.append("collapsed")
+        if snapshot is not None:
+            lines = [
+                f"Peak traced Python memory: {peak / (1024 * 1024):.1f} MB (process-wide)",
+                f"Top {Config.PROFILE_TOP_ENTRIES} allocation sites still held at the end of the job:",
+                "",
+            ]
+            for stat in snapshot.statistics("lineno")[:Config.PROFILE_TOP_ENTRIES]:
+                lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {stat.traceback[0]}")
+            self._write("allocations", "\n".join(lines) + "\n")
+            saved.append("allocations")
+
+        for artifact in saved:
+            push_to_storage(profile_path(self.task_id, artifact))
+        print(f"🔬 Saved profile of task {self.task_id} to {profile_dir(self.task_id)}")
+        return saved
+
+    def _write(self, artifact: str, text: str) -> None:
+        with open(profile_path(self.task_id, artifact), "w", encoding="utf-8") as f:
+            f.write(text)
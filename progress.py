@@ -0,0 +1,123 @@
+import time
+from typing import Dict, Any, List, Optional
+from config import Config
+from events import publish_event, progress_message, partial_message
+from eta import JobEstimate
+
+
+class ProgressReporter:
+    """Publish task progress via update_state with throttling.
+
+    Updates are stored in the result backend and pushed to clients over Redis
+    pub/sub. Stage changes are published immediately. Fine-grained updates from inside
+    transcription/alignment are coalesced: only the latest state is kept and it
+    is written at most once every PROGRESS_UPDATE_INTERVAL seconds, so Redis
+    writes stay cheap however many segments a recording has.
+
+    Newly transcribed segments are buffered the same way and pushed as PARTIAL
+    events (pub/sub only, they are not task state).
+
+    With a JobEstimate, progress is the share of the job's predicted time
+    already spent instead of the fixed stage percentages, and every update
+    carries the ETA of the whole job.
+    """
+
+    def __init__(self, task, min_interval: float = Config.PROGRESS_UPDATE_INTERVAL,
+                 estimate: Optional[JobEstimate] = None):
+        self.task = task
+        self.min_interval = min_interval
+        self.estimate = estimate
+        self._progress = 0
+        self._last_published = 0.0
+        self._last_meta: Optional[Dict[str, Any]] = None
+        self._pending: Optional[Dict[str, Any]] = None
+        self._partial: List[Dict[str, Any]] = []
+
+    def stage(self, step: str, progress: int) -> None:
+        """Publish a new pipeline stage immediately"""
+        self._publish(self.estimated({"step": step, "progress": progress}))
+
+    def estimated(self, meta: Dict[str, Any], current_left: Optional[float] = None) -> Dict[str, Any]:
+        """Replace the fixed progress with time-based progress and the job's ETA, given an estimate"""
+        if self.estimate is None:
+            return meta
+        # Never move backwards when the estimate is revised upwards
+        self._progress = max(self._progress, self.estimate.progress(current_left))
+        return dict(meta, progress=self._progress, eta_seconds=round(self.estimate.remaining(current_left)))
+
+    def update(self, meta: Dict[str, Any]) -> None:
+        """Record a fine-grained update, publishing it only if the throttle allows"""
+        self._pending = meta
+        if time.monotonic() - self._last_published >= self.min_interval:
+            self.flush()
+
+    def add_partial(self, segment: Dict[str, Any]) -> None:
+        """Buffer a newly transcribed segment; it goes out with the next published update"""
+        self._partial.append(segment)
+
+    def flush(self) -> None:
+        """Publish the latest coalesced update and buffered segments, if any"""
+        if self._partial:
+            segments, self._partial = self._partial, []
+            publish_event(self.task.request.id, partial_message(segments))
+        if self._pending is not None:
+            self._publish(self._pending)
+
+    def track(self, step: str, start_progress: int, end_progress: int, total_audio: Optional[float]) -> "StageProgress":
+        """Start tracking an audio-position based stage spanning start_progress..end_progress"""
+        self.stage(step, start_progress)
+        return StageProgress(self, step, start_progress, end_progress, total_audio)
+
+    def _publish(self, meta: Dict[str, Any]) -> None:
+        self._pending = None
+        self._last_published = time.monotonic()
+        # Skip writes that would not change what clients see
+        if meta == self._last_meta:
+            return
+        self._last_meta = meta
+        self.task.update_state(state="PROGRESS", meta=meta)
+        # Push the same update to watching clients
+        publish_event(self.task.request.id, progress_message(meta))
+
+
+class StageProgress:
+    """Map the audio position processed within a stage to overall progress and an ETA.
+
+    The ETA is derived from the real-time factor measured so far in the stage
+    (wall time spent / seconds of audio processed). With a job estimate it is
+    blended with the predicted time left in the stage - trusting the measured
+    rate more as the stage advances - and extended to the rest of the job.
+    """
+
+    def __init__(self, reporter: ProgressReporter, step: str, start_progress: int, end_progress: int, total_audio: Optional[float]):
+        self.reporter = reporter
+        self.step = step
+        self.start_progress = start_progress
+        self.end_progress = end_progress
+        self.total_audio = total_audio
+        self.started_at = time.monotonic()
+
+    def update(self, audio_position: float) -> None:
+        """Report that audio up to audio_position seconds has been processed"""
+        if not self.total_audio or audio_position <= 0:
+            return
+        fraction = min(audio_position / self.total_audio, 1.0)
+        elapsed = time.monotonic() - self.started_at
+        real_time_factor = elapsed / audio_position
+        eta_seconds = (self.total_audio - min(audio_position, self.total_audio)) * real_time_factor
+        estimate = self.reporter.estimate
+        if estimate is not None:
+            eta_seconds = fraction * eta_seconds + (1 - fraction) * estimate.current_left()
+
+        self.reporter.update(self.reporter.estimated({
+            "step": self.step,
+            "progress": int(self.start_progress + (self.end_progress - self.start_progress) * fraction),
+            "audio_position": round(audio_position, 1),
+            "audio_duration": round(self.total_audio, 1),
+            "real_time_factor": round(real_time_factor, 3),
+            "eta_seconds": round(eta_seconds),
+        }, current_left=eta_seconds))
+
+    def finish(self) -> None:
+        """Flush the last coalesced update so the final position is not lost"""
+        self.reporter.flush()
@@ -0,0 +1,134 @@
+"""
+Distributed token-bucket rate limiting in Redis.
+
+Every API process checks the same buckets, so limits hold across uvicorn
+workers and replicas. Buckets are keyed by API key (hashed), or by client IP
+for requests without one, with a separate budget per kind of call: uploads
+are expensive and get a small budget, status/result/download reads a larger
+one. Each check is a single atomic Lua script call that refills the bucket
+from the time elapsed (Redis server clock, so replicas agree) and takes a
+token if one is available.
+"""
+
+import hashlib
+import math
+from typing import Dict, Optional, Tuple
+
+import redis.asyncio as aioredis
+from starlette.requests import Request
+from config import Config
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+
+class RateLimitResult:
+    """Outcome of one bucket check"""
+
+    def __init__(self, allowed: bool, limit: int, remaining: float, retry_after: float):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(int(self.remaining)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def rate_limit_bucket(request: Request) -> Optional[str]:
+    """Which budget a request draws from (None for unlimited paths)"""
+    path = request.url.path
+    if request.method == "POST" and path.startswith("/upload"):
+        return "upload"
+    if path.startswith(("/status", "/result", "/download", "/events", "/segments", "/search")):
+        return "read"
+    return None
+
+
+def client_identity(request: Request) -> str:
+    """API key when the request has one, otherwise the client's IP address.
+
+    The default API key is embedded in the web interface and shared by every
+    browser, so requests with it are keyed by key and client IP - each UI user
+    gets their own budget instead of all of them sharing one.
+    """
+    api_key = request.headers.get("X-API-Key") or request.query_params.get("api_key")
+    client_ip = request.client.host if request.client else "unknown"
+    if api_key:
+        # Hashed so API keys never appear in Redis key names
+        identity = "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:24]
+        if api_key == Config.API_KEY:
+            identity += ":ip:" + client_ip
+        return identity
+    return "ip:" + client_ip
+
+
+class RateLimiter:
+    """Token buckets shared by all API processes through Redis.
+
+    `limits` maps a bucket name to (capacity, refill per second). If Redis is
+    unreachable requests are let through - an outage of the limiter should not
+    take the API down with it.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, float]] = Config.RATE_LIMITS,
+                 redis_url: str = Config.REDIS_URL, key_prefix: str = Config.RATE_LIMIT_KEY_PREFIX):
+        self.limits = limits
+        self.redis_url = redis_url
+        self.key_prefix = key_prefix
+        self._redis = None
+        self._script = None
+
+    def _get_script(self):
+        if self._script is None:
+            self._redis = aioredis.from_url(self.redis_url)
+            # EVALSHA, falling back to EVAL once if the script is not cached on the server yet
+            self._script = self._redis.register_script(TOKEN_BUCKET_SCRIPT)
+        return self._script
+
+    async def check(self, bucket: str, identity: str, cost: int = 1) -> RateLimitResult:
+        capacity, rate = self.limits[bucket]
+        try:
+            allowed, remaining, retry_after = await self._get_script()(
+                keys=[f"{self.key_prefix}{bucket}:{identity}"], args=[capacity, rate, cost]
+            )
+        except Exception as e:
+            print(f"Warning: Rate limit check failed, allowing request: {e}")
+            return RateLimitResult(True, capacity, capacity, 0)
+        return RateLimitResult(bool(allowed), capacity, float(remaining), float(retry_after))
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+            self._script = None
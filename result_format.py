@@ -0,0 +1,250 @@
+"""
+Compact binary storage format for transcription results (`.nvr`).
+
+    magic "NVR1" | uint32 header length | JSON header | padding | columns
+
+The JSON header holds the small fields (summary, metadata, language) and a
+table of columns. Segments and words are stored column-wise: start/end/score
+as float64 arrays and text as one UTF-8 blob indexed by uint32 offsets.
+Fields other than these are kept as JSON in an optional "extra" column.
+Numbers round-trip exactly; files written with float32 columns (before the
+switch to float64) are read back rounded to 3 decimals.
+
+ResultFile memory-maps the file and decodes lazily, so reading the metadata
+or a slice of segments does not touch the rest of the file.
+"""
+
+import json
+import math
+import mmap
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+MAGIC = b"NVR1"
+_ALIGN = 8
+_NAN = float("nan")
+
+# Fields stored in typed columns; everything else goes to the "extra" JSON column
+SEGMENT_FLOAT_FIELDS = ("start", "end")
+WORD_FLOAT_FIELDS = ("start", "end", "score")
+
+
+def _float_column(records: Sequence[Dict[str, Any]], field: str) -> array:
+    """float64 column; NaN marks a missing value"""
+    values = array("d")
+    for record in records:
+        value = record.get(field)
+        values.append(_NAN if value is None else value)
+    return values
+
+
+def _text_column(texts: Sequence[str]) -> Tuple[array, bytes]:
+    """UTF-8 blob of all texts plus the uint32 offsets of each one (n + 1 entries)"""
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = array("I", [0])
+    offsets.extend(accumulate(len(item) for item in encoded))
+    return offsets, b"".join(encoded)
+
+
+def _extra_column(records: Sequence[Dict[str, Any]], stored: Sequence[str]) -> Optional[Tuple[array, bytes]]:
+    """JSON of the fields not stored in typed columns, or None if no record has any"""
+    extras = [{key: value for key, value in record.items() if key not in stored} for record in records]
+    if not any(extras):
+        return None
+    return _text_column([json.dumps(extra, ensure_ascii=False) if extra else "" for extra in extras])
+
+
+def write_result_file(f, result: Dict[str, Any]) -> None:
+    """Write a result dict to a binary file object in the .nvr format"""
+    transcription = dict(result.get("transcription") or {})
+    segments = transcription.pop("segments", None) or []
+    text = transcription.pop("text", "") or ""
+    words = [word for segment in segments for word in (segment.get("words") or [])]
+
+    columns: Dict[str, Any] = {
+        "seg_start": _float_column(segments, "start"),
+        "seg_end": _float_column(segments, "end"),
+        # Running maximum of end times for overlap queries
+        "seg_max_end": array("d", accumulate((value if value == value else -math.inf
+                                              for value in _float_column(segments, "end")), max)),
+        # Whether the segment has a "words" list, and where its words start in the word columns
+        "seg_has_words": array("B", ("words" in segment for segment in segments)),
+        "seg_words": array("I", [0]),
+        "word_start": _float_column(words, "start"),
+        "word_end": _float_column(words, "end"),
+        "word_score": _float_column(words, "score"),
+        "text": array("B", text.encode("utf-8")),
+    }
+    columns["seg_words"].extend(accumulate(len(segment.get("words") or []) for segment in segments))
+    columns["seg_text_offsets"], columns["seg_text"] = _text_column([segment.get("text", "") for segment in segments])
+    columns["word_text_offsets"], columns["word_text"] = _text_column([word.get("word", "") for word in words])
+    segment_extra = _extra_column(segments, SEGMENT_FLOAT_FIELDS + ("text", "words"))
+    if segment_extra is not None:
+        columns["seg_extra_offsets"], columns["seg_extra"] = segment_extra
+    word_extra = _extra_column(words, WORD_FLOAT_FIELDS + ("word",))
+    if word_extra is not None:
+        columns["word_extra_offsets"], columns["word_extra"] = word_extra
+
+    table = {}
+    data = []
+    position = 0
+    for name, column in columns.items():
+        raw = column.tobytes() if isinstance(column, array) else column
+        typecode = column.typecode if isinstance(column, array) else "B"
+        table[name] = [position, len(raw) // array(typecode).itemsize, typecode]
+        data.append(raw)
+        padding = -len(raw) % _ALIGN
+        data.append(b"\0" * padding)
+        position += len(raw) + padding
+
+    header = {
+        "byteorder": sys.byteorder,
+        "summary": result.get("summary", ""),
+        "metadata": result.get("metadata", {}),
+        "transcription": transcription,
+        "other": {key: value for key, value in result.items() if key not in ("summary", "metadata", "transcription")},
+        "segment_count": len(segments),
+        "word_count": len(words),
+        "columns": table,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    header_bytes += b" " * (-(len(MAGIC) + 4 + len(header_bytes)) % _ALIGN)
+
+    f.write(MAGIC)
+    f.write(len(header_bytes).to_bytes(4, "little"))
+    f.write(header_bytes)
+    for chunk in data:
+        f.write(chunk)
+
+
+def is_result_file(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _number(value: float, typecode: str) -> Optional[float]:
+    if math.isnan(value):
+        return None
+    # float32 columns of older files hold e.g. 0.1 as 0.10000000149
+    return round(value, 3) if typecode == "f" else value
+
+
+class ResultFile:
+    """Lazy, memory-mapped reader of a .nvr result"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a result file")
+        header_length = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 4], "little")
+        data_start = len(MAGIC) + 4 + header_length
+        self.header = json.loads(self._mmap[len(MAGIC) + 4:data_start])
+        self._data_start = data_start
+        self._columns: Dict[str, Any] = {}
+
+    def __enter__(self) -> "ResultFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for column in self._columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self._columns.clear()
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return self.header["segment_count"]
+
+    def column(self, name: str):
+        """A column as a zero-copy view of the mapped file (or None if the file has no such column)"""
+        if name not in self._columns:
+            entry = self.header["columns"].get(name)
+            if entry is None:
+                return None
+            offset, count, typecode = entry
+            start = self._data_start + offset
+            size = count * array(typecode).itemsize
+            if self.header["byteorder"] == sys.byteorder:
+                view = memoryview(self._mmap)[start:start + size]
+                self._columns[name] = view if typecode == "B" else view.cast(typecode)
+            else:
+                values = array(typecode, self._mmap[start:start + size])
+                values.byteswap()
+                self._columns[name] = values
+        return self._columns[name]
+
+    def _float(self, name: str, i: int) -> Optional[float]:
+        return _number(self.column(name)[i], self.header["columns"][name][2])
+
+    def _text(self, name: str, i: int) -> str:
+        offsets = self.column(f"{name}_offsets")
+        return bytes(self.column(name)[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+    @property
+    def text(self) -> str:
+        return bytes(self.column("text")).decode("utf-8")
+
+    def header_dict(self) -> Dict[str, Any]:
+        """Everything in the result except the segments"""
+        return {
+            **self.header["other"],
+            "summary": self.header["summary"],
+            "metadata": self.header["metadata"],
+            "transcription": {**self.header["transcription"], "text": self.text},
+        }
+
+    def word(self, i: int) -> Dict[str, Any]:
+        word = {"word": self._text("word_text", i)}
+        for field in WORD_FLOAT_FIELDS:
+            value = self._float(f"word_{field}", i)
+            if value is not None:
+                word[field] = value
+        if self.column("word_extra") is not None:
+            extra = self._text("word_extra", i)
+            if extra:
+                word.update(json.loads(extra))
+        return word
+
+    def segment(self, i: int, words: bool = True) -> Dict[str, Any]:
+        segment: Dict[str, Any] = {}
+        for field in SEGMENT_FLOAT_FIELDS:
+            value = self._float(f"seg_{field}", i)
+            if value is not None:
+                segment[field] = value
+        segment["text"] = self._text("seg_text", i)
+        if self.column("seg_extra") is not None:
+            extra = self._text("seg_extra", i)
+            if extra:
+                segment.update(json.loads(extra))
+        if words and self.column("seg_has_words")[i]:
+            word_offsets = self.column("seg_words")
+            segment["words"] = [self.word(w) for w in range(word_offsets[i], word_offsets[i + 1])]
+        return segment
+
+    def iter_segments(self, start: int = 0, stop: Optional[int] = None, words: bool = True) -> Iterator[Dict[str, Any]]:
+        for i in range(start, len(self) if stop is None else stop):
+            yield self.segment(i, words)
+
+    def time_range(self, start: float, end: float) -> List[int]:
+        """Indices of the segments overlapping [start, end]"""
+        starts, ends = self.column("seg_start"), self.column("seg_end")
+        lo = bisect_left(self.column("seg_max_end"), start)
+        hi = bisect_right(starts, end)
+        return [i for i in range(lo, hi) if ends[i] >= start]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Decode the whole result"""
+        result = self.header_dict()
+        result["transcription"]["segments"] = list(self.iter_segments())
+        return result
@@ -0,0 +1,320 @@
+import os
+import json
+import shutil
+import time
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional, Tuple
+from config import Config
+from result_format import ResultFile, write_result_file
+from storage import get_storage, storage_key
+
+RESULT_EXTENSION = ".nvr"
+
+
+def result_path(task_id: str) -> str:
+    """Path of the stored full result for a task"""
+    return os.path.join(Config.RESULTS_DIR, f"{task_id}{RESULT_EXTENSION}")
+
+
+def legacy_result_path(task_id: str) -> str:
+    """Path of a result stored as JSON before the binary format"""
+    return os.path.join(Config.RESULTS_DIR, f"{task_id}.json")
+
+
+def export_dir(task_id: str) -> str:
+    """Directory holding the cached TXT/MD/PDF renders of a task's result"""
+    return os.path.join(Config.EXPORTS_DIR, task_id)
+
+
+def result_stat(task_id: str) -> Optional[os.stat_result]:
+    """File status of the stored result, or None if there is no result.
+
+    Also records the access (as the file's atime) for the janitor's LRU eviction.
+    """
+    path = result_path(task_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        if os.path.exists(legacy_result_path(task_id)):
+            # Results from before the binary format are converted on first access
+            _convert_legacy_result(task_id)
+        elif not get_storage().is_local:
+            # Saved by a worker on another machine - fetch it into the local cache
+            fetch_from_storage(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+    _record_access(path, stat)
+    return stat
+
+
+def fetch_from_storage(path: str) -> bool:
+    """Copy an object from a remote store to its local path; False if the store does not have it"""
+    storage = get_storage()
+    stored = storage.stat(storage_key(path))
+    if stored is None:
+        return False
+    storage.download_file(storage_key(path), path)
+    _sync_mtime(path, stored.modified)
+    return True
+
+
+def push_to_storage(path: str) -> None:
+    """Copy a local file to a remote store (no-op for local storage)"""
+    storage = get_storage()
+    if storage.is_local:
+        return
+    storage.upload_file(path, storage_key(path))
+    _sync_mtime(path, storage.stat(storage_key(path)).modified)
+
+
+def _sync_mtime(path: str, modified: float) -> None:
+    # The version (and so ETags and export names) comes from the mtime, so every
+    # machine's copy takes the store's modification time
+    os.utime(path, ns=(time.time_ns(), int(modified * 1_000_000_000)))
+
+
+def _record_access(path: str, stat: os.stat_result) -> None:
+    # Set explicitly since mounts often use noatime/relatime; mtime is kept so the version does not change
+    now = time.time_ns()
+    if now - stat.st_atime_ns > Config.RESULT_ACCESS_RESOLUTION * 1_000_000_000:
+        try:
+            os.utime(path, ns=(now, stat.st_mtime_ns))
+        except OSError:
+            pass
+
+
+def stat_version(stat: os.stat_result) -> str:
+    """Opaque version of a stored result file (changes whenever it is re-saved)"""
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def result_version(task_id: str) -> Optional[str]:
+    """Version of the stored result, or None if missing"""
+    stat = result_stat(task_id)
+    return stat_version(stat) if stat is not None else None
+
+
+def save_result(task_id: str, result: Dict[str, Any]) -> str:
+    """Write the full result to the results store and return its path"""
+    path = result_path(task_id)
+    # Unique temp name - a legacy result may be converted by several readers at once
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        write_result_file(f, result)
+    # Atomic replace so readers never see a half-written result
+    os.replace(tmp_path, path)
+    push_to_storage(path)
+    # Renders of the previous version are stale now
+    shutil.rmtree(export_dir(task_id), ignore_errors=True)
+    return path
+
+
+def _convert_legacy_result(task_id: str) -> None:
+    """Rewrite a JSON result in the binary format"""
+    legacy_path = legacy_result_path(task_id)
+    try:
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    except FileNotFoundError:
+        return  # Converted concurrently
+    save_result(task_id, result)
+    try:
+        os.remove(legacy_path)
+    except FileNotFoundError:
+        pass
+
+
+def open_result_file(task_id: str) -> Optional[ResultFile]:
+    """Open the stored result for lazy reading, or None if there is no result (caller closes it)"""
+    if result_stat(task_id) is None:
+        return None
+    try:
+        return ResultFile(result_path(task_id))
+    except FileNotFoundError:
+        return None
+
+
+def load_result(task_id: str) -> Optional[Dict[str, Any]]:
+    """Load the full result from the results store, or None if it does not exist"""
+    result_file = open_result_file(task_id)
+    if result_file is None:
+        return None
+    with result_file:
+        return result_file.to_dict()
+
+
+def open_result_stream(task_id: str) -> Optional[Tuple[Dict[str, Any], Iterator[Dict[str, Any]]]]:
+    """Open a stored result for streaming: (everything except the segments, segment iterator).
+
+    Segments are decoded one at a time from the memory-mapped file, so memory
+    stays flat however long the transcript is. Returns None if the result does not exist.
+    """
+    result_file = open_result_file(task_id)
+    if result_file is None:
+        return None
+
+    def segments():
+        with result_file:
+            yield from result_file.iter_segments()
+
+    return result_file.header_dict(), segments()
+
+
+def iter_result_json(task_id: str, chunk_size: int = Config.EXPORT_STREAM_CHUNK_SIZE) -> Optional[Iterator[bytes]]:
+    """The full result as JSON, produced incrementally (None if there is no result)"""
+    opened = open_result_stream(task_id)
+    if opened is None:
+        return None
+    header, segments = opened
+
+    def chunks():
+        # Segments are the last value of the last key, so the document ends with `[]}}`
+        document = json.dumps({**header, "transcription": {**header["transcription"], "segments": []}}, ensure_ascii=False)
+        buffer = [document[:-3]]
+        size = len(buffer[0])
+        for i, segment in enumerate(segments):
+            piece = ("" if i == 0 else ",") + json.dumps(segment, ensure_ascii=False)
+            buffer.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield "".join(buffer).encode("utf-8")
+                buffer, size = [], 0
+        buffer.append("]}}")
+        yield "".join(buffer).encode("utf-8")
+
+    return chunks()
+
+
+class _CachedResultFile:
+    def __init__(self, version: str, result_file: ResultFile):
+        self.version = version
+        self.file = result_file
+        self.readers = 0
+        self.retired = False
+
+
+class ResultFileCache:
+    """Memory-mapped results kept open for segment queries, least recently used evicted.
+
+    A file is closed once it is evicted or superseded by a newer version and no query still reads it.
+    """
+
+    def __init__(self, size: int = Config.RESULT_FILE_CACHE_SIZE):
+        self.size = size
+        self._entries: "OrderedDict[str, _CachedResultFile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def reader(self, task_id: str, version: str) -> Iterator[Optional[ResultFile]]:
+        """The open result file of this version (None if there is none), valid inside the block"""
+        entry = self._acquire(task_id, version)
+        try:
+            yield entry.file if entry is not None else None
+        finally:
+            if entry is not None:
+                self._release(entry)
+
+    def discard(self, task_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(task_id, None)
+            if entry is not None:
+                self._retire(entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            while self._entries:
+                self._retire(self._entries.popitem()[1])
+
+    def _acquire(self, task_id: str, version: str) -> Optional[_CachedResultFile]:
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is not None and entry.version != version:
+                # Re-saved result: the old mapping shows stale data
+                self._retire(self._entries.pop(task_id))
+                entry = None
+            if entry is None:
+                try:
+                    entry = _CachedResultFile(version, ResultFile(result_path(task_id)))
+                except FileNotFoundError:
+                    return None
+                self._entries[task_id] = entry
+                while len(self._entries) > self.size:
+                    self._retire(self._entries.popitem(last=False)[1])
+            else:
+                self._entries.move_to_end(task_id)
+            entry.readers += 1
+            return entry
+
+    def _release(self, entry: _CachedResultFile) -> None:
+        with self._lock:
+            entry.readers -= 1
+            if entry.retired and entry.readers == 0:
+                entry.file.close()
+
+    def _retire(self, entry: _CachedResultFile) -> None:
+        entry.retired = True
+        if entry.readers == 0:
+            entry.file.close()
+
+
+_result_files = ResultFileCache()
+
+
+def query_segments(task_id: str, start: Optional[float] = None, end: Optional[float] = None,
+                   offset: int = 0, limit: int = 100, words: bool = False) -> Optional[Dict[str, Any]]:
+    """Return a page of the segments overlapping [start, end] (or of all segments), or None if there is no result.
+
+    Time ranges are found by binary search over the stored start-time column and
+    only the returned segments are decoded. Word timings are left out unless `words` is set.
+    """
+    version = result_version(task_id)
+    if version is None:
+        _result_files.discard(task_id)
+        return None
+
+    with _result_files.reader(task_id, version) as result_file:
+        if result_file is None:
+            return None
+        if start is None and end is None:
+            matching = range(len(result_file))
+        else:
+            matching = result_file.time_range(
+                start if start is not None else float("-inf"), end if end is not None else float("inf")
+            )
+        page = matching[offset:offset + limit]
+        segments = [{"index": i, **result_file.segment(i, words)} for i in page]
+
+    next_offset = offset + len(page)
+    return {
+        "task_id": task_id,
+        "total": len(matching),
+        "offset": offset,
+        "segments": segments,
+        "next_offset": next_offset if next_offset < len(matching) else None,
+    }
+
+
+def build_result_record(task_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the compact record returned through the Celery result backend.
+
+    The record only carries what the UI needs to render the summary and
+    metadata plus a pointer to the full result, so its size does not grow
+    with the length of the recording.
+    """
+    transcription = result.get("transcription", {})
+    return {
+        "task_id": task_id,
+        "result_url": f"/result/{task_id}",
+        "summary": result.get("summary", ""),
+        "metadata": result.get("metadata", {}),
+        "transcription": {
+            "language": transcription.get("language"),
+            "segment_count": len(transcription.get("segments") or []),
+            "text_length": len(transcription.get("text") or ""),
+        },
+    }
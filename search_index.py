@@ -0,0 +1,266 @@
+"""
+Full-text search over all stored transcripts.
+
+Segments are kept in a local SQLite database with an FTS5 index, so a query
+is an index lookup regardless of how many hours of transcripts are stored.
+The index is updated incrementally: the Celery task indexes each result
+right after saving it, and `python search_index.py` indexes any stored
+results that are missing or out of date (e.g. results from before the index
+existed).
+
+With remote storage the index is still a local file, so workers on other
+machines cannot write the API's index. Instead they add each saved result to
+a Redis sorted set (announce_result) and every API machine indexes the new
+entries from the store in the background (sync_from_storage), a few seconds
+after the task finishes.
+"""
+
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Any, List, Optional
+
+import redis
+from config import Config
+from results_store import load_result, result_version, RESULT_EXTENSION
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    task_id TEXT PRIMARY KEY,
+    version TEXT,
+    file_name TEXT,
+    language TEXT,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    segment_index INTEGER NOT NULL,
+    start REAL,
+    end REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_task_id ON segments (task_id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5 (
+    text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS segments_ai AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segments_ad AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+_schema_ready = False
+
+
+def _connect() -> sqlite3.Connection:
+    global _schema_ready
+    os.makedirs(os.path.dirname(Config.SEARCH_INDEX_PATH) or ".", exist_ok=True)
+    # Web process reads while worker threads write - WAL lets readers proceed during a write
+    conn = sqlite3.connect(Config.SEARCH_INDEX_PATH, timeout=30)
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def index_result(task_id: str, result: Dict[str, Any], version: Optional[str] = None) -> None:
+    """Add a stored result to the index, replacing any earlier version of it"""
+    segments = (result.get("transcription") or {}).get("segments") or []
+    metadata = result.get("metadata") or {}
+    rows = [
+        (task_id, i, segment.get("start"), segment.get("end"), segment.get("text", "").strip())
+        for i, segment in enumerate(segments)
+        if segment.get("text", "").strip()
+    ]
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM segments WHERE task_id = ?", (task_id,))
+            conn.executemany(
+                "INSERT INTO segments (task_id, segment_index, start, end, text) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (task_id, version, file_name, language, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (task_id, version or result_version(task_id), metadata.get("file_name"),
+                 metadata.get("language"), time.time()),
+            )
+    finally:
+        conn.close()
+
+
+def remove_result(task_id: str) -> None:
+    """Drop a task from the index"""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM segments WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM documents WHERE task_id = ?", (task_id,))
+    finally:
+        conn.close()
+
+
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def build_match_query(query: str) -> str:
+    """Turn free text into an FTS5 query: every word (or "quoted phrase") must match, `word*` matches a prefix.
+
+    User input never reaches FTS5 syntax directly, so operators and stray quotes cannot cause errors.
+    """
+    terms = []
+    for phrase, word in _TERM.findall(query):
+        text = phrase or word
+        prefix = bool(word) and word.endswith("*")
+        text = text.rstrip("*") if prefix else text
+        if not text.strip():
+            continue
+        terms.append('"' + text.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def search(query: str, limit: int = 20, offset: int = 0, task_id: Optional[str] = None) -> Dict[str, Any]:
+    """Return the segments matching the query, best matches first, with highlighted snippets"""
+    match = build_match_query(query)
+    if not match:
+        return {"query": query, "hits": [], "offset": offset, "next_offset": None}
+
+    sql = (
+        "SELECT s.task_id, s.segment_index, s.start, s.end, d.file_name, "
+        "snippet(segments_fts, 0, '<mark>', '</mark>', '…', ?) "
+        "FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+        "LEFT JOIN documents d ON d.task_id = s.task_id "
+        "WHERE segments_fts MATCH ?"
+    )
+    params: List[Any] = [Config.SEARCH_SNIPPET_TOKENS, match]
+    if task_id is not None:
+        sql += " AND s.task_id = ?"
+        params.append(task_id)
+    # One extra row tells whether there is a next page without counting every match
+    sql += " ORDER BY rank LIMIT ? OFFSET ?"
+    params += [limit + 1, offset]
+
+    conn = _connect()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+    hits = [
+        {"task_id": row[0], "index": row[1], "start": row[2], "end": row[3], "file_name": row[4], "snippet": row[5]}
+        for row in rows[:limit]
+    ]
+    return {
+        "query": query,
+        "hits": hits,
+        "offset": offset,
+        "next_offset": offset + limit if len(rows) > limit else None,
+    }
+
+
+def index_missing() -> int:
+    """Index stored results that are not in the index or changed since they were indexed"""
+    conn = _connect()
+    try:
+        indexed = dict(conn.execute("SELECT task_id, version FROM documents"))
+    finally:
+        conn.close()
+
+    count = 0
+    for name in os.listdir(Config.RESULTS_DIR):
+        task_id, ext = os.path.splitext(name)
+        if ext not in (RESULT_EXTENSION, ".json"):
+            continue
+        version = result_version(task_id)
+        if version is None or indexed.get(task_id) == version:
+            continue
+        result = load_result(task_id)
+        if result is None:
+            continue
+        index_result(task_id, result, version)
+        count += 1
+    return count
+
+
+_redis = None
+
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(Config.REDIS_URL)
+    return _redis
+
+
+def announce_result(task_id: str) -> None:
+    """List a saved result for indexing on the API machines (remote storage)"""
+    _get_redis().zadd(Config.SEARCH_RESULTS_KEY, {task_id: time.time()})
+
+
+def sync_from_storage() -> int:
+    """Index results announced since the last sync, fetching them from the store; returns how many.
+
+    Results whose indexed version is current are skipped, so overlapping syncs
+    (e.g. from several API processes on one machine) only cost a version check.
+    """
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT value FROM sync_state WHERE name = 'results'").fetchone()
+    finally:
+        conn.close()
+    synced_until = row[0] if row else None
+    since = synced_until - Config.SEARCH_SYNC_OVERLAP if synced_until is not None else "-inf"
+    entries = _get_redis().zrangebyscore(Config.SEARCH_RESULTS_KEY, since, "+inf", withscores=True)
+
+    count = 0
+    for member, saved_at in entries:
+        task_id = member.decode()
+        try:
+            version = result_version(task_id)
+            if version is not None and _indexed_version(task_id) != version:
+                result = load_result(task_id)
+                if result is not None:
+                    index_result(task_id, result, version)
+                    count += 1
+        except Exception as e:
+            # Retried on the next sync - results announced later wait behind it
+            print(f"Warning: Could not index task {task_id} from storage: {e}")
+            break
+        synced_until = saved_at if synced_until is None else max(synced_until, saved_at)
+
+    if synced_until is not None:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES ('results', ?)", (synced_until,))
+        finally:
+            conn.close()
+    return count
+
+
+def _indexed_version(task_id: str) -> Optional[str]:
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT version FROM documents WHERE task_id = ?", (task_id,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+if __name__ == "__main__":
+    from storage import get_storage
+
+    start = time.time()
+    count = index_missing()
+    if not get_storage().is_local:
+        count += sync_from_storage()
+    print(f"Indexed {count} results in {time.time() - start:.1f}s")
@@ -94,7 +94,7 @@ echo -e "\n${YELLOW}🔄 Starting Celery worker...${NC}"
 if pgrep -f "celery.*worker" > /dev/null; then
     echo -e "${GREEN}✅ Celery worker is already running${NC}"
 else
-    python -m celery -A tasks.celery_app worker --loglevel=info --detach
+    python -m celery -A tasks.celery_app worker --beat --loglevel=info --detach
     echo -e "${GREEN}✅ Celery worker started${NC}"
 fi
 
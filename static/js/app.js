@@ -3,7 +3,9 @@ class NurgaVoiceApp {
     constructor() {
         this.currentTaskId = null;
         this.websocket = null;
+        this.eventSource = null;
         this.isProcessing = false;
+        this.isPolling = false;
         this.processingStartTime = null;
         
         this.initializeElements();
@@ -41,6 +43,8 @@ class NurgaVoiceApp {
         // Download elements
         this.downloadTxt = document.getElementById('downloadTxt');
         this.downloadMd = document.getElementById('downloadMd');
+        this.downloadSrt = document.getElementById('downloadSrt');
+        this.downloadVtt = document.getElementById('downloadVtt');
         this.downloadPdf = document.getElementById('downloadPdf');
         
         // Error elements
@@ -56,6 +60,8 @@ class NurgaVoiceApp {
         this.uploadForm.addEventListener('submit', (e) => this.handleUpload(e));
         this.downloadTxt.addEventListener('click', () => this.downloadFile('txt'));
         this.downloadMd.addEventListener('click', () => this.downloadFile('md'));
+        this.downloadSrt.addEventListener('click', () => this.downloadFile('srt'));
+        this.downloadVtt.addEventListener('click', () => this.downloadFile('vtt'));
         this.downloadPdf.addEventListener('click', () => this.downloadFile('pdf'));
         this.fileInput.addEventListener('change', (e) => this.handleFileSelect(e));
         this.enableSummary.addEventListener('change', (e) => this.handleSummaryToggle(e));
@@ -204,6 +210,10 @@ class NurgaVoiceApp {
                         console.log('Upload successful, task ID:', data.task_id);
                         
                         this.currentTaskId = data.task_id;
+                        // Predicted from earlier jobs; progress updates refine it once a worker starts
+                        if (data.eta_seconds !== undefined) {
+                            this.updateProgress(0, `Queued - about ${this.formatDuration(Math.max(1, data.eta_seconds))} until done`);
+                        }
                         this.connectWebSocket();
                         resolve(data);
                     } else {
@@ -332,6 +342,12 @@ class NurgaVoiceApp {
             this.websocket.close();
             this.websocket = null;
         }
+        
+        // Close event stream
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
     }
 
     connectWebSocket() {
@@ -355,8 +371,8 @@ class NurgaVoiceApp {
             this.websocket = new WebSocket(wsUrl);
         } catch (error) {
             console.error('Failed to create WebSocket:', error);
-            // For ngrok, immediately fall back to polling
-            this.fallbackToPolling();
+            // For ngrok, immediately fall back to Server-Sent Events
+            this.connectEventSource();
             return;
         }
 
@@ -372,54 +388,97 @@ class NurgaVoiceApp {
         this.websocket.onclose = (event) => {
             console.log('WebSocket connection closed', event.code, event.reason);
             if (this.isProcessing) {
-                console.log('Falling back to polling due to WebSocket closure');
-                this.fallbackToPolling();
+                console.log('Falling back to Server-Sent Events due to WebSocket closure');
+                this.connectEventSource();
             }
         };
 
         this.websocket.onerror = (error) => {
             console.error('WebSocket error:', error);
             if (this.isProcessing) {
-                console.log('Falling back to polling due to WebSocket error');
-                // For ngrok or any WebSocket error, immediately fall back to polling
+                console.log('Falling back to Server-Sent Events due to WebSocket error');
+                // For ngrok or any WebSocket error, immediately fall back to Server-Sent Events
                 this.websocket = null; // Clear the websocket reference
+                this.connectEventSource();
+            }
+        };
+    }
+
+    connectEventSource() {
+        if (!this.currentTaskId || !this.isProcessing || this.eventSource || this.isPolling) return;
+        if (!window.EventSource) {
+            this.fallbackToPolling();
+            return;
+        }
+
+        // Plain HTTP stream of the same events as the WebSocket; the browser reconnects
+        // on its own and resumes from the last event ID it received
+        const url = `/events/${this.currentTaskId}?api_key=${encodeURIComponent(window.CONFIG.API_KEY)}`;
+        console.log('Connecting to event stream for task:', this.currentTaskId);
+        this.eventSource = new EventSource(url);
+
+        this.eventSource.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.state === 'SUCCESS' || data.state === 'FAILURE') {
+                // The server ends the stream after a final state - don't reconnect
+                this.eventSource.close();
+                this.eventSource = null;
+            }
+            this.handleStatusUpdate(data);
+        };
+
+        this.eventSource.onerror = () => {
+            // CLOSED means the browser gave up reconnecting (e.g. 401 or no SSE support on the proxy)
+            if (this.eventSource && this.eventSource.readyState === EventSource.CLOSED) {
+                console.log('Falling back to polling due to event stream error');
+                this.eventSource = null;
                 this.fallbackToPolling();
             }
         };
     }
 
-    fallbackToPolling() {
-        if (!this.currentTaskId || !this.isProcessing) return;
+    async fallbackToPolling() {
+        if (!this.currentTaskId || !this.isProcessing || this.isPolling) return;
 
-        console.log('Starting polling fallback for task:', this.currentTaskId);
+        console.log('Starting long-poll fallback for task:', this.currentTaskId);
+        this.isPolling = true;
         
-        const pollInterval = setInterval(async () => {
-            try {
-                const response = await fetch(`/status/${this.currentTaskId}`, {
-                    headers: {
-                        'X-API-Key': window.CONFIG.API_KEY
-                    }
-                });
+        // Long-poll: the server holds the request until the status changes (or ~25s pass)
+        // and answers 304 when nothing changed, so unchanged status costs no body
+        let etag = null;
+        try {
+            while (this.isProcessing) {
+                const headers = { 'X-API-Key': window.CONFIG.API_KEY };
+                if (etag) {
+                    headers['If-None-Match'] = etag;
+                }
+                
+                const response = await fetch(`/status/${this.currentTaskId}?wait=25`, { headers });
                 
+                if (response.status === 304) {
+                    continue;
+                }
                 if (!response.ok) {
                     throw new Error(`HTTP ${response.status}: ${response.statusText}`);
                 }
                 
+                etag = response.headers.get('ETag');
                 const data = await response.json();
                 console.log('Polling status:', data);
                 
                 this.handleStatusUpdate(data);
                 
                 if (data.state === 'SUCCESS' || data.state === 'FAILURE') {
-                    clearInterval(pollInterval);
+                    break;
                 }
-            } catch (error) {
-                console.error('Polling error:', error);
-                clearInterval(pollInterval);
-                this.showError(`Connection error: ${error.message}. Please try again.`);
-                this.stopProcessing();
             }
-        }, 2000);
+        } catch (error) {
+            console.error('Polling error:', error);
+            this.showError(`Connection error: ${error.message}. Please try again.`);
+            this.stopProcessing();
+        } finally {
+            this.isPolling = false;
+        }
     }
 
     handleWebSocketMessage(data) {
@@ -429,15 +488,60 @@ class NurgaVoiceApp {
     handleStatusUpdate(data) {
         switch (data.state) {
             case 'PROGRESS':
-                this.updateProgress(data.progress || 0, data.step || 'Processing...');
+                this.updateProgress(data.progress || 0, this.formatProgressStep(data));
                 break;
             case 'SUCCESS':
-                // Make sure we pass the actual result data
-                this.handleSuccess(data.result || data);
+                // The server closes the WebSocket after the final state - don't treat that as a failure
+                this.isProcessing = false;
+                // The status payload only carries a compact record; fetch the full result lazily
+                this.loadFullResult(data.result || data)
+                    .then(result => this.handleSuccess(result));
                 break;
             case 'FAILURE':
                 this.handleFailure(data.error);
                 break;
+            case 'PARTIAL':
+                // Newly transcribed segments; the full result is loaded on SUCCESS
+                console.log('Partial transcription:', data.segments);
+                break;
+        }
+    }
+
+    formatProgressStep(data) {
+        let message = data.step || 'Processing...';
+        
+        // Fine-grained updates report the processed audio position and an ETA
+        if (data.audio_position !== undefined && data.audio_duration) {
+            message += ` (${this.formatTime(data.audio_position)} / ${this.formatTime(data.audio_duration)})`;
+        }
+        if (data.eta_seconds !== undefined) {
+            message += ` - about ${this.formatDuration(Math.max(1, Math.round(data.eta_seconds)))} remaining`;
+        }
+        
+        return message;
+    }
+
+    async loadFullResult(record) {
+        if (!record || !record.result_url) {
+            return record;
+        }
+        
+        try {
+            const response = await fetch(record.result_url, {
+                headers: {
+                    'X-API-Key': window.CONFIG.API_KEY
+                }
+            });
+            
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+            
+            return await response.json();
+        } catch (error) {
+            console.error('Failed to load full result:', error);
+            // Fall back to the compact record so summary and metadata can still be shown
+            return record;
         }
     }
 
@@ -0,0 +1,114 @@
+"""
+Short-lived in-process cache of task status messages.
+
+Pollers, long-pollers and WebSocket viewers of the same task share one status
+read per TTL window, and concurrent misses collapse onto a single in-flight
+fetch. Every entry carries an ETag so unchanged status can be answered with
+304 Not Modified.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import Config
+from events import EventHub, FINAL_STATES, is_status_message
+
+
+@dataclass
+class CachedStatus:
+    message: dict
+    body: bytes
+    etag: str
+    fetched_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def is_final(self) -> bool:
+        return self.message.get('state') in FINAL_STATES
+
+    @classmethod
+    def from_message(cls, message: dict) -> "CachedStatus":
+        body = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        return cls(message=message, body=body, etag=etag)
+
+
+class StatusCache:
+    """TTL cache of status messages with request collapsing and change notification"""
+
+    def __init__(self, loader: Callable[[str], Awaitable[dict]], event_hub: EventHub,
+                 ttl: float = Config.STATUS_CACHE_TTL, max_entries: int = Config.STATUS_CACHE_MAX_ENTRIES):
+        self.loader = loader  # Async status read (must not block the event loop)
+        self.event_hub = event_hub
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, CachedStatus] = {}
+        self._fetches: Dict[str, asyncio.Task] = {}
+
+    async def get(self, task_id: str) -> CachedStatus:
+        """Return the cached status if fresh, otherwise fetch it (shared with concurrent callers)"""
+        entry = self._entries.get(task_id)
+        # Final states never change, so they stay valid for as long as they are cached
+        if entry is not None and (entry.is_final or time.monotonic() - entry.fetched_at < self.ttl):
+            return entry
+
+        fetch = self._fetches.get(task_id)
+        if fetch is None:
+            fetch = asyncio.create_task(self._fetch(task_id))
+            self._fetches[task_id] = fetch
+            fetch.add_done_callback(lambda _: self._fetches.pop(task_id, None))
+        return await fetch
+
+    def put(self, task_id: str, message: dict) -> CachedStatus:
+        """Store a status message received from elsewhere (e.g. a pushed event)"""
+        entry = CachedStatus.from_message(message)
+        if len(self._entries) >= self.max_entries:
+            self._prune()
+        self._entries[task_id] = entry
+        return entry
+
+    async def wait_for_change(self, task_id: str, etag: str, timeout: float) -> CachedStatus:
+        """Long-poll: wait until the task's status differs from `etag` or the timeout expires"""
+        changed = asyncio.Event()
+
+        async def on_event(message: dict, event_id: Optional[str] = None):
+            if not is_status_message(message):
+                return
+            self.put(task_id, message)
+            changed.set()
+
+        unsubscribe = self.event_hub.subscribe(task_id, on_event)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                entry = await self.get(task_id)
+                remaining = deadline - time.monotonic()
+                if entry.etag != etag or entry.is_final or remaining <= 0:
+                    return entry
+                # Pushed events wake us immediately; re-reading the backend periodically
+                # covers the case where the event subscription is unavailable
+                try:
+                    await asyncio.wait_for(changed.wait(), min(remaining, Config.STATUS_LONG_POLL_RECHECK))
+                except asyncio.TimeoutError:
+                    pass
+                changed.clear()
+        finally:
+            unsubscribe()
+
+    async def _fetch(self, task_id: str) -> CachedStatus:
+        message = await self.loader(task_id)
+        return self.put(task_id, message)
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for task_id, entry in list(self._entries.items()):
+            if now - entry.fetched_at >= self.ttl:
+                del self._entries[task_id]
+        # Still full: drop the oldest half
+        if len(self._entries) >= self.max_entries:
+            oldest = sorted(self._entries, key=lambda key: self._entries[key].fetched_at)
+            for task_id in oldest[:len(oldest) // 2]:
+                del self._entries[task_id]
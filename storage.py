@@ -0,0 +1,277 @@
+"""
+Storage backends for uploads, results and rendered exports.
+
+Objects are addressed by keys that mirror the local layout
+("uploads/<task_id>_<name>", "results/<task_id>.nvr",
+"results/exports/<task_id>/<version>.<fmt>"), so with the local backend a key
+is simply a path relative to the working directory and nothing changes on
+disk.
+
+With the S3 backend (AWS S3 or any S3-compatible store such as MinIO) the web
+process streams uploads into the bucket and workers fetch them from there, so
+API and workers can run on different machines without a shared filesystem.
+The local results/ directory then acts as a read-through cache of the bucket.
+"""
+
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from typing import IO, Iterator, NamedTuple, Optional
+
+from config import Config
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+
+class StoredObject(NamedTuple):
+    size: int
+    modified: float  # Unix time
+    etag: Optional[str] = None
+
+
+def _normalize_key(key: str) -> str:
+    """Key with "." / ".." resolved; keys that would leave the storage root are rejected"""
+    normalized = os.path.normpath(key).replace(os.sep, "/")
+    if os.path.isabs(normalized) or normalized == ".." or normalized.startswith("../"):
+        raise ValueError(f"Storage key outside the storage root: {key!r}")
+    return normalized
+
+
+def _replace_atomically(path: str) -> str:
+    """Temp path next to `path`; the caller os.replace()s it into place when complete"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+class LocalStorage:
+    """Objects are files under `root`"""
+
+    is_local = True
+
+    def __init__(self, root: str = "."):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, _normalize_key(key)))
+        root = os.path.abspath(self.root)
+        if os.path.commonpath([root, os.path.abspath(path)]) != root:
+            raise ValueError(f"Storage key outside the storage root: {key!r}")
+        return path
+
+    @contextmanager
+    def open_write(self, key: str) -> Iterator[IO[bytes]]:
+        """Writable file object; the object appears only once the block completes"""
+        path = self.path(key)
+        tmp_path = _replace_atomically(path)
+        try:
+            with open(tmp_path, "wb") as f:
+                yield f
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def upload_file(self, local_path: str, key: str) -> None:
+        path = self.path(key)
+        if os.path.abspath(local_path) == os.path.abspath(path):
+            return
+        tmp_path = _replace_atomically(path)
+        shutil.copyfile(local_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def download_file(self, key: str, local_path: str) -> None:
+        path = self.path(key)
+        if os.path.abspath(local_path) == os.path.abspath(path):
+            return
+        tmp_path = _replace_atomically(local_path)
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, local_path)
+
+    def local_copy(self, key: str) -> str:
+        """Local path of an object, fetching it first if needed (the file itself here)"""
+        return self.path(key)
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = Config.STORAGE_CHUNK_SIZE) -> Iterator[bytes]:
+        """Bytes [start, end) of an object, in chunks"""
+        with open(self.path(key), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            stat = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(stat.st_size, stat.st_mtime)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def presigned_url(self, key: str, filename: Optional[str] = None,
+                      expires: int = Config.STORAGE_PRESIGNED_EXPIRES) -> Optional[str]:
+        """Direct download URL for an object (None - local files are served by the API)"""
+        return None
+
+
+class _MultipartWriter:
+    """File-like writer that uploads to S3 in parts as data arrives, so large uploads are never held in memory"""
+
+    def __init__(self, client, bucket: str, key: str, part_size: int):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts = []
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
+        number = len(self._parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=number, Body=data
+        )
+        self._parts.append({"PartNumber": number, "ETag": response["ETag"]})
+
+    def complete(self) -> None:
+        if self._upload_id is None:
+            # Small object - a single PUT
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+            return
+        if self._buffer:
+            self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts}
+        )
+
+    def abort(self) -> None:
+        if self._upload_id is not None:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            except ClientError as e:
+                print(f"Warning: Could not abort multipart upload of {self.key}: {e}")
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket. Credentials come from the usual AWS environment/config."""
+
+    is_local = False
+
+    def __init__(self, bucket: str = Config.S3_BUCKET, prefix: str = Config.S3_PREFIX,
+                 endpoint_url: Optional[str] = Config.S3_ENDPOINT_URL, region: Optional[str] = Config.S3_REGION,
+                 part_size: int = Config.STORAGE_PART_SIZE):
+        if boto3 is None:
+            raise RuntimeError("The S3 storage backend requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.client = boto3.client(
+            "s3", endpoint_url=endpoint_url, region_name=region,
+            config=BotoConfig(signature_version="s3v4", s3={"addressing_style": "path" if endpoint_url else "auto"}),
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + _normalize_key(key)
+
+    @contextmanager
+    def open_write(self, key: str) -> Iterator[IO[bytes]]:
+        writer = _MultipartWriter(self.client, self.bucket, self._key(key), self.part_size)
+        try:
+            yield writer
+            writer.complete()
+        except BaseException:
+            writer.abort()
+            raise
+
+    def upload_file(self, local_path: str, key: str) -> None:
+        # Managed transfer - multipart with parallel parts for large files
+        self.client.upload_file(local_path, self.bucket, self._key(key))
+
+    def download_file(self, key: str, local_path: str) -> None:
+        tmp_path = _replace_atomically(local_path)
+        try:
+            self.client.download_file(self.bucket, self._key(key), tmp_path)
+            os.replace(tmp_path, local_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def local_copy(self, key: str) -> str:
+        """Download an object to the same relative path locally and return that path"""
+        local_path = os.path.normpath(_normalize_key(key))
+        self.download_file(key, local_path)
+        return local_path
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = Config.STORAGE_CHUNK_SIZE) -> Iterator[bytes]:
+        if end is not None and end <= start:
+            # "bytes=0--1" is not a valid range - nothing to read anyway
+            return
+        # Whole objects are read without a Range, which S3 rejects for empty objects
+        kwargs = {"Range": f"bytes={start}-{'' if end is None else end - 1}"} if start or end is not None else {}
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(key), **kwargs)["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return StoredObject(response["ContentLength"], response["LastModified"].timestamp(), response.get("ETag"))
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def presigned_url(self, key: str, filename: Optional[str] = None,
+                      expires: int = Config.STORAGE_PRESIGNED_EXPIRES) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if filename:
+            params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires)
+
+
+_storage = None
+
+
+def get_storage():
+    """The configured storage backend (created on first use)"""
+    global _storage
+    if _storage is None:
+        _storage = S3Storage() if Config.STORAGE_BACKEND == "s3" else LocalStorage()
+    return _storage
+
+
+def storage_key(path: str) -> str:
+    """Storage key of a path in the local layout (ValueError for paths outside it)"""
+    return _normalize_key(path)
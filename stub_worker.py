@@ -0,0 +1,132 @@
+"""
+Stand-in Celery worker for load testing the API tier.
+
+Registers a transcription task under the real task name that goes through
+the same motions as tasks.transcribe_and_summarize - throttled progress
+updates, a stored result, pushed completion events, upload cleanup - but
+sleeps instead of running Whisper and the LLM. API latency measured against
+it is API overhead only, not model time.
+
+    STUB_JOB_SECONDS=5 STUB_SEGMENTS=500 celery -A stub_worker worker --pool threads -c 32
+
+Run it instead of the real worker (never alongside it: both consume the
+same queue).
+"""
+
+import os
+import time
+from typing import Dict, Any
+
+from celery.signals import task_success, task_failure
+from task_queue import celery_app, TRANSCRIBE_TASK, RENDER_EXPORTS_TASK
+from config import Config
+from results_store import save_result, build_result_record
+from exports import prerender_exports
+from storage import get_storage
+from progress import ProgressReporter
+from events import publish_event, success_message, failure_message
+from eta import finish_job
+
+# Keep the real task implementations (and whisperx/torch/llama.cpp) out of this worker
+celery_app.conf.include = []
+
+STUB_JOB_SECONDS = float(os.getenv("STUB_JOB_SECONDS", "5"))
+STUB_SEGMENTS = int(os.getenv("STUB_SEGMENTS", "200"))
+STUB_SEGMENT_SECONDS = 4.0
+
+# Same stages and progress percentages as the real pipeline, with their share of the job time
+STAGES = [
+    ("Loading models", 10, 0.02),
+    ("Processing file", 20, 0.03),
+    ("Loading audio", 30, 0.05),
+    ("Transcribing", 40, 0.5),
+    ("Aligning transcript", 60, 0.2),
+    ("Generating summary", 80, 0.15),
+    ("Finalizing", 90, 0.05),
+]
+TRACKED_STAGES = {"Transcribing": 60, "Aligning transcript": 80}
+
+
+def stub_result(file_name: str, segments: int = STUB_SEGMENTS) -> Dict[str, Any]:
+    """A synthetic result of the size of a real one with `segments` segments"""
+    segment_list = []
+    for index in range(segments):
+        start = index * STUB_SEGMENT_SECONDS
+        words = [
+            {"word": f"word{n}", "start": start + n * 0.4, "end": start + n * 0.4 + 0.3, "score": 0.9}
+            for n in range(8)
+        ]
+        segment_list.append({
+            "start": start,
+            "end": start + STUB_SEGMENT_SECONDS - 0.5,
+            "text": " ".join(word["word"] for word in words),
+            "words": words,
+        })
+    duration = segments * STUB_SEGMENT_SECONDS
+    return {
+        "transcription": {
+            "text": " ".join(segment["text"] for segment in segment_list),
+            "segments": segment_list,
+            "language": "en",
+        },
+        "summary": "Stub summary for load testing.",
+        "metadata": {
+            "file_name": file_name,
+            "language": "en",
+            "summary_length": "medium",
+            "summary_enabled": True,
+            "summary_requested": True,
+            "duration": duration,
+            "auto_disabled_reason": None,
+        },
+    }
+
+
+@celery_app.task(bind=True, name=TRANSCRIBE_TASK)
+def stub_transcribe_and_summarize(
+    self, file_path: str, language: str = "auto", summary_length: str = "medium", enable_summary: bool = True,
+    profile: bool = False,
+) -> Dict[str, Any]:
+    """Simulated transcription job"""
+    progress = ProgressReporter(self)
+    total_audio = STUB_SEGMENTS * STUB_SEGMENT_SECONDS
+    for step, start, share in STAGES:
+        seconds = STUB_JOB_SECONDS * share
+        if step in TRACKED_STAGES:
+            # Fine-grained updates as the real transcription/alignment loops send them
+            stage = progress.track(step, start, TRACKED_STAGES[step], total_audio)
+            ticks = max(1, int(seconds / 0.1))
+            for tick in range(1, ticks + 1):
+                time.sleep(seconds / ticks)
+                stage.update(total_audio * tick / ticks)
+            stage.finish()
+        else:
+            progress.stage(step, start)
+            time.sleep(seconds)
+
+    result = stub_result(os.path.basename(file_path))
+    save_result(self.request.id, result)
+    if Config.EXPORT_PRERENDER_FORMATS:
+        render_exports.delay(self.request.id)
+    try:
+        get_storage().delete(file_path)
+    except Exception as e:
+        print(f"Warning: Could not delete uploaded file {file_path}: {e}")
+    # Keep the API's queue wait estimate (and admission) honest
+    finish_job(self.request.id)
+    return build_result_record(self.request.id, result)
+
+
+@celery_app.task(name=RENDER_EXPORTS_TASK)
+def render_exports(task_id: str):
+    prerender_exports(task_id, Config.EXPORT_PRERENDER_FORMATS)
+
+
+@task_success.connect(sender=stub_transcribe_and_summarize)
+def publish_task_success(sender=None, result=None, **kwargs):
+    publish_event(sender.request.id, success_message(result))
+
+
+@task_failure.connect(sender=stub_transcribe_and_summarize)
+def publish_task_failure(sender=None, task_id=None, exception=None, **kwargs):
+    publish_event(task_id, failure_message(exception))
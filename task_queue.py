@@ -0,0 +1,58 @@
+"""
+Celery app and task signatures shared by the web process and the worker.
+
+The web process only enqueues jobs and reads their state, so it imports this
+module instead of tasks.py. tasks.py (imported by workers only) pulls in
+whisperx, torch and llama.cpp and registers the task implementations on this
+app under the names below.
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+from celery import Celery
+from celery.result import AsyncResult
+from config import Config
+
+TRANSCRIBE_TASK = "tasks.transcribe_and_summarize"
+RENDER_EXPORTS_TASK = "tasks.render_exports"
+JANITOR_TASK = "tasks.run_janitor"
+
+celery_app = Celery(
+    "transcription_tasks",
+    broker=Config.CELERY_BROKER_URL,
+    backend=Config.CELERY_RESULT_BACKEND,
+    include=["tasks"],  # Loaded by workers only
+)
+
+# Worker pool: with the "threads" pool all concurrent tasks share the models loaded
+# once in this process instead of each prefork child loading its own copy
+celery_app.conf.update(
+    worker_pool=Config.CELERY_WORKER_POOL,
+    worker_concurrency=Config.CELERY_WORKER_CONCURRENCY,
+    worker_prefetch_multiplier=1,  # Long jobs - don't let one thread hoard queued tasks
+    # Run by the embedded scheduler (`celery worker --beat`) or a separate `celery beat`
+    beat_schedule={
+        "storage-janitor": {"task": JANITOR_TASK, "schedule": Config.JANITOR_INTERVAL},
+    },
+)
+
+
+def enqueue_transcription(file_path: str, language: str = "auto", summary_length: str = "medium",
+                          enable_summary: bool = True, task_id: Optional[str] = None,
+                          profile: bool = False, priority: Optional[int] = None) -> AsyncResult:
+    """Queue a transcribe_and_summarize job by name, without importing the worker code.
+
+    `priority` orders queued jobs (0 first, see eta.scheduling_priority); None keeps the default.
+    """
+    kwargs: Dict[str, Any] = {
+        "file_path": file_path,
+        "language": language,
+        "summary_length": summary_length,
+        "enable_summary": enable_summary,
+    }
+    if profile:
+        kwargs["profile"] = True
+    # The worker reads the enqueue time from the headers to measure queue wait
+    return celery_app.send_task(TRANSCRIBE_TASK, kwargs=kwargs, task_id=task_id, headers={"enqueued_at": time.time()},
+                                priority=priority)
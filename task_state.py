@@ -0,0 +1,85 @@
+"""
+Non-blocking reads of Celery task state for the web process.
+
+`AsyncResult(...).state` is a synchronous Redis round-trip, which stalls the
+event loop when called from an async handler. TaskStateReader reads the
+result backend key directly through an async Redis connection pool, decodes
+large payloads in a worker thread, and falls back to the synchronous
+AsyncResult path in a thread executor if the backend is not Redis or the
+async read fails.
+"""
+
+import asyncio
+from typing import Any, Callable, Dict
+
+import redis.asyncio as aioredis
+from config import Config
+from events import progress_message, success_message, failure_message
+
+
+def state_message(state: str, info: Any) -> dict:
+    """Build the client-facing message for a task state and its result/meta"""
+    if state == 'PENDING':
+        return {
+            'state': state,
+            'status': 'Task is waiting to be processed'
+        }
+    elif state == 'PROGRESS':
+        return progress_message(info or {})
+    elif state == 'SUCCESS':
+        return success_message(info)
+    else:  # FAILURE
+        return failure_message(info)
+
+
+class TaskStateReader:
+    """Read task state messages from the Celery result backend without blocking the event loop"""
+
+    def __init__(self, celery_app, fallback: Callable[[str], dict],
+                 max_connections: int = Config.STATUS_REDIS_MAX_CONNECTIONS,
+                 decode_inline_max_bytes: int = Config.STATUS_DECODE_INLINE_MAX_BYTES):
+        self.celery_app = celery_app
+        self.fallback = fallback  # Synchronous AsyncResult-based read, run in a worker thread
+        self.max_connections = max_connections
+        self.decode_inline_max_bytes = decode_inline_max_bytes
+        self._redis = None
+
+    @property
+    def backend_is_redis(self) -> bool:
+        return str(self.celery_app.conf.result_backend or "").startswith(("redis://", "rediss://"))
+
+    def _client(self):
+        if self._redis is None:
+            pool = aioredis.ConnectionPool.from_url(
+                self.celery_app.conf.result_backend, max_connections=self.max_connections
+            )
+            self._redis = aioredis.Redis(connection_pool=pool)
+        return self._redis
+
+    async def read(self, task_id: str) -> dict:
+        """Return the client-facing status message of a task"""
+        if self.backend_is_redis:
+            try:
+                return await self._read_redis(task_id)
+            except Exception as e:
+                print(f"Warning: Async status read failed for task {task_id}, using fallback: {e}")
+        return await asyncio.to_thread(self.fallback, task_id)
+
+    async def _read_redis(self, task_id: str) -> dict:
+        backend = self.celery_app.backend
+        payload = await self._client().get(backend.get_key_for_task(task_id))
+        if payload is None:
+            # Unknown tasks are PENDING, as with AsyncResult
+            return state_message('PENDING', None)
+
+        # Small progress payloads decode quickly; keep large results off the event loop
+        if len(payload) > self.decode_inline_max_bytes:
+            meta: Dict[str, Any] = await asyncio.to_thread(backend.decode_result, payload)
+        else:
+            meta = backend.decode_result(payload)
+        return state_message(meta['status'], meta.get('result'))
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
@@ -1,24 +1,54 @@
-from celery import Celery
+from celery.signals import task_success, task_failure
 import whisperx
 import os
-import json
 from pathlib import Path
 from typing import Dict, Any
 import subprocess
+import threading
 import traceback
 from llama_cpp import Llama
 from config import Config
-
-# Initialize Celery
-celery_app = Celery(
-    "transcription_tasks",
-    broker=Config.CELERY_BROKER_URL,
-    backend=Config.CELERY_RESULT_BACKEND,
-)
+from results_store import save_result, build_result_record
+from exports import prerender_exports
+from search_index import announce_result, index_result
+from janitor import clean_storage, record_janitor_run
+from storage import get_storage
+from progress import ProgressReporter
+from metrics import JobTimings
+from profiling import JobProfiler, should_profile
+from eta import JobEstimate, load_cost_model, job_features, worker_type, record_job, start_job, finish_job
+from events import publish_event, success_message, failure_message
+from transcription import transcribe_with_progress, align_with_progress
+from batching import TranscriptionBatcher
+# Worker-side task implementations; the app itself lives in task_queue so the web process
+# can enqueue jobs without importing whisperx/torch/llama.cpp
+from task_queue import celery_app, TRANSCRIBE_TASK, RENDER_EXPORTS_TASK, JANITOR_TASK
 
 # Global variables for loaded models
 whisper_model = None
 llm_model = None  # Renamed from llama_model to be more generic
+align_models = {}  # Alignment models cached per language code
+align_locks = {}  # One inference lock per cached alignment model
+transcription_batcher = None  # Shared decode batches across concurrent jobs
+
+# Locks for sharing one copy of each model between worker threads.
+# Loading is guarded so concurrent tasks never load a model twice, and inference
+# on the shared Whisper/LLM instances is serialized since neither is safe to call
+# from several threads at once (the pipeline keeps per-call tokenizer state).
+# Alignment models are serialized per language in align_locks: jobs in different
+# languages use different models and can align at the same time.
+model_load_lock = threading.Lock()
+whisper_lock = threading.Lock()
+llm_lock = threading.Lock()
+
+
+def cleanup_upload(file_key: str, description: str = "uploaded file") -> None:
+    """Delete an upload from storage with error handling"""
+    try:
+        get_storage().delete(file_key)
+        print(f"Deleted {description}: {file_key}")
+    except Exception as e:
+        print(f"Warning: Could not delete {description} {file_key}: {e}")
 
 
 def cleanup_file(file_path: str, description: str = "file") -> None:
@@ -35,20 +65,33 @@ def load_whisper_model():
     """Load WhisperX model if not already loaded"""
     global whisper_model
     if whisper_model is None:
-        try:
-            device = "cuda" if os.system("nvidia-smi") == 0 else "cpu"
-            print(f"Running Whisper model on: {device}")
-            compute_type = "float16" if device == "cuda" else "int8"
-            whisper_model = whisperx.load_model(
-                Config.WHISPER_MODEL, device, compute_type=compute_type
-            )
-        except Exception as e:
-            print(f"Error loading Whisper model: {e}")
-            # Fallback to CPU
-            whisper_model = whisperx.load_model(Config.WHISPER_MODEL, "cpu")
+        with model_load_lock:
+            # Re-check: another thread may have loaded it while we waited
+            if whisper_model is None:
+                try:
+                    device = "cuda" if os.system("nvidia-smi") == 0 else "cpu"
+                    print(f"Running Whisper model on: {device}")
+                    compute_type = "float16" if device == "cuda" else "int8"
+                    whisper_model = whisperx.load_model(
+                        Config.WHISPER_MODEL, device, compute_type=compute_type
+                    )
+                except Exception as e:
+                    print(f"Error loading Whisper model: {e}")
+                    # Fallback to CPU
+                    whisper_model = whisperx.load_model(Config.WHISPER_MODEL, "cpu")
     return whisper_model
 
 
+def get_transcription_batcher(model):
+    """Create the cross-job transcription batcher for the shared Whisper model"""
+    global transcription_batcher
+    if transcription_batcher is None:
+        with model_load_lock:
+            if transcription_batcher is None:
+                transcription_batcher = TranscriptionBatcher(model, whisper_lock)
+    return transcription_batcher
+
+
 def load_llama_model(model_name: str | None = None):
     """Load LLM model (Gemma, Llama, etc.) if not already loaded"""
     global llm_model
@@ -64,71 +107,84 @@ def load_llama_model(model_name: str | None = None):
         context_size = Config.LLAMA_MODEL_CONTEXT_SIZE
         threads = Config.LLAMA_MODEL_THREADS
     
-    if llm_model is None and os.path.exists(model_path):
-        try:
-            print(f"Loading LLM model from: {model_path}")
-            
-            # Detect GPU availability
-            gpu_layers = 0
+    with model_load_lock:
+        if llm_model is None and os.path.exists(model_path):
             try:
-                import GPUtil
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    print(f"🎮 GPU detected: {gpus[0].name} (Memory: {gpus[0].memoryTotal}MB)")
-                    # Use GPU layers based on available VRAM
-                    if gpus[0].memoryTotal > 8000:  # > 8GB VRAM
-                        gpu_layers = -1  # Use all layers on GPU
-                        print("🚀 Using ALL layers on GPU (high VRAM)")
-                    elif gpus[0].memoryTotal > 4000:  # > 4GB VRAM
-                        gpu_layers = 20  # Use partial layers
-                        print("🚀 Using 20 layers on GPU (medium VRAM)")
-                    else:
-                        gpu_layers = 10  # Use fewer layers
-                        print("🚀 Using 10 layers on GPU (low VRAM)")
-                else:
-                    print("💻 No GPU detected, using CPU only")
-            except ImportError:
-                # Try alternative GPU detection
+                print(f"Loading LLM model from: {model_path}")
+            
+                # Detect GPU availability
+                gpu_layers = 0
                 try:
-                    result = subprocess.run(["nvidia-smi"], capture_output=True, text=True)
-                    if result.returncode == 0:
-                        print("🎮 NVIDIA GPU detected via nvidia-smi")
-                        gpu_layers = 20  # Conservative default
-                        print("🚀 Using 20 layers on GPU")
+                    import GPUtil
+                    gpus = GPUtil.getGPUs()
+                    if gpus:
+                        print(f"🎮 GPU detected: {gpus[0].name} (Memory: {gpus[0].memoryTotal}MB)")
+                        # Use GPU layers based on available VRAM
+                        if gpus[0].memoryTotal > 8000:  # > 8GB VRAM
+                            gpu_layers = -1  # Use all layers on GPU
+                            print("🚀 Using ALL layers on GPU (high VRAM)")
+                        elif gpus[0].memoryTotal > 4000:  # > 4GB VRAM
+                            gpu_layers = 20  # Use partial layers
+                            print("🚀 Using 20 layers on GPU (medium VRAM)")
+                        else:
+                            gpu_layers = 10  # Use fewer layers
+                            print("🚀 Using 10 layers on GPU (low VRAM)")
                     else:
-                        print("💻 No NVIDIA GPU detected, using CPU only")
-                except FileNotFoundError:
-                    print("💻 nvidia-smi not found, using CPU only")
+                        print("💻 No GPU detected, using CPU only")
+                except ImportError:
+                    # Try alternative GPU detection
+                    try:
+                        result = subprocess.run(["nvidia-smi"], capture_output=True, text=True)
+                        if result.returncode == 0:
+                            print("🎮 NVIDIA GPU detected via nvidia-smi")
+                            gpu_layers = 20  # Conservative default
+                            print("🚀 Using 20 layers on GPU")
+                        else:
+                            print("💻 No NVIDIA GPU detected, using CPU only")
+                    except FileNotFoundError:
+                        print("💻 nvidia-smi not found, using CPU only")
             
-            llm_model = Llama(
-                model_path=model_path,
-                n_ctx=context_size,
-                n_threads=threads,
-                n_gpu_layers=gpu_layers,  # Enable GPU acceleration
-                # verbose=True,  # Enable verbose to see GPU usage
-                # Additional optimizations
-                n_batch=512,  # Batch size for processing
-                use_mmap=True,  # Use memory mapping for faster loading
-                use_mlock=False,  # Don't lock model in RAM (allows swapping)
-            )
+                llm_model = Llama(
+                    model_path=model_path,
+                    n_ctx=context_size,
+                    n_threads=threads,
+                    n_gpu_layers=gpu_layers,  # Enable GPU acceleration
+                    # verbose=True,  # Enable verbose to see GPU usage
+                    # Additional optimizations
+                    n_batch=512,  # Batch size for processing
+                    use_mmap=True,  # Use memory mapping for faster loading
+                    use_mlock=False,  # Don't lock model in RAM (allows swapping)
+                )
             
-            if gpu_layers > 0:
-                print(f"✅ Successfully loaded LLM model with {gpu_layers} GPU layers")
-            else:
-                print("✅ Successfully loaded LLM model on CPU only")
-            print(f"📊 Context size: {context_size}")
+                if gpu_layers > 0:
+                    print(f"✅ Successfully loaded LLM model with {gpu_layers} GPU layers")
+                else:
+                    print("✅ Successfully loaded LLM model on CPU only")
+                print(f"📊 Context size: {context_size}")
             
-        except Exception as e:
-            print(f"❌ Error loading LLM model: {e}")
-            print(f"Make sure the model file exists at: {model_path}")
-            print("You can download models from: https://huggingface.co/models")
-    elif not os.path.exists(model_path):
-        print(f"❌ LLM model not found at: {model_path}")
-        print("Please download a compatible model file.")
+            except Exception as e:
+                print(f"❌ Error loading LLM model: {e}")
+                print(f"Make sure the model file exists at: {model_path}")
+                print("You can download models from: https://huggingface.co/models")
+        elif not os.path.exists(model_path):
+            print(f"❌ LLM model not found at: {model_path}")
+            print("Please download a compatible model file.")
     
     return llm_model
 
 
+def load_align_model(language_code: str, device):
+    """Load the alignment model for a language, reusing it across tasks"""
+    if language_code not in align_models:
+        with model_load_lock:
+            if language_code not in align_models:
+                align_models[language_code] = whisperx.load_align_model(
+                    language_code=language_code, device=device
+                )
+                align_locks[language_code] = threading.Lock()
+    return align_models[language_code]
+
+
 def convert_to_audio(file_path: str) -> str:
     """Convert video to audio using ffmpeg"""
     audio_path = file_path.rsplit(".", 1)[0] + "_audio.wav"
@@ -184,13 +240,14 @@ def generate_summary(text: str, length: str = "medium") -> str:
         except Exception:
             pass
         
-        response = llama(
-            prompt,
-            max_tokens=512 if length == "long" else 256,
-            temperature=0.7,
-            stop=["<end_of_turn>", "<start_of_turn>"],
-            stream=False  # Ensure we get a complete response, not a stream
-        )
+        with llm_lock:
+            response = llama(
+                prompt,
+                max_tokens=512 if length == "long" else 256,
+                temperature=0.7,
+                stop=["<end_of_turn>", "<start_of_turn>"],
+                stream=False  # Ensure we get a complete response, not a stream
+            )
         
         # Check GPU memory after inference
         try:
@@ -215,47 +272,83 @@ def generate_summary(text: str, length: str = "medium") -> str:
         return f"Error generating summary: {e}"
 
 
-@celery_app.task(bind=True)
+@celery_app.task(bind=True, name=TRANSCRIBE_TASK)
 def transcribe_and_summarize(
-    self, file_path: str, language: str = "auto", summary_length: str = "medium", enable_summary: bool = True
+    self, file_path: str, language: str = "auto", summary_length: str = "medium", enable_summary: bool = True,
+    profile: bool = False,
 ) -> Dict[str, Any]:
-    """Main task for transcription and summarization"""
+    """Main task for transcription and summarization.
+
+    `file_path` is the storage key of the upload - with local storage, its path.
+    With `profile` (or when picked by PROFILE_SAMPLE_RATE) the job runs under the profilers.
+    """
+    file_key = file_path
+    # Queue wait comes from the enqueue time that enqueue_transcription puts in the message headers
+    timings = JobTimings(enqueued_at=getattr(self.request, "enqueued_at", None))
+    audio_duration = None
+    profiler = JobProfiler(self.request.id) if should_profile(profile) else None
+    if profiler is not None:
+        try:
+            profiler.start()
+        except Exception as e:
+            # Profiling must never fail the job - run it unprofiled
+            print(f"Warning: Could not start profiling task {self.request.id}: {e}")
+            profiler.stop()
+            profiler = None
     try:
+        # The upload may have been stored from another machine - work on a local copy
+        with timings.stage("fetch"):
+            file_path = get_storage().local_copy(file_key)
+        file_size = os.path.getsize(file_path)
+
+        # Stage times predicted from earlier jobs drive the ETA and progress sent to clients
+        estimate = JobEstimate(load_cost_model(), job_features(file_path), file_size, enable_summary, timings)
+        start_job(self.request.id, estimate.total)
+        progress = ProgressReporter(self, estimate=estimate)
+
         # Update task state
-        self.update_state(
-            state="PROGRESS", meta={"step": "Loading models", "progress": 10}
-        )
+        progress.stage("Loading models", 10)
 
         # Load Whisper model
-        model = load_whisper_model()
+        with timings.stage("load_models"):
+            model = load_whisper_model()
+        estimate.refine(worker=worker_type(model.device))
 
         # Check if file is video and convert to audio
-        self.update_state(
-            state="PROGRESS", meta={"step": "Processing file", "progress": 20}
-        )
+        progress.stage("Processing file", 20)
 
         file_ext = Path(file_path).suffix.lower()
         if file_ext in [".mp4", ".avi"]:
-            audio_path = convert_to_audio(file_path)
+            with timings.stage("decode"):
+                audio_path = convert_to_audio(file_path)
         else:
             audio_path = file_path
 
         # Load audio
-        self.update_state(
-            state="PROGRESS", meta={"step": "Loading audio", "progress": 30}
-        )
-        audio = whisperx.load_audio(audio_path)
-
-        # Transcribe
-        self.update_state(
-            state="PROGRESS", meta={"step": "Transcribing", "progress": 40}
-        )
-
-        transcribe_options = {}
-        if language != "auto":
-            transcribe_options["language"] = language
-
-        result = model.transcribe(audio, batch_size=16, **transcribe_options)
+        progress.stage("Loading audio", 30)
+        with timings.stage("load_audio"):
+            audio = whisperx.load_audio(audio_path)
+        total_audio = len(audio) / 16000
+        estimate.refine(audio_seconds=total_audio)
+        start_job(self.request.id, estimate.total)
+
+        # Transcribe, reporting the audio position of each decoded chunk
+        stage = progress.track("Transcribing", 40, 60, total_audio)
+        transcribe_language = language if language != "auto" else None
+        with timings.stage("transcribe"):
+            if Config.TRANSCRIBE_CROSS_JOB_BATCHING:
+                # Speech chunks of concurrent jobs are decoded together in shared batches
+                result = get_transcription_batcher(model).transcribe(
+                    audio, language=transcribe_language, on_progress=stage.update, on_segment=progress.add_partial
+                )
+            else:
+                with whisper_lock:
+                    result = transcribe_with_progress(
+                        model, audio, batch_size=Config.TRANSCRIBE_BATCH_SIZE,
+                        language=transcribe_language, on_progress=stage.update,
+                        on_segment=progress.add_partial,
+                    )
+        stage.finish()
         
         # Extract language - WhisperX should return it in the result dict
         detected_language = 'unknown'
@@ -269,22 +362,22 @@ def transcribe_and_summarize(
             detected_language = 'unknown'
 
         # Align transcript (for better timestamps)
-        self.update_state(
-            state="PROGRESS", meta={"step": "Aligning transcript", "progress": 60}
-        )
+        stage = progress.track("Aligning transcript", 60, 80, total_audio)
         try:
-            model_a, metadata = whisperx.load_align_model(
-                language_code=detected_language, device=model.device
-            )
-            aligned_result = whisperx.align(
-                result["segments"], model_a, metadata, audio, str(model.device)
-            )
+            with timings.stage("align"):
+                model_a, metadata = load_align_model(detected_language, model.device)
+                with align_locks[detected_language]:
+                    aligned_result = align_with_progress(
+                        result["segments"], model_a, metadata, audio, str(model.device),
+                        on_progress=stage.update,
+                    )
             # Update result with aligned segments, but preserve the original language info
-            result["segments"] = aligned_result["segments"] if "segments" in aligned_result else aligned_result
+            result["segments"] = aligned_result["segments"]
             print(f"Alignment completed, preserved language: {detected_language}")
         except Exception as e:
             print(f"Alignment failed: {e}")
             # Continue without alignment
+        stage.finish()
 
         # Extract text and segments
         full_text = " ".join([segment["text"] for segment in result["segments"]])
@@ -301,24 +394,19 @@ def transcribe_and_summarize(
 
         # Generate summary (conditional)
         if enable_summary:
-            self.update_state(
-                state="PROGRESS", meta={"step": "Generating summary", "progress": 80}
-            )
-            summary = generate_summary(full_text, summary_length)
+            progress.stage("Generating summary", 80)
+            with timings.stage("summarize"):
+                summary = generate_summary(full_text, summary_length)
         else:
             if original_enable_summary and audio_duration is not None and audio_duration < 30:
-                self.update_state(
-                    state="PROGRESS", meta={"step": "Skipping summary (audio too short)", "progress": 80}
-                )
+                progress.stage("Skipping summary (audio too short)", 80)
                 summary = f"Summary generation was automatically disabled because the audio is only {audio_duration:.1f} seconds long (minimum 30 seconds required)."
             else:
-                self.update_state(
-                    state="PROGRESS", meta={"step": "Skipping summary (disabled)", "progress": 80}
-                )
+                progress.stage("Skipping summary (disabled)", 80)
                 summary = "Summary generation was disabled by user."
 
         # Prepare result
-        self.update_state(state="PROGRESS", meta={"step": "Finalizing", "progress": 90})
+        progress.stage("Finalizing", 90)
 
         final_result = {
             "transcription": {
@@ -335,35 +423,99 @@ def transcribe_and_summarize(
                 "summary_requested": original_enable_summary,  # This shows what the user originally requested
                 "duration": audio_duration,
                 "auto_disabled_reason": "Audio too short (< 30 seconds)" if original_enable_summary and not enable_summary and audio_duration is not None and audio_duration < 30 else None,
+                "timings": timings.as_dict(audio_duration),
+                "profiled": profiler is not None,
             },
         }
 
-        # Save result to file
-        result_file = os.path.join(Config.RESULTS_DIR, f"{self.request.id}.json")
-        with open(result_file, "w", encoding="utf-8") as f:
-            json.dump(final_result, f, ensure_ascii=False, indent=2)
+        # Save the full result to the results store
+        with timings.stage("save"):
+            save_result(self.request.id, final_result)
+            try:
+                if get_storage().is_local:
+                    index_result(self.request.id, final_result)
+                else:
+                    # The API machines index it from the store
+                    announce_result(self.request.id)
+            except Exception as e:
+                # Search is best-effort; `python search_index.py` picks up results missed here
+                print(f"Warning: Could not add task {self.request.id} to the search index: {e}")
+        # The stored result's breakdown ends before saving; the task record and histograms include it
+        final_result["metadata"]["timings"] = timings.as_dict(audio_duration)
+        if profiler is None:
+            # Profiler overhead would skew the histograms and the cost model
+            timings.record("success", audio_duration)
+            record_job(estimate.features, timings.stages, audio_duration, file_size)
+        if Config.EXPORT_PRERENDER_FORMATS:
+            # Render downloads in the background so the first download is served from the cache
+            render_exports.delay(self.request.id)
 
         # Cleanup temporary files
         if audio_path != file_path:
             cleanup_file(audio_path, "temporary audio file")
 
         # Cleanup uploaded file if configured to do so
+        if not get_storage().is_local:
+            cleanup_file(file_path, "local copy of uploaded file")
         if Config.DELETE_UPLOADED_FILES_AFTER_PROCESSING:
-            cleanup_file(file_path, "uploaded file")
+            cleanup_upload(file_key)
 
-        # Return the final result (don't call update_state with SUCCESS - Celery handles that automatically)
-        return final_result
+        # Return only a compact record - the full result (segments, word timings) stays in the
+        # results store so Redis memory and /status latency don't grow with the recording length.
+        # Don't call update_state with SUCCESS - Celery handles that automatically
+        return build_result_record(self.request.id, final_result)
 
     except Exception as e:
         error_msg = f"Error during transcription: {str(e)}"
         traceback.print_exc()
+        if profiler is None:
+            timings.record("failure", audio_duration)
         
         # Cleanup uploaded file even on failure if configured to do so
+        if not get_storage().is_local:
+            cleanup_file(file_path, "local copy of uploaded file")
         if Config.DELETE_UPLOADED_FILES_AFTER_PROCESSING:
-            cleanup_file(file_path, "uploaded file after error")
+            cleanup_upload(file_key, "uploaded file after error")
         
         self.update_state(
             state="FAILURE",
             meta={"error": error_msg, "traceback": traceback.format_exc()},
         )
         raise Exception(error_msg)
+
+    finally:
+        finish_job(self.request.id)
+        # Before the task finishes, so the artifacts exist once clients see the final state
+        if profiler is not None:
+            profiler.stop()
+
+
+@celery_app.task(name=RENDER_EXPORTS_TASK)
+def render_exports(task_id: str):
+    """Render the configured export formats of a finished task into the export cache"""
+    prerender_exports(task_id, Config.EXPORT_PRERENDER_FORMATS)
+
+
+@celery_app.task(name=JANITOR_TASK)
+def run_janitor():
+    """Apply retention TTLs and disk quotas to uploads, results and cached exports"""
+    summary = clean_storage()
+    print(f"🧹 Janitor removed {summary['removed_files']} files, reclaimed "
+          f"{summary['reclaimed_bytes'] / (1024 * 1024):.1f} MB in {summary['duration']}s")
+    try:
+        record_janitor_run(summary)
+    except Exception as e:
+        print(f"Warning: Could not record janitor stats: {e}")
+    return summary
+
+
+@task_success.connect(sender=transcribe_and_summarize)
+def publish_task_success(sender=None, result=None, **kwargs):
+    """Push completion to watching clients once the result is stored in the backend"""
+    publish_event(sender.request.id, success_message(result))
+
+
+@task_failure.connect(sender=transcribe_and_summarize)
+def publish_task_failure(sender=None, task_id=None, exception=None, **kwargs):
+    """Push failure to watching clients once the state is stored in the backend"""
+    publish_event(task_id, failure_message(exception))
@@ -0,0 +1,70 @@
+"""Tests for response compression and precompressed export variants (run with pytest)"""
+
+import asyncio
+import gzip
+
+import pytest
+
+from compression import ENCODINGS, compressed_variant, negotiate_encoding, write_compressed_variants
+from exports import ExportRenderer
+
+TEXT = "Привет мир. Hello world.\n" * 2000
+
+
+@pytest.fixture
+def export_file(tmp_path):
+    path = tmp_path / "v1.txt"
+    path.write_text(TEXT, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("gzip", "gzip"),
+    ("identity", None),
+    ("gzip;q=0, *;q=0", None),
+    ("*", ENCODINGS[0]),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+def test_variants_are_only_looked_up(export_file):
+    assert compressed_variant(export_file, "gzip") is None
+    write_compressed_variants(export_file)
+    variant = compressed_variant(export_file, "gzip")
+    with gzip.open(variant, "rt", encoding="utf-8") as f:
+        assert f.read() == TEXT
+    if "br" in ENCODINGS:
+        import brotli
+        with open(compressed_variant(export_file, "br"), "rb") as f:
+            assert brotli.decompress(f.read()).decode("utf-8") == TEXT
+
+
+def test_precompress_runs_once_per_file(export_file):
+    async def scenario():
+        renderer = ExportRenderer(max_workers=1, max_queued=2)
+        try:
+            renderer.precompress(export_file)
+            future = renderer._compressing[export_file]
+            # Concurrent downloads of the same file share the work in progress
+            renderer.precompress(export_file)
+            assert renderer._compressing == {export_file: future}
+            await future
+            await asyncio.sleep(0)
+            assert renderer._compressing == {}
+            assert all(compressed_variant(export_file, encoding) for encoding in ENCODINGS)
+        finally:
+            renderer.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_precompress_skipped_while_pool_is_busy(export_file):
+    async def scenario():
+        renderer = ExportRenderer(max_workers=1, max_queued=0)
+        renderer._inflight[("task", "pdf")] = asyncio.get_running_loop().create_future()
+        renderer.precompress(export_file)
+        assert renderer._compressing == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,121 @@
+"""Tests for the job cost model (run with pytest; the Redis tests need fakeredis with Lua support)"""
+
+import pytest
+import redis
+
+import eta
+from config import Config
+from eta import CostModel, MB, _predict_fit, job_features, load_cost_model, record_job, scheduling_priority
+
+
+def fit_stats(points, decay=1.0):
+    """Decayed sums for (x, y) points, oldest first, as RECORD_SCRIPT keeps them"""
+    stats = [0.0] * 5
+    for x, y in points:
+        stats = [value * decay for value in stats]
+        stats = [stats[0] + 1, stats[1] + x, stats[2] + y, stats[3] + x * x, stats[4] + x * y]
+    return stats
+
+
+def default(x):
+    return 2.0 + 0.5 * x
+
+
+def test_fit_recovers_line():
+    stats = fit_stats([(x, 3.0 + 0.25 * x) for x in (10, 60, 300, 1200)])
+    assert _predict_fit(stats, 600, default) == pytest.approx(153.0)
+    assert _predict_fit(stats, 0, default) == pytest.approx(3.0)
+
+
+def test_fit_least_squares_with_decay():
+    points = [(10, 5.0), (100, 40.0), (50, 30.0), (200, 60.0)]
+    weights = [0.9 ** (len(points) - 1 - i) for i in range(len(points))]
+    # Weighted least squares computed directly
+    w = sum(weights)
+    mean_x = sum(wi * x for wi, (x, _) in zip(weights, points)) / w
+    mean_y = sum(wi * y for wi, (_, y) in zip(weights, points)) / w
+    slope = (sum(wi * (x - mean_x) * (y - mean_y) for wi, (x, y) in zip(weights, points))
+             / sum(wi * (x - mean_x) ** 2 for wi, (x, _) in zip(weights, points)))
+    stats = fit_stats(points, decay=0.9)
+    assert _predict_fit(stats, 150, default) == pytest.approx(mean_y + slope * (150 - mean_x))
+
+
+def test_fit_without_spread_scales_default():
+    # All inputs about the same size: the slope cannot be fitted, the default's shape is kept
+    stats = fit_stats([(100, 104.0), (100, 104.0), (100.5, 104.0)])
+    expected = 104.0 * default(200) / default(stats[1] / stats[0])
+    assert _predict_fit(stats, 200, default) == pytest.approx(expected)
+
+
+def test_fit_never_negative():
+    # Times that shrink with the input are noise: flat line at the mean
+    stats = fit_stats([(10, 9.0), (100, 5.0), (1000, 1.0)])
+    assert _predict_fit(stats, 5000, default) == pytest.approx(5.0)
+
+
+def test_falls_back_to_coarser_fits_and_defaults(monkeypatch):
+    monkeypatch.setattr(Config, "ETA_MIN_WEIGHT", 2.5)
+    features = {"format": ".mp3", "whisper_model": "base", "llm_model": "m", "worker": "cuda"}
+    specific = "transcribe|whisper_model=base|worker=cuda"
+    model_only = "transcribe|whisper_model=base"
+    model = CostModel({
+        specific: fit_stats([(100, 10.0), (200, 20.0)]),  # Not enough jobs yet
+        model_only: fit_stats([(100, 50.0), (200, 100.0), (300, 150.0)]),
+    })
+    assert model.predict("transcribe", features, 400) == pytest.approx(200.0)
+    model.stats[specific] = fit_stats([(100, 10.0), (200, 20.0), (300, 30.0)])
+    assert model.predict("transcribe", features, 400) == pytest.approx(40.0)
+    # Nothing fitted for the stage: the default
+    assert model.predict("align", features, 100) == pytest.approx(13.0)
+    assert CostModel({}).audio_duration({"format": ".wav"}, 176400 * 60) == pytest.approx(60.0)
+
+
+def test_stage_costs_skip_stages_the_job_does_not_run():
+    model = CostModel({})
+    audio = model.stage_costs(job_features("talk.mp3"), 20)
+    assert "decode" not in audio and "summarize" not in audio
+    video = model.stage_costs(job_features("talk.mp4"), 600)
+    assert "decode" in video and "summarize" in video
+    assert "summarize" not in model.stage_costs(job_features("talk.mp4"), 600, summary=False)
+
+
+def test_scheduling_priority(monkeypatch):
+    monkeypatch.setattr(Config, "ETA_PRIORITY_SCHEDULING", True)
+    assert [scheduling_priority(cost) for cost in (30, 60, 61, 600, 3600)] == [0, 0, 3, 3, 6]
+    monkeypatch.setattr(Config, "ETA_PRIORITY_SCHEDULING", False)
+    assert scheduling_priority(30) is None
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(eta, "_redis", client)
+    monkeypatch.setattr(eta, "_record_script", client.register_script(eta.RECORD_SCRIPT))
+    monkeypatch.setattr(Config, "ETA_MODEL_KEY", "test:eta:model")
+    monkeypatch.setattr(Config, "ETA_DECAY", 0.9)
+    monkeypatch.setattr(Config, "ETA_MIN_WEIGHT", 2.5)
+    return client
+
+
+def test_recorded_jobs_drive_predictions(fake_redis):
+    features = job_features("talk.mp3", worker="cpu")
+    jobs = [(60, 1.0 * MB), (300, 5.0 * MB), (120, 2.0 * MB), (600, 10.0 * MB)]
+    for audio_seconds, size in jobs:
+        record_job(features, {"transcribe": {"wall": 1.0 + 0.2 * audio_seconds}, "unknown": {"wall": 1.0}},
+                   audio_seconds, int(size))
+    model = load_cost_model()
+    # Every level of a stage's fits gets the job, decayed like the sums computed here
+    for name in ("transcribe|whisper_model=" + Config.WHISPER_MODEL + "|worker=cpu",
+                 "transcribe|whisper_model=" + Config.WHISPER_MODEL, "transcribe"):
+        assert model.stats[name] == pytest.approx(
+            fit_stats([(audio_seconds, 1.0 + 0.2 * audio_seconds) for audio_seconds, _ in jobs], decay=0.9))
+    assert not any(name.startswith("unknown") for name in model.stats)
+    assert model.predict("transcribe", features, 1000) == pytest.approx(201.0)
+    assert model.audio_duration(features, 4 * MB) == pytest.approx(240.0)
+
+
+def test_redis_unavailable_uses_defaults(monkeypatch):
+    monkeypatch.setattr(eta, "_redis", redis.Redis.from_url("redis://127.0.0.1:1/0"))
+    assert load_cost_model().stats == {}
@@ -0,0 +1,126 @@
+"""Tests for retention and quota enforcement (run with pytest)"""
+
+import os
+
+import pytest
+
+import search_index
+from config import Config
+from janitor import clean_storage
+
+NOW = 1_700_000_000.0
+HOUR = 3600
+DAY = 86400
+TASK_IDS = {name: f"{name:0<8}-0000-0000-0000-000000000000" for name in ("a", "b", "c", "d")}
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    results = tmp_path / "results"
+    for name, path in {
+        "UPLOAD_DIR": tmp_path / "uploads",
+        "RESULTS_DIR": results,
+        "EXPORTS_DIR": results / "exports",
+        "PROFILES_DIR": results / "profiles",
+    }.items():
+        path.mkdir(parents=True, exist_ok=True)
+        monkeypatch.setattr(Config, name, str(path))
+    monkeypatch.setattr(Config, "SEARCH_INDEX_PATH", str(tmp_path / "search.db"))
+    monkeypatch.setattr(search_index, "_schema_ready", False)
+    for name, value in {"RESULT_TTL": 30 * DAY, "EXPORT_TTL": 7 * DAY, "UPLOAD_TTL": DAY,
+                        "RESULTS_MAX_BYTES": 0, "UPLOADS_MAX_BYTES": 0}.items():
+        monkeypatch.setattr(Config, name, value)
+    return tmp_path
+
+
+def make_file(path, size, accessed):
+    """File of `size` bytes last read and written `accessed` seconds before NOW"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (NOW - accessed, NOW - accessed))
+    return str(path)
+
+
+def make_result(name, size, accessed, export_size=0):
+    task_id = TASK_IDS[name]
+    make_file(os.path.join(Config.RESULTS_DIR, f"{task_id}.nvr"), size, accessed)
+    if export_size:
+        make_file(os.path.join(Config.EXPORTS_DIR, task_id, "v1.txt"), export_size, accessed)
+
+
+def stored_results():
+    return sorted(name for name, task_id in TASK_IDS.items()
+                  if os.path.exists(os.path.join(Config.RESULTS_DIR, f"{task_id}.nvr")))
+
+
+def stored_exports():
+    return sorted(name for name, task_id in TASK_IDS.items()
+                  if os.path.isdir(os.path.join(Config.EXPORTS_DIR, task_id)))
+
+
+def test_result_and_export_ttl(storage):
+    make_result("a", 10, accessed=31 * DAY, export_size=10)
+    make_result("b", 10, accessed=8 * DAY, export_size=10)
+    make_result("c", 10, accessed=DAY, export_size=10)
+    summary = clean_storage(NOW)
+    assert stored_results() == ["b", "c"]
+    assert stored_exports() == ["c"]
+    assert summary["removed_by_reason"] == {"ttl": 3}
+
+
+def test_quota_evicts_exports_before_results(storage, monkeypatch):
+    monkeypatch.setattr(Config, "RESULTS_MAX_BYTES", 450)
+    make_result("a", 100, accessed=3 * HOUR, export_size=100)
+    make_result("b", 100, accessed=2 * HOUR, export_size=100)
+    make_result("c", 100, accessed=1 * HOUR, export_size=100)
+    # 600 bytes: dropping the two least recently used exports is enough
+    clean_storage(NOW)
+    assert stored_results() == ["a", "b", "c"]
+    assert stored_exports() == ["c"]
+
+
+def test_quota_evicts_least_recently_used_results(storage, monkeypatch):
+    monkeypatch.setattr(Config, "RESULTS_MAX_BYTES", 250)
+    make_result("a", 100, accessed=1 * HOUR, export_size=50)
+    make_result("b", 100, accessed=3 * HOUR)
+    make_result("c", 100, accessed=2 * HOUR)
+    make_result("d", 100, accessed=4 * HOUR)
+    summary = clean_storage(NOW)
+    # Exports go first, then results from the least recently read
+    assert stored_exports() == []
+    assert stored_results() == ["a", "c"]
+    assert summary["reclaimed_bytes_by_reason"] == {"quota": 250}
+
+
+def test_uploads(storage, monkeypatch):
+    monkeypatch.setattr(Config, "UPLOADS_MAX_BYTES", 200)
+    uploads = Config.UPLOAD_DIR
+    make_result("a", 10, accessed=0)
+    make_result("b", 10, accessed=0)
+    make_result("c", 10, accessed=0)
+    finished_old = make_file(os.path.join(uploads, f"{TASK_IDS['a']}_talk.mp3"), 100, accessed=2 * DAY)
+    finished_older = make_file(os.path.join(uploads, f"{TASK_IDS['b']}_old.mp3"), 100, accessed=5 * HOUR)
+    finished_newer = make_file(os.path.join(uploads, f"{TASK_IDS['c']}_new.mp3"), 100, accessed=4 * HOUR)
+    queued = make_file(os.path.join(uploads, f"{TASK_IDS['d']}_queued.mp3"), 100, accessed=2 * HOUR)
+    conversion = make_file(os.path.join(uploads, f"{TASK_IDS['a']}_talk_audio.wav"), 100, accessed=7 * HOUR)
+    summary = clean_storage(NOW)
+    # Past the TTL, orphaned conversion, then LRU over finished uploads; the queued task's upload stays
+    assert not os.path.exists(finished_old)
+    assert not os.path.exists(conversion)
+    assert not os.path.exists(finished_older)
+    assert os.path.exists(finished_newer)
+    assert os.path.exists(queued)
+    assert summary["removed_by_reason"] == {"ttl": 1, "orphan": 1, "quota": 1}
+
+
+def test_orphans(storage):
+    make_result("a", 10, accessed=0)
+    orphan_export = make_file(os.path.join(Config.EXPORTS_DIR, TASK_IDS["b"], "v1.txt"), 10, accessed=0)
+    stale_tmp = make_file(os.path.join(Config.RESULTS_DIR, "x.nvr.1.tmp"), 10, accessed=2 * HOUR)
+    fresh_tmp = make_file(os.path.join(Config.RESULTS_DIR, "y.nvr.1.tmp"), 10, accessed=60)
+    clean_storage(NOW)
+    assert not os.path.exists(orphan_export)
+    assert not os.path.exists(stale_tmp)
+    assert os.path.exists(fresh_tmp)
+    assert stored_results() == ["a"]
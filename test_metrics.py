@@ -0,0 +1,91 @@
+"""Tests for job stage timings (run with pytest)"""
+
+import threading
+import time
+
+import pytest
+
+import metrics
+from metrics import JobTimings, MetricsBatch, current_rss
+
+pytestmark = pytest.mark.skipif(current_rss() is None, reason="resident memory cannot be read on this platform")
+
+MB = 1024 * 1024
+
+
+def test_stage_peak_rss_is_per_stage():
+    timings = JobTimings()
+    with timings.stage("big"):
+        buffer = bytearray(200 * MB)
+        for i in range(0, len(buffer), 4096):
+            buffer[i] = 1
+        time.sleep(0.2)
+        del buffer
+    with timings.stage("small"):
+        time.sleep(0.2)
+    stages = timings.as_dict()["stages"]
+    # A later stage does not inherit the high-water mark of an earlier one
+    assert stages["big"]["peak_rss"] - stages["small"]["peak_rss"] > 150 * MB
+    assert timings.as_dict()["peak_rss"] == stages["big"]["peak_rss"]
+
+
+def test_stage_peak_rss_is_sampled_during_the_stage():
+    timings = JobTimings()
+    with timings.stage("spike"):
+        buffer = bytearray(200 * MB)
+        for i in range(0, len(buffer), 4096):
+            buffer[i] = 1
+        time.sleep(0.3)
+        del buffer
+        time.sleep(0.1)
+    # Freed before the stage ended, yet counted
+    assert timings.stages["spike"]["peak_rss"] - current_rss() > 150 * MB
+
+
+def test_cpu_time_only_for_stages_without_overlap():
+    first, second, alone = JobTimings(enqueued_at=time.time()), JobTimings(), JobTimings()
+
+    def run(timings):
+        with timings.stage("transcribe"):
+            time.sleep(0.2)
+
+    threads = [threading.Thread(target=run, args=(timings,)) for timings in (first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    run(alone)
+
+    assert first.stages["transcribe"]["cpu"] is None
+    assert first.as_dict()["cpu"] is None
+    assert alone.stages["transcribe"]["cpu"] is not None
+    assert alone.as_dict()["cpu"] == alone.stages["transcribe"]["cpu"]
+
+    # A stage that overlapped once stays without CPU time when it runs again
+    run(first)
+    assert first.stages["transcribe"]["cpu"] is None
+
+
+def test_record_skips_missing_cpu(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(MetricsBatch, "record", lambda batch: recorded.append(batch))
+    timings = JobTimings()
+    timings.stages["transcribe"] = {"wall": 1.0, "cpu": None, "peak_rss": 100 * MB}
+    timings.stages["align"] = {"wall": 1.0, "cpu": 0.5, "peak_rss": 100 * MB}
+    timings.record("success", 10.0)
+    fields = recorded[0].increments
+    assert 'nurgavoice_stage_cpu_seconds_count{stage="align"}' in fields
+    assert 'nurgavoice_stage_cpu_seconds_count{stage="transcribe"}' not in fields
+    assert fields["nurgavoice_job_peak_rss_bytes_count{}"] == 1
+
+
+def test_monitor_restarts_sampler(monkeypatch):
+    monitor = metrics.StageMonitor(interval=0.01)
+    stage = monitor.begin()
+    monitor.end(stage)
+    # As if the process had forked
+    monkeypatch.setattr(monitor, "_thread", threading.Thread(target=lambda: None))
+    stage = monitor.begin()
+    assert monitor._thread.is_alive()
+    monitor.end(stage)
+    assert stage.peak_rss is not None
@@ -0,0 +1,66 @@
+"""Tests for per-job profiling (run with pytest)"""
+
+import os
+import threading
+
+import pytest
+
+import profiling
+from config import Config
+from profiling import JobProfiler, profile_path
+
+
+@pytest.fixture(autouse=True)
+def profiles_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "PROFILES_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "push_to_storage", lambda path: None)
+
+
+def work():
+    return sum(i * i for i in range(20000))
+
+
+def test_profile_artifacts():
+    profiler = JobProfiler("t1", allocations=False)
+    profiler.start()
+    work()
+    assert profiler.stop() == ["pstats", "stats", "collapsed"]
+    assert all(os.path.exists(profile_path("t1", artifact)) for artifact in ("pstats", "stats", "collapsed"))
+
+
+def test_one_job_at_a_time_under_cprofile():
+    first = JobProfiler("first", allocations=False)
+    first.start()
+    saved = {}
+
+    def run_second():
+        second = JobProfiler("second", allocations=False)
+        second.start()
+        work()
+        saved["second"] = second.stop()
+
+    thread = threading.Thread(target=run_second)
+    thread.start()
+    thread.join()
+    work()
+    assert first.stop() == ["pstats", "stats", "collapsed"]
+    # The concurrent job only got the sampler
+    assert saved["second"] == ["collapsed"]
+    assert not os.path.exists(profile_path("second", "pstats"))
+
+    # cProfile is free again once the first job has stopped
+    third = JobProfiler("third", allocations=False)
+    third.start()
+    assert third.stop() == ["pstats", "stats", "collapsed"]
+
+
+def test_cprofile_failure_falls_back_to_sampler(monkeypatch):
+    class BusyProfile:
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(profiling.cProfile, "Profile", BusyProfile)
+    profiler = JobProfiler("t1", allocations=False)
+    profiler.start()
+    assert profiler.stop() == ["collapsed"]
+    assert not profiling._cprofile_lock.locked()
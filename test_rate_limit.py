@@ -0,0 +1,112 @@
+"""Tests for the Redis token buckets (run with pytest; needs fakeredis with Lua support)"""
+
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from config import Config
+from rate_limit import RateLimiter, TOKEN_BUCKET_SCRIPT, client_identity, rate_limit_bucket
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+KEY = "test:read:client"
+
+
+@pytest.fixture
+def limiter():
+    limiter = RateLimiter(limits={"read": (3, 0.5), "upload": (1, 0.01)}, key_prefix="test:")
+    limiter._redis = fakeredis.aioredis.FakeRedis()
+    limiter._script = limiter._redis.register_script(TOKEN_BUCKET_SCRIPT)
+    yield limiter
+    asyncio.run(limiter.close())
+
+
+def check(limiter, bucket="read", cost=1):
+    return asyncio.run(limiter.check(bucket, "client", cost))
+
+
+def age_bucket(limiter, seconds):
+    """Move the bucket's last refill back in time"""
+    async def age():
+        ts = float(await limiter._redis.hget(KEY, "ts"))
+        await limiter._redis.hset(KEY, "ts", ts - seconds)
+    asyncio.run(age())
+
+
+def test_denies_when_empty(limiter):
+    results = [check(limiter) for _ in range(4)]
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert [int(result.remaining) for result in results] == [2, 1, 0, 0]
+    denied = results[-1]
+    # One token at 0.5 tokens per second
+    assert 1.5 < denied.retry_after <= 2
+    assert denied.headers() == {"X-RateLimit-Limit": "3", "X-RateLimit-Remaining": "0", "Retry-After": "2"}
+    assert "Retry-After" not in results[0].headers()
+
+
+def test_refills_over_time(limiter):
+    for _ in range(3):
+        check(limiter)
+    assert not check(limiter).allowed
+    age_bucket(limiter, 4)  # Two tokens at 0.5 per second
+    assert check(limiter).allowed
+    assert check(limiter).allowed
+    assert not check(limiter).allowed
+
+
+def test_refill_is_capped(limiter):
+    check(limiter)
+    age_bucket(limiter, 3600)
+    assert int(check(limiter).remaining) == 2
+
+
+def test_cost_and_separate_buckets(limiter):
+    denied = check(limiter, cost=4)
+    assert not denied.allowed and int(denied.remaining) == 3
+    assert check(limiter, cost=3).allowed
+    assert check(limiter, bucket="upload").allowed
+    assert not check(limiter, bucket="upload").allowed
+
+
+def test_bucket_expires(limiter):
+    check(limiter)
+    ttl = asyncio.run(limiter._redis.ttl(KEY))
+    assert 0 < ttl <= 7  # Time to refill from empty, plus a second
+
+
+def test_redis_outage_allows(limiter):
+    limiter._redis = None
+    limiter._script = None
+    limiter.redis_url = "redis://127.0.0.1:1/0"
+    result = check(limiter)
+    assert result.allowed and result.remaining == 3
+
+
+def request(path="/status/x", method="GET", headers=None, query="", client=("10.0.0.1", 1234)):
+    return Request({
+        "type": "http", "method": method, "path": path, "query_string": query.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": client,
+    })
+
+
+def test_rate_limit_bucket():
+    assert rate_limit_bucket(request("/upload", "POST")) == "upload"
+    assert rate_limit_bucket(request("/download/x/txt")) == "read"
+    assert rate_limit_bucket(request("/search")) == "read"
+    assert rate_limit_bucket(request("/health")) is None
+
+
+def test_client_identity(monkeypatch):
+    monkeypatch.setattr(Config, "API_KEY", "shared-ui-key")
+    own = client_identity(request(headers={"X-API-Key": "own-key"}))
+    assert own.startswith("key:") and "own-key" not in own
+    assert client_identity(request(headers={"X-API-Key": "own-key"}, client=("10.0.0.2", 1))) == own
+    assert client_identity(request(query="api_key=own-key")) == own
+    # The key shared by the web interface gets a bucket per client
+    ui = client_identity(request(headers={"X-API-Key": "shared-ui-key"}))
+    assert ui.endswith(":ip:10.0.0.1")
+    assert client_identity(request(headers={"X-API-Key": "shared-ui-key"}, client=("10.0.0.2", 1))) != ui
+    assert client_identity(request()) == "ip:10.0.0.1"
@@ -0,0 +1,99 @@
+"""Tests for the .nvr result format (run with pytest)"""
+
+from array import array
+
+import pytest
+
+import result_format
+from result_format import ResultFile, is_result_file, write_result_file
+
+RESULT = {
+    "summary": "A short talk.",
+    "metadata": {"filename": "talk.mp3", "duration": 12.5},
+    "transcription": {
+        "text": "Привет мир. Second part. Third.",
+        "language": "ru",
+        "segments": [
+            {"start": 0.0, "end": 2.5, "text": "Привет мир.", "speaker": "A",
+             "words": [{"word": "Привет", "start": 0.0, "end": 1.0, "score": 0.875},
+                       {"word": "мир.", "start": 1.25, "end": 2.5, "score": 0.5, "speaker": "A"}]},
+            {"start": 2.5, "end": 8.0, "text": "Second part."},
+            {"start": 3.0, "end": 4.0, "text": "Third.", "words": [{"word": "Third."}]},
+        ],
+    },
+    "model": "base",
+}
+
+
+def write(path, result):
+    with open(path, "wb") as f:
+        write_result_file(f, result)
+    return str(path)
+
+
+@pytest.fixture
+def result_file(tmp_path):
+    with ResultFile(write(tmp_path / "result.nvr", RESULT)) as result_file:
+        yield result_file
+
+
+def test_round_trip(result_file):
+    assert result_file.to_dict() == RESULT
+
+
+def test_segments_without_words(result_file):
+    assert len(result_file) == 3
+    assert result_file.segment(0, words=False) == {"start": 0.0, "end": 2.5, "text": "Привет мир.", "speaker": "A"}
+    assert [segment["text"] for segment in result_file.iter_segments(1, words=False)] == ["Second part.", "Third."]
+
+
+def test_empty_result(tmp_path):
+    result = {"summary": "", "metadata": {}, "transcription": {"text": "", "segments": []}}
+    with ResultFile(write(tmp_path / "empty.nvr", result)) as result_file:
+        assert len(result_file) == 0
+        assert result_file.to_dict() == result
+        assert result_file.time_range(0, 100) == []
+
+
+def test_is_result_file(tmp_path, result_file):
+    legacy = tmp_path / "legacy.json"
+    legacy.write_text("{}")
+    assert is_result_file(str(tmp_path / "result.nvr"))
+    assert not is_result_file(str(legacy))
+    assert not is_result_file(str(tmp_path / "missing.nvr"))
+    with pytest.raises(ValueError):
+        ResultFile(str(legacy))
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (0.0, 100.0, [0, 1, 2]),
+    (1.0, 2.0, [0]),
+    (2.5, 2.5, [0, 1]),
+    (3.5, 3.7, [1, 2]),
+    (5.0, 6.0, [1]),  # Inside a long segment that started before a shorter one ended
+    (8.5, 9.0, []),
+    (-5.0, -1.0, []),
+])
+def test_time_range(result_file, start, end, expected):
+    assert result_file.time_range(start, end) == expected
+
+
+def test_times_round_trip_exactly(tmp_path):
+    # Hours into a recording, beyond what float32 holds to the millisecond
+    segment = {"start": 12345.678, "end": 43210.987654, "text": "Late.",
+               "words": [{"word": "Late.", "start": 12345.678, "end": 43210.987654, "score": 0.123456789}]}
+    result = {"summary": "", "metadata": {}, "transcription": {"text": "Late.", "segments": [segment]}}
+    with ResultFile(write(tmp_path / "long.nvr", result)) as result_file:
+        assert result_file.to_dict() == result
+        assert result_file.time_range(12345.678, 12345.678) == [0]
+
+
+def test_float32_columns_are_rounded(tmp_path, monkeypatch):
+    # Files written before the time columns were float64
+    monkeypatch.setattr(result_format, "_float_column", lambda records, field: array(
+        "f", [float("nan") if record.get(field) is None else record[field] for record in records]))
+    segment = {"start": 0.1, "end": 2.3, "text": "Old.", "words": [{"word": "Old.", "start": 0.1, "score": 0.7}]}
+    result = {"summary": "", "metadata": {}, "transcription": {"text": "Old.", "segments": [segment]}}
+    with ResultFile(write(tmp_path / "old.nvr", result)) as result_file:
+        assert result_file.header["columns"]["seg_start"][2] == "f"
+        assert result_file.to_dict() == result
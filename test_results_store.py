@@ -0,0 +1,82 @@
+"""Tests for the cache of open result files (run with pytest)"""
+
+import pytest
+
+import results_store
+from result_format import write_result_file
+from results_store import ResultFileCache
+
+
+@pytest.fixture
+def result_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(results_store, "result_path", lambda task_id: str(tmp_path / f"{task_id}.nvr"))
+    return tmp_path
+
+
+def save(result_dir, task_id, text):
+    with open(result_dir / f"{task_id}.nvr", "wb") as f:
+        write_result_file(f, {"transcription": {"text": text, "segments": [{"start": 0.0, "end": 1.0, "text": text}]}})
+
+
+def is_closed(result_file):
+    return result_file._mmap.closed
+
+
+def test_evicts_least_recently_used(result_dir):
+    cache = ResultFileCache(size=2)
+    for task_id in ("a", "b", "c"):
+        save(result_dir, task_id, task_id)
+    with cache.reader("a", "1") as a:
+        pass
+    with cache.reader("b", "1") as b:
+        pass
+    with cache.reader("a", "1") as again:
+        assert again is a
+    with cache.reader("c", "1"):
+        pass
+    assert is_closed(b)
+    assert not is_closed(a)
+
+
+def test_new_version_replaces_file(result_dir):
+    cache = ResultFileCache()
+    save(result_dir, "a", "old")
+    with cache.reader("a", "1") as old:
+        pass
+    save(result_dir, "a", "new")
+    with cache.reader("a", "2") as new:
+        assert new.segment(0)["text"] == "new"
+    assert is_closed(old)
+
+
+def test_file_in_use_is_closed_after_the_reader(result_dir):
+    cache = ResultFileCache(size=1)
+    save(result_dir, "a", "a")
+    save(result_dir, "b", "b")
+    with cache.reader("a", "1") as a:
+        with cache.reader("b", "1"):
+            pass
+        # Evicted, but still readable by the query that holds it
+        assert a.segment(0)["text"] == "a"
+        assert not is_closed(a)
+    assert is_closed(a)
+
+
+def test_missing_result(result_dir):
+    cache = ResultFileCache()
+    with cache.reader("missing", "1") as result_file:
+        assert result_file is None
+
+
+def test_discard_and_clear(result_dir):
+    cache = ResultFileCache()
+    save(result_dir, "a", "a")
+    save(result_dir, "b", "b")
+    with cache.reader("a", "1") as a:
+        pass
+    with cache.reader("b", "1") as b:
+        pass
+    cache.discard("a")
+    assert is_closed(a) and not is_closed(b)
+    cache.clear()
+    assert is_closed(b)
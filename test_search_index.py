@@ -0,0 +1,123 @@
+"""Tests for transcript search (run with pytest)"""
+
+import pytest
+
+import search_index
+from config import Config
+from search_index import build_match_query, index_result, remove_result, search
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("hello world", '"hello" "world"'),
+    ('"hello world" again', '"hello world" "again"'),
+    ("transcri*", '"transcri"*'),
+    ("a*b", '"a*b"'),
+    # FTS5 operators and syntax are matched as plain words
+    ("cats OR dogs", '"cats" "OR" "dogs"'),
+    ("NEAR(a b)", '"NEAR(a" "b)"'),
+    ("title:x -y ^z", '"title:x" "-y" "^z"'),
+    # Stray and embedded quotes are escaped, empty terms dropped
+    ('say"hi', '"say""hi"'),
+    ('"unterminated phrase', '"""unterminated" "phrase"'),
+    ('"" * ** "  "', ""),
+    ("", ""),
+    ("  привет   мир  ", '"привет" "мир"'),
+])
+def test_build_match_query(query, expected):
+    assert build_match_query(query) == expected
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "SEARCH_INDEX_PATH", str(tmp_path / "search.db"))
+    monkeypatch.setattr(search_index, "_schema_ready", False)
+    for task_id, texts in {
+        "t1": ["The quick brown fox", "jumps over the lazy dog", 'He said "OR" NEAR(the end'],
+        "t2": ["A quick résumé of the meeting", "   "],
+    }.items():
+        segments = [{"start": float(i), "end": i + 1.0, "text": text} for i, text in enumerate(texts)]
+        index_result(task_id, {"metadata": {"file_name": f"{task_id}.mp3"}, "transcription": {"segments": segments}},
+                     version="1")
+
+
+def hits(query, **kwargs):
+    return [(hit["task_id"], hit["index"]) for hit in search(query, **kwargs)["hits"]]
+
+
+def test_search(index):
+    assert sorted(hits("quick")) == [("t1", 0), ("t2", 0)]
+    assert hits("quick", task_id="t2") == [("t2", 0)]
+    assert hits("lazy dog") == [("t1", 1)]
+    assert hits('"dog jumps"') == []
+    assert hits("jump*") == [("t1", 1)]
+    # Diacritics are folded
+    assert hits("resume") == [("t2", 0)]
+
+
+def test_search_syntax_is_literal(index):
+    assert hits('"OR" NEAR(the') == [("t1", 2)]
+    assert hits('"') == []
+    assert hits("AND") == []
+
+
+def test_search_pages(index):
+    first = search("quick", limit=1)
+    second = search("quick", limit=1, offset=1)
+    assert first["next_offset"] == 1 and second["next_offset"] is None
+    assert {hit["task_id"] for hit in first["hits"] + second["hits"]} == {"t1", "t2"}
+    assert "<mark>" in first["hits"][0]["snippet"]
+
+
+def test_reindex_and_remove(index):
+    index_result("t1", {"transcription": {"segments": [{"start": 0.0, "end": 1.0, "text": "something else"}]}},
+                 version="2")
+    assert hits("fox") == []
+    assert hits("something") == [("t1", 0)]
+    remove_result("t1")
+    assert hits("something") == []
+
+
+@pytest.fixture
+def announced(index, monkeypatch):
+    """Results saved by workers on other machines, in a fake store"""
+    fakeredis = pytest.importorskip("fakeredis")
+    monkeypatch.setattr(search_index, "_redis", fakeredis.FakeRedis())
+    store = {}
+    monkeypatch.setattr(search_index, "result_version", lambda task_id: store.get(task_id, (None,))[0])
+    monkeypatch.setattr(search_index, "load_result", lambda task_id: store[task_id][1])
+
+    def save(task_id, version, text):
+        store[task_id] = (version, {"transcription": {"segments": [{"start": 0.0, "end": 1.0, "text": text}]}})
+        search_index.announce_result(task_id)
+
+    return save
+
+
+def test_sync_from_storage(announced):
+    announced("r1", "1", "remote worker result")
+    announced("r2", "1", "another remote result")
+    assert search_index.sync_from_storage() == 2
+    assert sorted(hits("remote")) == [("r1", 0), ("r2", 0)]
+    # Nothing new: only version checks
+    assert search_index.sync_from_storage() == 0
+    # Re-saved result
+    announced("r1", "2", "resummarized text")
+    assert search_index.sync_from_storage() == 1
+    assert hits("remote") == [("r2", 0)]
+    assert hits("resummarized") == [("r1", 0)]
+
+
+def test_sync_retries_failed_results(announced, monkeypatch):
+    announced("r1", "1", "first")
+    assert search_index.sync_from_storage() == 1
+    announced("r2", "1", "second")
+    load_result = search_index.load_result
+
+    def unavailable(task_id):
+        raise OSError("store unavailable")
+
+    monkeypatch.setattr(search_index, "load_result", unavailable)
+    assert search_index.sync_from_storage() == 0
+    monkeypatch.setattr(search_index, "load_result", load_result)
+    assert search_index.sync_from_storage() == 1
+    assert hits("second") == [("r2", 0)]
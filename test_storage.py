@@ -0,0 +1,87 @@
+"""Tests for the storage backends (run with pytest)"""
+
+import pytest
+
+from storage import LocalStorage, S3Storage, storage_key
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+        self.closed = False
+
+    def iter_chunks(self, chunk_size):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeS3Client:
+    """Records get_object calls and serves a fixed object"""
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = []
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.calls.append(kwargs)
+        data = self.data
+        if "Range" in kwargs:
+            first, _, last = kwargs["Range"][len("bytes="):].partition("-")
+            data = data[int(first):int(last) + 1 if last else None]
+        return {"Body": FakeBody(data)}
+
+
+def s3_storage(data):
+    storage = object.__new__(S3Storage)  # No boto3 client
+    storage.bucket, storage.prefix, storage.client = "bucket", "prefix/", FakeS3Client(data)
+    return storage
+
+
+@pytest.mark.parametrize("start, end, range_header, expected", [
+    (0, None, None, b"0123456789"),
+    (3, None, "bytes=3-", b"3456789"),
+    (0, 4, "bytes=0-3", b"0123"),
+    (2, 5, "bytes=2-4", b"234"),
+])
+def test_s3_iter_range(start, end, range_header, expected):
+    storage = s3_storage(b"0123456789")
+    assert b"".join(storage.iter_range("results/a.txt", start, end, chunk_size=2)) == expected
+    assert storage.client.calls == [{"Range": range_header} if range_header else {}]
+
+
+@pytest.mark.parametrize("start, end", [(0, 0), (5, 5), (5, 3)])
+def test_s3_iter_empty_range(start, end):
+    storage = s3_storage(b"0123456789")
+    assert list(storage.iter_range("results/a.txt", start, end)) == []
+    assert storage.client.calls == []
+
+
+def test_s3_iter_empty_object():
+    storage = s3_storage(b"")
+    assert list(storage.iter_range("results/empty.txt")) == []
+    assert storage.client.calls == [{}]
+
+
+def test_local_iter_range(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    with storage.open_write("results/a.txt") as f:
+        f.write(b"0123456789")
+    assert b"".join(storage.iter_range("results/a.txt", chunk_size=3)) == b"0123456789"
+    assert b"".join(storage.iter_range("results/a.txt", 2, 5, chunk_size=2)) == b"234"
+    assert list(storage.iter_range("results/a.txt", 4, 4)) == []
+
+
+@pytest.mark.parametrize("key", ["../etc/passwd", "/etc/passwd", "uploads/../../x", ".."])
+def test_keys_stay_inside_the_root(tmp_path, key):
+    with pytest.raises(ValueError):
+        storage_key(key)
+    with pytest.raises(ValueError):
+        LocalStorage(str(tmp_path)).path(key)
+
+
+def test_keys_are_normalized():
+    assert storage_key("uploads/./a/../b.mp3") == "uploads/b.mp3"
+    assert s3_storage(b"")._key("results//a.nvr") == "prefix/results/a.nvr"
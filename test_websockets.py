@@ -0,0 +1,110 @@
+"""Tests for WebSocket fan-out of task events (run with pytest)"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+import main
+from config import Config
+from main import ConnectionManager, event_hub
+
+
+class FakeWebSocket:
+    def __init__(self, send_delay=0.0):
+        self.send_delay = send_delay
+        self.sent = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(json.loads(text))
+
+    async def close(self):
+        self.closed = True
+
+
+def progress(value):
+    return {"state": "PROGRESS", "progress": value}
+
+
+@pytest.fixture(autouse=True)
+def short_timeout(monkeypatch):
+    monkeypatch.setattr(Config, "WEBSOCKET_SEND_TIMEOUT", 0.5)
+
+
+def test_slow_socket_does_not_delay_other_tasks():
+    async def scenario():
+        manager = ConnectionManager()
+        slow, fast = FakeWebSocket(send_delay=10), FakeWebSocket()
+        await manager.connect(slow, "slow-task")
+        await manager.connect(fast, "fast-task")
+
+        started = time.monotonic()
+        await event_hub.dispatch("slow-task", progress(10))
+        await event_hub.dispatch("fast-task", progress(20))
+        # The listener only queues messages
+        assert time.monotonic() - started < 0.1
+        await asyncio.sleep(0.05)
+        assert fast.sent == [progress(20)]
+
+        # The stalled socket is dropped once its send times out
+        await asyncio.sleep(0.6)
+        assert slow.closed and not manager.is_connected(slow, "slow-task")
+        assert manager.is_connected(fast, "fast-task")
+        manager.disconnect(fast, "fast-task")
+
+    asyncio.run(scenario())
+
+
+def test_slow_socket_does_not_delay_viewers_of_the_same_task():
+    async def scenario():
+        manager = ConnectionManager()
+        slow, fast = FakeWebSocket(send_delay=10), FakeWebSocket()
+        await manager.connect(slow, "task")
+        await manager.connect(fast, "task")
+        await event_hub.dispatch("task", progress(10))
+        await event_hub.dispatch("task", progress(20))
+        await asyncio.sleep(0.05)
+        assert fast.sent == [progress(10), progress(20)]
+        manager.disconnect(slow, "task")
+        manager.disconnect(fast, "task")
+
+    asyncio.run(scenario())
+
+
+def test_socket_too_far_behind_is_dropped(monkeypatch):
+    monkeypatch.setattr(Config, "WEBSOCKET_QUEUE_SIZE", 2)
+    monkeypatch.setattr(Config, "WEBSOCKET_SEND_TIMEOUT", 10)
+
+    async def scenario():
+        manager = ConnectionManager()
+        slow = FakeWebSocket(send_delay=5)
+        await manager.connect(slow, "task")
+        for value in range(4):
+            await event_hub.dispatch("task", progress(value))
+        await asyncio.sleep(0.05)
+        assert slow.closed and not manager.is_connected(slow, "task")
+        assert "task" not in manager.active_connections
+
+    asyncio.run(scenario())
+
+
+def test_final_state_is_sent_then_closed(monkeypatch):
+    monkeypatch.setattr(main.status_cache, "put", lambda task_id, message: None)
+
+    async def scenario():
+        manager = ConnectionManager()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "task")
+        await event_hub.dispatch("task", progress(50))
+        await event_hub.dispatch("task", {"state": "SUCCESS", "result": {}})
+        await asyncio.sleep(0.05)
+        assert [message["state"] for message in websocket.sent] == ["PROGRESS", "SUCCESS"]
+        assert websocket.closed and "task" not in manager.active_connections
+
+    asyncio.run(scenario())
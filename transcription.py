@@ -0,0 +1,142 @@
+"""
+WhisperX transcription and alignment helpers with fine-grained progress reporting.
+
+`FasterWhisperPipeline.transcribe` runs VAD and then decodes every speech chunk
+before returning, so callers get no signal in between. These helpers run the
+same steps but report the audio position of each completed chunk, which lets
+the task publish real progress for long recordings.
+"""
+
+from typing import Callable, Dict, Any, List, Optional
+from contextlib import contextmanager
+from dataclasses import replace
+
+import whisperx
+from whisperx.audio import SAMPLE_RATE
+from whisperx.asr import find_numeral_symbol_tokens
+from whisperx.vads import Vad, Pyannote
+from faster_whisper.tokenizer import Tokenizer
+from config import Config
+
+ProgressCallback = Optional[Callable[[float], None]]
+SegmentCallback = Optional[Callable[[Dict[str, Any]], None]]
+
+
+def detect_speech_chunks(model, audio, chunk_size: int = 30) -> List[Dict[str, Any]]:
+    """Run the pipeline's VAD and merge speech regions into <= chunk_size second chunks"""
+    if issubclass(type(model.vad_model), Vad):
+        waveform = model.vad_model.preprocess_audio(audio)
+        merge_chunks = model.vad_model.merge_chunks
+    else:
+        waveform = Pyannote.preprocess_audio(audio)
+        merge_chunks = Pyannote.merge_chunks
+
+    vad_segments = model.vad_model({"waveform": waveform, "sample_rate": SAMPLE_RATE})
+    return merge_chunks(
+        vad_segments,
+        chunk_size,
+        onset=model._vad_params["vad_onset"],
+        offset=model._vad_params["vad_offset"],
+    )
+
+
+@contextmanager
+def decoding_language(model, language: str, task: Optional[str] = None):
+    """Configure the pipeline tokenizer/options to decode `language`, reverting afterwards like model.transcribe"""
+    task = task or (model.tokenizer.task if model.tokenizer is not None else "transcribe")
+    if model.tokenizer is None or task != model.tokenizer.task or language != model.tokenizer.language_code:
+        model.tokenizer = Tokenizer(
+            model.model.hf_tokenizer, model.model.model.is_multilingual, task=task, language=language
+        )
+
+    if model.suppress_numerals:
+        previous_suppress_tokens = model.options.suppress_tokens
+        numeral_symbol_tokens = find_numeral_symbol_tokens(model.tokenizer)
+        new_suppressed_tokens = list(set(numeral_symbol_tokens + model.options.suppress_tokens))
+        model.options = replace(model.options, suppress_tokens=new_suppressed_tokens)
+
+    try:
+        yield
+    finally:
+        # Revert per-call tokenizer/options state
+        if model.preset_language is None:
+            model.tokenizer = None
+        if model.suppress_numerals:
+            model.options = replace(model.options, suppress_tokens=previous_suppress_tokens)
+
+
+def resolve_language(model, audio, language: Optional[str] = None) -> str:
+    """Return the requested language, the pipeline's preset language, or detect it from the audio"""
+    if language:
+        return language
+    if model.tokenizer is not None:
+        return model.tokenizer.language_code
+    return model.detect_language(audio)
+
+
+def chunk_text(output: Dict[str, Any]) -> str:
+    """Extract the decoded text of one chunk from a pipeline output"""
+    text = output["text"]
+    # Unbatched pipeline calls return a one-element list per chunk
+    if isinstance(text, list):
+        text = text[0]
+    return text
+
+
+def transcribe_with_progress(
+    model, audio, batch_size: int = 16, language: Optional[str] = None,
+    on_progress: ProgressCallback = None, on_segment: SegmentCallback = None
+) -> Dict[str, Any]:
+    """Transcribe audio like model.transcribe, reporting each decoded segment and its end time"""
+    if not hasattr(model, "vad_model"):
+        # Not a FasterWhisperPipeline - no access to the chunk loop, so report only at the end
+        transcribe_options = {"language": language} if language else {}
+        result = model.transcribe(audio, batch_size=batch_size, **transcribe_options)
+        if on_segment:
+            for segment in result.get("segments", []):
+                on_segment(segment)
+        if on_progress and result.get("segments"):
+            on_progress(result["segments"][-1]["end"])
+        return result
+
+    vad_segments = detect_speech_chunks(model, audio)
+    language = resolve_language(model, audio, language)
+
+    def data():
+        for seg in vad_segments:
+            f1 = int(seg["start"] * SAMPLE_RATE)
+            f2 = int(seg["end"] * SAMPLE_RATE)
+            yield {"inputs": audio[f1:f2]}
+
+    segments = []
+    with decoding_language(model, language):
+        for idx, out in enumerate(model(data(), batch_size=batch_size, num_workers=0)):
+            segment = {
+                "text": chunk_text(out),
+                "start": round(vad_segments[idx]["start"], 3),
+                "end": round(vad_segments[idx]["end"], 3),
+            }
+            segments.append(segment)
+            if on_segment:
+                on_segment(segment)
+            if on_progress:
+                on_progress(vad_segments[idx]["end"])
+
+    return {"segments": segments, "language": language}
+
+
+def align_with_progress(
+    segments: List[Dict[str, Any]], model_a, metadata, audio, device: str,
+    on_progress: ProgressCallback = None, group_size: int = Config.ALIGN_PROGRESS_GROUP_SIZE
+) -> Dict[str, Any]:
+    """Align segments in groups, reporting the end time of each aligned group"""
+    aligned_segments = []
+    word_segments = []
+    for i in range(0, len(segments), group_size):
+        group = segments[i:i + group_size]
+        aligned = whisperx.align(group, model_a, metadata, audio, device)
+        aligned_segments.extend(aligned["segments"])
+        word_segments.extend(aligned.get("word_segments", []))
+        if on_progress:
+            on_progress(group[-1]["end"])
+    return {"segments": aligned_segments, "word_segments": word_segments}